@@ -0,0 +1,274 @@
+"""
+地震発生時の安否確認アラートの配信パイプライン
+
+1. 震源地の近くのユーザーをジオハッシュの範囲クエリで読み込み、risk_engine でローカルに一括判定する（ChatGPTは使わない）
+2. ユーザーごとの配信タスクを earthquake_alerts/{earthquake_id}/deliveries/{user_id} にバッチで登録する
+3. ワーカープールがタスクをチャンク単位で取り出して sink に送り、配信状態をバッチで記録する
+
+sink は send(alert) を持つオブジェクトで、失敗時は例外を送出する。テストでは LocalSink を使う。
+バックグラウンドのスレッドはレスポンスを返した後に止まりうるため、pending のまま残ったタスクは
+resume で配信し直す。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from risk_engine import assess_population, build_population_arrays
+from risk_scoring import INTENSITY_SCALE, parse_intensity, score_user, unconfirmed_level
+from safety_logs import get_users_with_latest_status
+from user_locations import find_users_near_earthquake
+
+EARTHQUAKE_ALERTS_COLLECTION = 'earthquake_alerts'
+DELIVERIES_SUBCOLLECTION = 'deliveries'
+
+# この危険度レベル以上のユーザーにアラートを送る
+ALERT_MIN_LEVEL = 2
+
+# 未回答のユーザーが ALERT_MIN_LEVEL になる最小の推定震度（これが届かない範囲のユーザーは読み込まない）
+ALERT_MIN_INTENSITY = min(
+    intensity for intensity in range(len(INTENSITY_SCALE)) if unconfirmed_level(intensity) >= ALERT_MIN_LEVEL
+)
+
+# Firestoreの1バッチ500書き込み制限
+MAX_WRITES_PER_BATCH = 500
+
+DEFAULT_WORKERS = 16
+DELIVERY_CHUNK_SIZE = 100
+MAX_DELIVERY_ATTEMPTS = 3
+
+STATE_PENDING = 'pending'
+STATE_DELIVERED = 'delivered'
+STATE_FAILED = 'failed'
+
+# resume はこれより前に登録・更新された pending のタスクだけを配信する（実行中の配信との重複を避ける）
+RESUME_MIN_AGE = timedelta(minutes=1)
+
+
+class LocalSink:
+    """
+    送信したアラートをメモリ上に保持するだけの sink（テスト・ローカル確認用）
+    """
+
+    def __init__(self, fail_user_ids=()):
+        self.sent = []
+        self._fail_user_ids = set(fail_user_ids)
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        if alert['user_id'] in self._fail_user_ids:
+            raise RuntimeError(f"delivery refused for {alert['user_id']}")
+        with self._lock:
+            self.sent.append(alert)
+
+
+class LogSink:
+    """
+    アラートをログに出力する sink（通知基盤が無い環境の既定値）
+    """
+
+    def send(self, alert):
+        print(f"Alert for {alert['user_id']}: {alert['message']}")
+
+
+def _deliveries(db, earthquake_id):
+    return (
+        db.collection(EARTHQUAKE_ALERTS_COLLECTION)
+        .document(earthquake_id)
+        .collection(DELIVERIES_SUBCOLLECTION)
+    )
+
+
+def _commit_in_batches(db, writes):
+    # writes: list of (document_ref, data, merge)
+    for start in range(0, len(writes), MAX_WRITES_PER_BATCH):
+        batch = db.batch()
+        for document_ref, data, merge in writes[start:start + MAX_WRITES_PER_BATCH]:
+            batch.set(document_ref, data, merge=merge)
+        batch.commit()
+
+
+def _unlocated_level(earthquake_info, user):
+    # Without a position the user might be at the epicenter; only a later safe report rules them out
+    score = score_user(earthquake_info, user)
+    if score is not None:
+        return score[1]
+    max_intensity = parse_intensity(earthquake_info.get('intensity'))
+    return ALERT_MIN_LEVEL if max_intensity is None else max(unconfirmed_level(max_intensity), ALERT_MIN_LEVEL)
+
+
+def select_affected_users(earthquake_info, users):
+    """
+    危険度レベルが ALERT_MIN_LEVEL 以上のユーザーを [{"id", "status"}] 形式で返す
+
+    住所の位置を推定できないユーザーは、地震後に安全と報告済みでなければ最大震度の地点にいるものとして扱う。
+    """
+    user_ids, lats, lons, status_codes, same_municipality, uncertainties, unlocated = build_population_arrays(
+        earthquake_info, users
+    )
+    affected = [
+        assessment
+        for assessment in assess_population(
+            earthquake_info, user_ids, lats, lons, status_codes, same_municipality, uncertainties
+        )
+        if assessment['status'] >= ALERT_MIN_LEVEL
+    ]
+    if unlocated:
+        print(f"住所の位置を推定できない{len(unlocated)}人は最大震度で判定します")
+    for user in unlocated:
+        level = _unlocated_level(earthquake_info, user)
+        if level >= ALERT_MIN_LEVEL:
+            affected.append({'id': user.get('id', user.get('name')), 'status': level})
+    return affected
+
+
+def build_alert(earthquake_info, assessment):
+    return {
+        'earthquake_id': earthquake_info['id'],
+        'user_id': assessment['id'],
+        'level': assessment['status'],
+        'message': (
+            f"{earthquake_info.get('epicenter')}で{earthquake_info.get('intensity')}の地震が発生しました。"
+            "安否情報を登録してください。"
+        ),
+    }
+
+
+class AlertPipeline:
+    """
+    影響ユーザーの選定・配信タスクの登録・ワーカープールでの配信を行う
+    """
+
+    def __init__(self, db, sink=None, max_workers=DEFAULT_WORKERS, chunk_size=DELIVERY_CHUNK_SIZE):
+        self._db = db
+        self._sink = sink if sink is not None else LogSink()
+        self._max_workers = max_workers
+        self._chunk_size = chunk_size
+
+    def enqueue(self, earthquake_info, assessments):
+        """
+        ユーザーごとの配信タスクを pending 状態でバッチ登録し、配信するアラートのリストを返す
+
+        同じ地震で配信済みのユーザーは登録し直さない（パイプラインを再実行しても二重に送らない）。
+        """
+        deliveries = _deliveries(self._db, earthquake_info['id'])
+        alerts = [build_alert(earthquake_info, assessment) for assessment in assessments]
+        references = [deliveries.document(alert['user_id']) for alert in alerts]
+        delivered = {
+            snapshot.id
+            for snapshot in self._db.get_all(references, field_paths=['state'])
+            if snapshot.exists and snapshot.get('state') == STATE_DELIVERED
+        }
+        alerts = [alert for alert in alerts if alert['user_id'] not in delivered]
+        now = datetime.now(timezone.utc)
+        _commit_in_batches(self._db, [
+            (
+                deliveries.document(alert['user_id']),
+                {**alert, 'state': STATE_PENDING, 'attempts': 0, 'error': None, 'updated_at': now},
+                True,
+            )
+            for alert in alerts
+        ])
+        return alerts
+
+    def _deliver_chunk(self, earthquake_id, alerts):
+        results = []
+        for alert in alerts:
+            error = None
+            for attempt in range(1, MAX_DELIVERY_ATTEMPTS + 1):
+                try:
+                    self._sink.send(alert)
+                    error = None
+                    break
+                except Exception as e:
+                    error = str(e)
+            results.append((alert['user_id'], attempt, error))
+
+        # One batch per chunk records the outcome of every alert in it
+        deliveries = _deliveries(self._db, earthquake_id)
+        now = datetime.now(timezone.utc)
+        _commit_in_batches(self._db, [
+            (
+                deliveries.document(user_id),
+                {
+                    'state': STATE_FAILED if error else STATE_DELIVERED,
+                    'attempts': attempts,
+                    'error': error,
+                    'updated_at': now,
+                },
+                True,
+            )
+            for user_id, attempts, error in results
+        ])
+        return sum(1 for _, _, error in results if error is None)
+
+    def drain(self, earthquake_id, alerts):
+        """
+        アラートを chunk_size 件ずつワーカープールで配信し、{"delivered", "failed"} の件数を返す
+        """
+        chunks = [
+            alerts[start:start + self._chunk_size]
+            for start in range(0, len(alerts), self._chunk_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            delivered = sum(executor.map(lambda chunk: self._deliver_chunk(earthquake_id, chunk), chunks))
+        return {'delivered': delivered, 'failed': len(alerts) - delivered}
+
+    def resume(self, earthquake_id, min_age=RESUME_MIN_AGE):
+        """
+        pending のまま残った配信タスクを配信し直し、{"delivered", "failed"} の件数を返す
+
+        min_age より新しいタスクは実行中の配信が処理しているものとして飛ばす。
+        """
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        cutoff = datetime.now(timezone.utc) - min_age
+        query = _deliveries(self._db, earthquake_id).where(filter=FieldFilter('state', '==', STATE_PENDING))
+        alerts = []
+        for snapshot in query.stream():
+            delivery = snapshot.to_dict()
+            updated_at = delivery.get('updated_at')
+            if updated_at is not None and updated_at > cutoff:
+                continue
+            alerts.append({key: delivery.get(key) for key in ('earthquake_id', 'user_id', 'level', 'message')})
+        return self.drain(earthquake_id, alerts)
+
+    def run(self, earthquake_info, users=None):
+        """
+        1件の地震についてパイプライン全体を実行する（users を省略すると Firestore から読み込む）
+
+        Firestore からは震源地の近くのユーザーだけを読み込む。範囲で絞り込めない場合は全ユーザーを読み込む。
+        """
+        if users is None:
+            users = find_users_near_earthquake(self._db, earthquake_info, ALERT_MIN_INTENSITY)
+        if users is None:
+            users = get_users_with_latest_status(self._db)
+        assessments = select_affected_users(earthquake_info, users)
+        alerts = self.enqueue(earthquake_info, assessments)
+        result = self.drain(earthquake_info['id'], alerts)
+        print(f"地震 {earthquake_info['id']}: {len(alerts)}件のアラートを配信しました {result}")
+        return result
+
+    def start(self, earthquake_info, users=None):
+        """
+        run をバックグラウンドのスレッドで実行する（リクエストの処理を待たせない）
+        """
+        def run_safely():
+            try:
+                self.run(earthquake_info, users)
+            except Exception as e:
+                print(f"Error in alert pipeline for {earthquake_info.get('id')}: {str(e)}")
+
+        thread = threading.Thread(target=run_safely, name=f"alert-pipeline-{earthquake_info['id']}", daemon=True)
+        thread.start()
+        return thread
+
+
+def get_delivery_summary(db, earthquake_id):
+    """
+    配信状態ごとの件数を {"pending", "delivered", "failed"} の辞書で返す
+    """
+    summary = {STATE_PENDING: 0, STATE_DELIVERED: 0, STATE_FAILED: 0}
+    for snapshot in _deliveries(db, earthquake_id).select(['state']).stream():
+        state = snapshot.get('state')
+        summary[state] = summary.get(state, 0) + 1
+    return summary
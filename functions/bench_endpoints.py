@@ -0,0 +1,144 @@
+"""
+Flaskの各ルートのベンチマーク
+
+インメモリFirestore（fake_firestore）に生成データを読み込み、main.app のテストクライアントで
+各ルートを繰り返し呼び出して、p50 / p95 / p99 レイテンシ・スループット・ピークメモリ・
+応答サイズ（ブラウザと同じく gzip / br を受け付けた場合の転送量）を表示する。
+ChatGPTを使うルートはローカルのスタブサーバーに接続する。
+
+使い方: python bench_endpoints.py [ユーザー数] [安否ログ数] [つながり数] [反復回数]
+"""
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import firebase_client
+from fake_firestore import FakeFirestore
+from generate_bench_data import generate_dataset, load_dataset
+from stub_openai_server import StubOpenAIHandler, start_stub_server
+
+DEFAULT_ITERATIONS = 200
+WARMUP_ITERATIONS = 3
+# tracemalloc は処理を遅くするため、ピークメモリは別に少ない回数で計測する
+MEMORY_ITERATIONS = 3
+BATCH_REPORT_COUNT = 100
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def build_routes(dataset, earthquake_id):
+    """
+    (名前, メソッド, パス, JSONボディ) のリスト
+    """
+    user_id = dataset['users'][0]['id']
+    batch_reports = [
+        {'user_id': user['id'], 'status': 'SAFE', 'location': user['address']}
+        for user in dataset['users'][:BATCH_REPORT_COUNT]
+    ]
+    return [
+        ('home', 'GET', '/', None),
+        ('users', 'GET', '/users', None),
+        ('earthquakes', 'GET', '/earthquakes', None),
+        ('safetyCheck', 'GET', '/safetyCheck', None),
+        ('safetyCheck limit=500', 'GET', '/safetyCheck?limit=500', None),
+        ('safetyCheck ndjson', 'GET', '/safetyCheck?format=ndjson&limit=500', None),
+        ('safetyCheck/latest', 'GET', '/safetyCheck/latest', None),
+        ('safetyCheck/summary', 'GET', '/safetyCheck/summary', None),
+        ('network-status depth=2', 'GET', f'/users/{user_id}/network-status?depth=2', None),
+        ('risk (cached)', 'GET', f'/risk/{earthquake_id}', None),
+        ('safetyPost', 'POST', '/safetyPost', {'status': 'SAFE'}),
+        (f'safetyPost/batch x{BATCH_REPORT_COUNT}', 'POST', '/safetyPost/batch', batch_reports),
+    ]
+
+
+def run_route(client, method, path, body, iterations):
+    sizes = []
+
+    def call():
+        response = client.open(path, method=method, json=body, headers={'Accept-Encoding': ACCEPT_ENCODING})
+        # Streamed bodies are only produced while being read
+        sizes.append(len(response.get_data()))
+        response.close()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    for _ in range(WARMUP_ITERATIONS):
+        call()
+
+    latencies = []
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        call_started_at = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_started_at)
+    elapsed = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    try:
+        for _ in range(MEMORY_ITERATIONS):
+            call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'throughput_rps': iterations / elapsed,
+        'peak_memory_kib': peak / 1024,
+        'response_kib': statistics.median(sizes) / 1024,
+    }
+
+
+def main(user_count, log_count, connection_count, iterations):
+    db = FakeFirestore()
+    firebase_client.use_client(db)
+
+    with open('mocks/earth_quake.json', 'r', encoding='utf-8') as f:
+        earthquakes = json.load(f)
+    dataset = generate_dataset(user_count, log_count, connection_count)
+    started_at = time.perf_counter()
+    load_dataset(db, dataset, earthquakes)
+    print(f"データ投入: ユーザー{user_count:,}人・安否ログ{log_count:,}件・つながり{connection_count:,}件 "
+          f"({time.perf_counter() - started_at:.1f}秒)")
+
+    server, base_url = start_stub_server(port=0)
+    StubOpenAIHandler.base_latency = 0.0
+    StubOpenAIHandler.per_user_latency = 0.0
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    os.environ['OPENAI_BASE_URL'] = base_url
+
+    import main as app_module
+    client = app_module.app.test_client()
+
+    print(f"{'ルート':<28}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>10}{'peak':>11}{'size':>11}")
+    try:
+        for name, method, path, body in build_routes(dataset, earthquakes[0]['id']):
+            result = run_route(client, method, path, body, iterations)
+            print(
+                f"{name:<28}"
+                f"{result['p50_ms']:8.2f}ms{result['p95_ms']:7.2f}ms{result['p99_ms']:7.2f}ms"
+                f"{result['throughput_rps']:10.1f}{result['peak_memory_kib']:8.0f}KiB"
+                f"{result['response_kib']:8.1f}KiB"
+            )
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    log_count = int(sys.argv[2]) if len(sys.argv) > 2 else user_count * 3
+    connection_count = int(sys.argv[3]) if len(sys.argv) > 3 else user_count * 5
+    iterations = int(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_ITERATIONS
+    sys.exit(main(user_count, log_count, connection_count, iterations))
@@ -0,0 +1,95 @@
+"""
+main.py のコールドスタート（import から最初の応答まで）を計測し、回帰を検出する
+
+python -X importtime で import main を別プロセスで実行して時間のかかるモジュールを表示し、
+最初の応答までの時間が上限を超えるか、遅延読み込みにしているモジュールが読み込まれていれば終了コード1で終了する。
+Firestore・OpenAI への接続は行わない。
+
+使い方: python bench_import_time.py [上限秒数] [試行回数]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MAX_SECONDS = 1.5
+DEFAULT_RUNS = 5
+TOP_MODULES = 15
+
+# import main の時点では読み込まれてはいけない（最初に使うルートで読み込む）モジュール
+DEFERRED_MODULES = ['openai', 'numpy', 'google.cloud.firestore']
+
+FUNCTIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_COLD_START_SCRIPT = """
+import sys, time
+started_at = time.perf_counter()
+import main
+imported_at = time.perf_counter()
+main.app.test_client().get('/')
+responded_at = time.perf_counter()
+print(imported_at - started_at, responded_at - started_at)
+print(','.join(name for name in {deferred!r} if name in sys.modules))
+"""
+
+
+def _run_python(args):
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=FUNCTIONS_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def measure_cold_start():
+    """
+    新しいプロセスで (import 秒数, 最初の応答までの秒数, 読み込まれた遅延モジュール) を計測する
+    """
+    result = _run_python(['-c', _COLD_START_SCRIPT.format(deferred=DEFERRED_MODULES)])
+    timings, loaded = result.stdout.splitlines()[-2:]
+    import_seconds, first_response_seconds = map(float, timings.split())
+    return import_seconds, first_response_seconds, [name for name in loaded.split(',') if name]
+
+
+def slowest_imports(limit=TOP_MODULES):
+    """
+    -X importtime の出力から、自身の読み込み時間が長いモジュールを [(秒数, 累計秒数, 名前)] で返す
+    """
+    result = _run_python(['-X', 'importtime', '-c', 'import main'])
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((int(self_us) / 1e6, int(cumulative_us) / 1e6, name.strip()))
+    return sorted(modules, reverse=True)[:limit]
+
+
+def main(max_seconds, runs):
+    for self_seconds, cumulative_seconds, name in slowest_imports():
+        print(f"{self_seconds * 1000:8.1f}ms (累計 {cumulative_seconds * 1000:8.1f}ms)  {name}")
+
+    measurements = [measure_cold_start() for _ in range(runs)]
+    import_seconds = statistics.median(m[0] for m in measurements)
+    first_response_seconds = statistics.median(m[1] for m in measurements)
+    loaded = sorted({name for m in measurements for name in m[2]})
+
+    print(f"import main:        {import_seconds:.3f}秒（{runs}回の中央値）")
+    print(f"最初の応答まで:     {first_response_seconds:.3f}秒（上限 {max_seconds:.3f}秒）")
+
+    failed = False
+    if loaded:
+        print(f"遅延読み込みのはずのモジュールが読み込まれています: {', '.join(loaded)}")
+        failed = True
+    if first_response_seconds > max_seconds:
+        print("最初の応答までの時間が上限を超えています")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    max_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MAX_SECONDS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_RUNS
+    sys.exit(main(max_seconds, runs))
@@ -0,0 +1,70 @@
+"""
+ChatGPT連携の逐次実行と並行シャード実行の所要時間を、ローカルのスタブサーバーで比較する
+
+使い方: python bench_llm_sharding.py [ユーザー数] [シャードサイズ] [同時実行数]
+"""
+import os
+import sys
+import time
+
+from chatgpt import consult_chatgpt, consult_chatgpt_sharded
+from stub_openai_server import StubOpenAIHandler, start_stub_server
+
+EARTHQUAKE = {
+    "id": "EQ201102",
+    "time": "2011-03-11 14:46:23",
+    "epicenter": "宮城県牡鹿郡沖",
+    "intensity": "震度7",
+    "magnitude": 9.0
+}
+
+
+def generate_ambiguous_users(count):
+    # Addresses the geocoder cannot resolve, so local pre-scoring sends every user to the model
+    return [
+        {
+            "id": f"USR{i:06d}",
+            "name": f"テスト ユーザー{i}",
+            "address": f"所在地不明{i}",
+            "safety_history": []
+        }
+        for i in range(count)
+    ]
+
+
+def main(user_count, shard_size, max_concurrency):
+    server, base_url = start_stub_server(port=0)
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["OPENAI_BASE_URL"] = base_url
+    users = generate_ambiguous_users(user_count)
+
+    try:
+        started_at = time.perf_counter()
+        sequential = consult_chatgpt(EARTHQUAKE, users)
+        sequential_time = time.perf_counter() - started_at
+
+        # The first shard request fails once to exercise the retry path
+        StubOpenAIHandler.fail_first = StubOpenAIHandler.request_count + 1
+        started_at = time.perf_counter()
+        sharded = consult_chatgpt_sharded(
+            EARTHQUAKE,
+            users,
+            shard_size=shard_size,
+            max_concurrency=max_concurrency,
+            base_url=base_url
+        )
+        sharded_time = time.perf_counter() - started_at
+    finally:
+        server.shutdown()
+
+    assert sorted(r["id"] for r in sequential) == sorted(r["id"] for r in sharded)
+    print(f"ユーザー数: {user_count}, シャードサイズ: {shard_size}, 同時実行数: {max_concurrency}")
+    print(f"一括問い合わせ:   {sequential_time:6.2f}秒")
+    print(f"並行シャード実行: {sharded_time:6.2f}秒（再試行を含む）")
+    print(f"高速化: {sequential_time / sharded_time:.1f}倍")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    defaults = [400, 50, 8]
+    main(*(args + defaults[len(args):]))
@@ -0,0 +1,68 @@
+"""
+リスクエンジンのベンチマーク
+
+日本全域にランダムに分布したユーザーを生成し、compute_levels / assess_population の処理時間を計測する。
+使い方: python bench_risk_engine.py [ユーザー数]
+"""
+import sys
+import time
+
+import numpy as np
+
+from risk_engine import STATUS_DANGER, STATUS_SAFE, STATUS_UNCONFIRMED, assess_population, compute_levels
+
+# 1Mユーザーの一括評価にかけてよい時間（秒）
+TIME_BUDGET_SECONDS = 1.0
+
+EARTHQUAKE = {
+    "id": "EQ201102",
+    "time": "2011-03-11 14:46:23",
+    "epicenter": "宮城県牡鹿郡沖",
+    "intensity": "震度7",
+    "magnitude": 9.0
+}
+
+
+def generate_population(size, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(31.0, 43.5, size)
+    lons = rng.uniform(129.5, 145.5, size)
+    status_codes = rng.choice(
+        [STATUS_UNCONFIRMED, STATUS_SAFE, STATUS_DANGER],
+        size=size,
+        p=[0.6, 0.3, 0.1]
+    ).astype(np.int8)
+    user_ids = [f"USR{i:08d}" for i in range(size)]
+    return user_ids, lats, lons, status_codes
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings), result
+
+
+def main(size):
+    user_ids, lats, lons, status_codes = generate_population(size)
+    compute_levels(EARTHQUAKE, lats[:10], lons[:10], status_codes[:10])  # warm up geocoder
+
+    levels_time, levels = best_of(lambda: compute_levels(EARTHQUAKE, lats, lons, status_codes))
+    assess_time, flagged = best_of(lambda: assess_population(EARTHQUAKE, user_ids, lats, lons, status_codes))
+
+    print(f"ユーザー数: {size:,}")
+    print(f"compute_levels:    {levels_time * 1000:8.1f} ms ({size / levels_time:,.0f}件/秒)")
+    print(f"assess_population: {assess_time * 1000:8.1f} ms (レベル2以上: {len(flagged):,}件)")
+    print("レベル分布:", {int(level): int(count) for level, count in zip(*np.unique(levels, return_counts=True))})
+
+    if assess_time > TIME_BUDGET_SECONDS * size / 1_000_000:
+        print(f"NG: 予算 {TIME_BUDGET_SECONDS}秒/100万件 を超えました")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
@@ -2,9 +2,34 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
 import json
-from openai import OpenAI
-from typing import Optional
+import random
+import threading
+from typing import Iterator, Optional
+
+from instrumentation import phase, record_openai_usage
+from json_stream import JSONArrayParser
+from prompt_encoding import (
+    DEFAULT_PROMPT_TOKEN_BUDGET,
+    count_tokens,
+    encode_earthquake,
+    encode_user_rows,
+    split_by_token_budget,
+)
+from risk_scoring import prescore_users
+
+# 並行評価の既定値
+DEFAULT_SHARD_SIZE = 50
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+RETRY_BASE_DELAY_SECONDS = 0.5
+
+_client = None
+_client_lock = threading.Lock()
+
+# プロバイダー側のプロンプトキャッシュを同じサーバーに振り分けるためのキー
+PROMPT_CACHE_KEY = "earthquake-risk-assessment"
 
 system_prompt = """
 # 地震発生時の危険度評価プロンプト
@@ -66,83 +91,228 @@ system_prompt = """
 
 
 # 入力データ形式
-## アカウント情報
+## 地震情報
+{"time":"YYYY-MM-DD HH:MM:SS","epicenter":"震源地","intensity":"震度（最大）","magnitude":0.0}
 
-[
-    {
-        "name": "アカウント名",
-        "address": "現在住所",
-        "safety_history": [
-            {
-                "timestamp": "YYYY-MM-DD HH:MM:SS",
-                "status": "安全/危険",
-                "location": "現在地"
-            }
-        ]
-    }
-]
+## アカウント情報
+1行目は列名、2行目以降は1アカウント1行のJSON配列です。安否情報は最新の1件のみで、未報告の場合は null です。
 
-## 地震情報
-{
-    "time": "YYYY-MM-DD HH:MM:SS",
-    "epicenter": "震源地",
-    "intensity": "震度（最大）",
-    "magnitude": 0.0
-}
+["id","address","timestamp","status","location"]
+["アカウント名","現在住所","YYYY-MM-DD HH:MM:SS","安全/危険","現在地"]
 
 以上の情報を分析し、危険度レベル2以上のユーザーのIDと危険度を指定されたJSON形式で出力してください。分析情報や解説は含めないでください。
 
 """
 
+USER_PROMPT_HEADER = "以下の地震情報とアカウント情報を分析し、危険な状態にあるユーザーを特定して危険度を評価してください。\n\n## 地震情報\n"
+
+
+def build_user_prompt(earthquake_info: dict, user_rows: list[str]) -> str:
+    # Everything before the account rows is identical across requests for the same earthquake,
+    # so the provider's prompt cache covers the system prompt and this header
+    return f"{USER_PROMPT_HEADER}{encode_earthquake(earthquake_info)}\n\n## アカウント情報\n{encode_user_rows(user_rows)}\n"
+
+
+def build_messages(earthquake_info: dict, user_rows: list[str]) -> list[dict]:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": build_user_prompt(earthquake_info, user_rows)}
+    ]
+
+
+def build_request_messages(
+    earthquake_info: dict,
+    users_info: list[dict],
+    token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET,
+    max_users: Optional[int] = None,
+    model: str = "gpt-4o",
+) -> list[list[dict]]:
+    """
+    入力トークン数が token_budget 以内に収まるようにユーザーを分割し、問い合わせごとのメッセージを返す
+    """
+    fixed_tokens = count_tokens(system_prompt, model) + count_tokens(build_user_prompt(earthquake_info, []), model)
+    groups = split_by_token_budget(users_info, fixed_tokens, budget=token_budget, max_users=max_users, model=model)
+    return [build_messages(earthquake_info, user_rows) for _, user_rows in groups]
+
+
+def get_openai_client():
+    """
+    OpenAIクライアントを返す（初回呼び出し時に作成し、以降は接続を再利用する）
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not os.getenv("OPENAI_API_KEY"):
+                    raise Exception("OPENAI_API_KEYが設定されていません。")
+                # Imported on first use: the SDK dominates this module's import time
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
 def consult_chatgpt(
     earthquake_info: dict,
     users: list[dict],
     temperature: float = 0.7,
     max_tokens: Optional[int] = None,
     model: str = "gpt-4o",
+    token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET,
 ) -> list[dict]:
     try:
-        users_info = []
-        for user in users:
-            status = user["safety_history"][-1]
-            if status["timestamp"] > earthquake_info["time"]:
-                if status["status"] == "安全":
+        # 距離帯と安否情報から危険度が確定するユーザーはローカルで判定し、
+        # 判定できなかったユーザーだけをChatGPTに送る
+        decided, users_info = prescore_users(earthquake_info, users)
+        if not users_info:
+            return decided
+
+        # OpenAI APIクライアントの取得（初回のみ作成）
+        client = get_openai_client()
+
+        # ChatGPTにリクエストを送信（トークン数の上限を超える場合は分割して順に送信）
+        results = list(decided)
+        for messages in build_request_messages(earthquake_info, users_info, token_budget, model=model):
+            with phase("openai"):
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    prompt_cache_key=PROMPT_CACHE_KEY
+                )
+            record_openai_usage(response.usage)
+
+            # 応答を取得
+            results.extend(json.loads(response.choices[0].message.content))
+        return results
+
+    except Exception as e:
+        raise Exception(f"ChatGPTとの通信中にエラーが発生しました: {str(e)}")
+
+
+def consult_chatgpt_stream(
+    earthquake_info: dict,
+    users: list[dict],
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    model: str = "gpt-4o",
+    token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET,
+) -> Iterator[dict]:
+    """
+    consult_chatgpt のストリーミング版。評価結果を1件ずつ返すジェネレーター
+
+    ローカルで判定できたユーザーを危険度の高い順に先に返し、その後ChatGPTの応答を
+    stream=True で受け取りながら、JSON配列の要素が閉じた時点で1件ずつ返す。
+    """
+    try:
+        decided, users_info = prescore_users(earthquake_info, users)
+        yield from sorted(decided, key=lambda assessment: assessment["status"], reverse=True)
+        if not users_info:
+            return
+
+        client = get_openai_client()
+
+        for messages in build_request_messages(earthquake_info, users_info, token_budget, model=model):
+            stream = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                prompt_cache_key=PROMPT_CACHE_KEY,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+            # The model sometimes wraps the array in a code fence; skip anything before "["
+            parser = JSONArrayParser(skip_preamble=True)
+            usage = None
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
                     continue
-            users_info.append(user)
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield from parser.feed(content)
+            parser.close()
+            record_openai_usage(usage)
 
-        user_prompt = f"""
-        以下の地震情報とアカウント情報を分析し、危険な状態にあるユーザーを特定して危険度を評価してください。
+    except Exception as e:
+        raise Exception(f"ChatGPTとの通信中にエラーが発生しました: {str(e)}")
 
-        ## 地震情報
-        {json.dumps(earthquake_info)}
 
-        ## アカウント情報
-        {json.dumps(users)}
-        """
+async def consult_chatgpt_async(
+    earthquake_info: dict,
+    users: list[dict],
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    model: str = "gpt-4o",
+    base_url: Optional[str] = None,
+    token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET,
+) -> list[dict]:
+    """
+    ユーザーを shard_size 人（入力 token_budget トークン）以内のグループに分け、最大 max_concurrency 件まで並行してChatGPTに問い合わせる
 
-        # OpenAI APIクライアントの初期化
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    失敗したグループは指数バックオフで max_retries 回まで再試行し、各グループのJSON配列を結合して返す。
+    base_url を指定するとOpenAI互換のローカルスタブサーバーに接続できる。
+    """
+    try:
+        decided, users_info = prescore_users(earthquake_info, users)
+        if not users_info:
+            return decided
 
         if not os.getenv("OPENAI_API_KEY"):
             raise Exception("OPENAI_API_KEYが設定されていません。")
 
-        # ChatGPTにリクエストを送信
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        from openai import AsyncOpenAI
+
+        # Retries are handled per shard below, so the client itself does not retry
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url, max_retries=0)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def evaluate_shard(messages: list[dict]) -> list[dict]:
+            async with semaphore:
+                for attempt in range(max_retries + 1):
+                    try:
+                        response = await client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            prompt_cache_key=PROMPT_CACHE_KEY
+                        )
+                        record_openai_usage(response.usage)
+                        return json.loads(response.choices[0].message.content)
+                    except Exception as e:
+                        if attempt == max_retries:
+                            raise
+                        delay = RETRY_BASE_DELAY_SECONDS * (2 ** attempt) * (1 + random.random())
+                        print(f"ChatGPTへの問い合わせに失敗しました（{attempt + 1}回目）。{delay:.1f}秒後に再試行します: {str(e)}")
+                        await asyncio.sleep(delay)
 
-        # 応答を取得
-        return json.loads(response.choices[0].message.content)
+        shards = build_request_messages(earthquake_info, users_info, token_budget, max_users=shard_size, model=model)
+        try:
+            # Shards overlap, so the phase covers the whole fan-out rather than each call
+            with phase("openai"):
+                results = await asyncio.gather(*(evaluate_shard(shard) for shard in shards))
+        finally:
+            await client.close()
+
+        return decided + [assessment for result in results for assessment in result]
 
     except Exception as e:
         raise Exception(f"ChatGPTとの通信中にエラーが発生しました: {str(e)}")
 
+
+def consult_chatgpt_sharded(earthquake_info: dict, users: list[dict], **kwargs) -> list[dict]:
+    """
+    consult_chatgpt_async の同期版（Flaskのルートなど、イベントループの外から呼び出す場合に使用）
+    """
+    return asyncio.run(consult_chatgpt_async(earthquake_info, users, **kwargs))
+
 # 使用例
 if __name__ == "__main__":
     response = consult_chatgpt(
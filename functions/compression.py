@@ -0,0 +1,84 @@
+"""
+レスポンスボディの圧縮（Accept-Encoding に応じて br / gzip）
+
+init_app(app) で after_request を登録し、COMPRESS_MIN_SIZE バイト以上のJSON・テキストのレスポンスを圧縮する。
+ストリーミング応答（NDJSON・SSE）は逐次送信のため圧縮しない。304 などボディの無いレスポンスもそのまま返す。
+brotli はインストールされている場合のみ使う。
+"""
+import gzip
+
+from flask import request
+
+import instrumentation
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# これより小さいボディは圧縮しない（ヘッダーと圧縮時間に見合わない）
+COMPRESS_MIN_SIZE = 1024
+
+# 応答のたびに圧縮するため、圧縮率より速度を優先したレベル
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv'}
+
+
+def choose_encoding(accept_encodings):
+    """
+    クライアントが受け付ける圧縮方式のうち使うものを返す（'br' / 'gzip' / None）
+    """
+    br_quality = accept_encodings.quality('br') if brotli is not None else 0
+    gzip_quality = accept_encodings.quality('gzip')
+    if br_quality and br_quality >= gzip_quality:
+        return 'br'
+    if gzip_quality:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _should_compress(response, min_size):
+    if response.is_streamed or response.direct_passthrough:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return False
+    return response.content_length is not None and response.content_length >= min_size
+
+
+def init_app(app, min_size=COMPRESS_MIN_SIZE):
+    """
+    app に圧縮用のフックを登録する（instrumentation.init_app の後に呼ぶと圧縮時間も計測される）
+    """
+
+    def _after_request(response):
+        if not _should_compress(response, min_size):
+            return response
+        # The body depends on Accept-Encoding even when it ends up uncompressed
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        with instrumentation.phase('compress'):
+            response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+
+        # The compressed bytes differ from the ones a strong ETag names; a weak ETag still matches If-None-Match
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    app.after_request(_after_request)
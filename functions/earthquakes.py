@@ -1,12 +1,11 @@
-import json
 from json import JSONDecodeError
 from flask import jsonify
 
+from static_data import earthquakes_resource
+
 def get_earthquakes_mock():
     try:
-        with open('mocks/earth_quake.json', 'r') as f:
-            earthquake_data = json.load(f)
-            return jsonify(earthquake_data=earthquake_data)
+        return earthquakes_resource.response()
     except FileNotFoundError:
         return jsonify(error='Earthquake data not found'), 404
     except JSONDecodeError:
@@ -0,0 +1,394 @@
+"""
+ベンチマーク・テスト用のインメモリFirestore
+
+このアプリが使う範囲（コレクション・サブコレクション、add / set / update / delete、
+where / order_by / limit / start_after / select / count、get_all、バッチ、トランザクション、on_snapshot）だけを実装する。
+on_snapshot は where の条件だけを見て変更を通知する（order_by / limit は無視する）。
+
+使い方:
+    db = FakeFirestore()
+    firebase_client.use_client(db)   # main.db を含むすべての LazyFirestoreClient に反映される
+"""
+import copy
+import enum
+import operator
+import queue
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+
+_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, options: value in options,
+    'not-in': lambda value, options: value not in options,
+    'array_contains': lambda value, item: isinstance(value, list) and item in value,
+}
+
+
+def _order_key(value):
+    # Firestore orders values of different types by type first (null, bool, number, timestamp, string)
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        # Comparing aware datetimes is slow; their epoch seconds order the same way
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def _compare(compare, value, operand):
+    # Range and equality filters only match values of the same type, as on the server
+    try:
+        return compare(value, operand)
+    except TypeError:
+        return False
+
+
+def _resolve(current, value):
+    # Apply write sentinels the way the server would
+    if value is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) else 0
+        return base + value.value
+    if isinstance(value, dict):
+        merged = dict(current) if isinstance(current, dict) else {}
+        for key, item in value.items():
+            merged[key] = _resolve(merged.get(key), item)
+        return merged
+    return copy.deepcopy(value)
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentChange:
+    def __init__(self, change_type, document):
+        self.type = change_type
+        self.document = document
+
+
+class Watch:
+    """
+    on_snapshot の購読（コールバックは Firestore と同じく専用のスレッドから呼び出す）
+    """
+
+    def __init__(self, query, callback):
+        self._query = query
+        self._callback = callback
+        self._matching = {}
+        self._pending = queue.Queue()
+        self.is_active = True
+        threading.Thread(target=self._run, name='fake-firestore-watch', daemon=True).start()
+
+    def _changes(self, writes, initial=False):
+        # Called under the database lock, so changes are queued in commit order
+        changes = []
+        for collection_path, document_id, data in writes:
+            if collection_path != self._query._collection_path:
+                continue
+            matches = data is not None and self._query._matches(data)
+            previous = self._matching.get(document_id)
+            if matches:
+                self._matching[document_id] = data
+                change_type = ChangeType.MODIFIED if previous is not None else ChangeType.ADDED
+            elif previous is not None:
+                del self._matching[document_id]
+                change_type, data = ChangeType.REMOVED, previous
+            else:
+                continue
+            reference = DocumentReference(self._query._db, collection_path, document_id)
+            changes.append(DocumentChange(change_type, DocumentSnapshot(reference, data)))
+        # The initial snapshot is delivered even when nothing matches
+        if changes or initial:
+            documents = [
+                DocumentSnapshot(DocumentReference(self._query._db, self._query._collection_path, document_id), data)
+                for document_id, data in self._matching.items()
+            ]
+            self._pending.put((documents, changes))
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None or not self.is_active:
+                return
+            documents, changes = item
+            self._callback(documents, changes, datetime.now(timezone.utc))
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._query._db._remove_watch(self)
+        self._pending.put(None)
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = self._data
+        for part in field_path.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        return copy.deepcopy(value)
+
+
+class DocumentReference:
+    def __init__(self, db, collection_path, document_id):
+        self._db = db
+        self._collection_path = collection_path
+        self.id = document_id
+        self.path = f"{collection_path}/{document_id}"
+
+    def collection(self, name):
+        return CollectionReference(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        return DocumentSnapshot(self, self._db._read(self._collection_path, self.id))
+
+    def set(self, document_data, merge=False):
+        self._db._write([(self, document_data, merge)])
+
+    def update(self, field_updates):
+        if self._db._read(self._collection_path, self.id) is None:
+            raise KeyError(f"No document to update: {self.path}")
+        self._db._write([(self, field_updates, True)])
+
+    def delete(self):
+        self._db._write([(self, None, False)])
+
+
+class Query:
+    def __init__(self, db, collection_path, filters=(), orders=(), limit=None, start_after=None):
+        self._db = db
+        self._collection_path = collection_path
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        query = Query(
+            self._db, self._collection_path, self._filters, self._orders, self._limit, self._start_after
+        )
+        for name, value in changes.items():
+            setattr(query, f"_{name}", value)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, _OPERATORS[op_string], value)])
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + [(field_path, direction == 'DESCENDING')])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_snapshot):
+        return self._copy(start_after=document_snapshot.id)
+
+    def select(self, field_paths):
+        # Every field is returned anyway; projection only saves bandwidth on the real server
+        return self
+
+    def _matches(self, data):
+        for field_path, compare, value in self._filters:
+            if field_path not in data or not _compare(compare, data[field_path], value):
+                return False
+        # Like Firestore, documents missing an ordered field are left out
+        return all(field_path in data for field_path, _ in self._orders)
+
+    def stream(self, transaction=None):
+        documents = [
+            (document_id, data)
+            for document_id, data in self._db._list(self._collection_path)
+            if self._matches(data)
+        ]
+        documents.sort(key=lambda item: item[0])
+        for field_path, descending in reversed(self._orders):
+            documents.sort(key=lambda item: _order_key(item[1][field_path]), reverse=descending)
+
+        if self._start_after is not None:
+            ids = [document_id for document_id, _ in documents]
+            if self._start_after in ids:
+                documents = documents[ids.index(self._start_after) + 1:]
+        if self._limit is not None:
+            documents = documents[:self._limit]
+
+        for document_id, data in documents:
+            yield DocumentSnapshot(DocumentReference(self._db, self._collection_path, document_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return AggregationQuery(self, alias or 'count')
+
+    def on_snapshot(self, callback):
+        return self._db._add_watch(Watch(self, callback))
+
+
+class AggregationQuery:
+    """
+    count() だけに対応した集計クエリ（結果は Firestore と同じく [[AggregationResult]]）
+    """
+
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self, transaction=None):
+        count = sum(1 for _ in self._query.stream())
+        return [[AggregationResult(self._alias, count, datetime.now(timezone.utc))]]
+
+
+class CollectionReference(Query):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._db, self._collection_path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        document_ref = self.document(document_id)
+        document_ref.set(document_data)
+        return datetime.now(timezone.utc), document_ref
+
+
+class WriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append((reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append((reference, field_updates, True))
+
+    def delete(self, reference):
+        self._writes.append((reference, None, False))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        self._db._write(writes)
+        return []
+
+
+class Transaction(WriteBatch):
+    """
+    firestore.transactional から呼び出される最小限のトランザクション
+
+    書き込みは _commit でまとめて反映する（競合の検出と再試行は行わない）。
+    """
+    _max_attempts = 1
+    _read_only = False
+    _id = b'fake-transaction'
+    in_progress = False
+
+    def _clean_up(self):
+        self._writes = []
+
+    def _begin(self, retry_id=None):
+        pass
+
+    def _commit(self):
+        return self.commit()
+
+    def _rollback(self):
+        self._writes = []
+
+    def get_all(self, references):
+        return self._db.get_all(references)
+
+    def get(self, reference_or_query):
+        if isinstance(reference_or_query, DocumentReference):
+            return iter([reference_or_query.get()])
+        return reference_or_query.stream()
+
+
+class FakeFirestore:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._watches = []
+
+    # Stored documents are replaced on every write and never mutated in place,
+    # so readers can share them; DocumentSnapshot.to_dict hands out copies
+
+    def _read(self, collection_path, document_id):
+        with self._lock:
+            return self._collections.get(collection_path, {}).get(document_id)
+
+    def _list(self, collection_path):
+        with self._lock:
+            return list(self._collections.get(collection_path, {}).items())
+
+    def _write(self, writes):
+        # A batch is applied atomically with respect to readers
+        with self._lock:
+            written = []
+            for reference, data, merge in writes:
+                documents = self._collections.setdefault(reference._collection_path, {})
+                if data is None:
+                    documents.pop(reference.id, None)
+                else:
+                    documents[reference.id] = _resolve(documents.get(reference.id) if merge else None, data)
+                written.append((reference._collection_path, reference.id, documents.get(reference.id)))
+            for watch in self._watches:
+                watch._changes(written)
+
+    def _add_watch(self, watch):
+        # The initial snapshot reports every matching document as ADDED
+        with self._lock:
+            self._watches.append(watch)
+            watch._changes([
+                (watch._query._collection_path, document_id, data)
+                for document_id, data in self._collections.get(watch._query._collection_path, {}).items()
+            ], initial=True)
+        return watch
+
+    def _remove_watch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def collection(self, collection_path):
+        return CollectionReference(self, collection_path)
+
+    def document(self, document_path):
+        collection_path, document_id = document_path.rsplit('/', 1)
+        return DocumentReference(self, collection_path, document_id)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        return [reference.get() for reference in references]
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
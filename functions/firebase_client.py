@@ -0,0 +1,68 @@
+"""
+Firebase の遅延初期化
+
+initialize_app と firestore.client() は最初にFirestoreへアクセスした時点で実行する。
+import 時に google.cloud.firestore を読み込まないため、Cloud Functions のコールドスタートが短くなる。
+"""
+import os
+import threading
+
+SERVICE_ACCOUNT_PATH = 'serviceAccountKey.json'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _initialize_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if firebase_admin._apps:
+        return
+    # Firebase初期化 - Try to use service account if available
+    try:
+        if os.path.exists(SERVICE_ACCOUNT_PATH):
+            print(f"Using service account: {SERVICE_ACCOUNT_PATH}")
+            firebase_admin.initialize_app(credentials.Certificate(SERVICE_ACCOUNT_PATH))
+        else:
+            print("Service account file not found, using default initialization")
+            firebase_admin.initialize_app()
+    except Exception as e:
+        print(f"Firebase initialization error: {str(e)}")
+        # Still try to initialize without credentials as fallback
+        firebase_admin.initialize_app()
+
+
+def get_db():
+    """
+    Firestoreクライアントを返す（初回呼び出し時に Firebase を初期化する）
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from firebase_admin import firestore
+
+                _initialize_app()
+                _client = firestore.client()
+    return _client
+
+
+def use_client(client):
+    """
+    以降の get_db() が client を返すようにする（fake_firestore.FakeFirestore を差し込むベンチマーク・テスト用）
+    """
+    global _client
+    with _client_lock:
+        _client = client
+
+
+class LazyFirestoreClient:
+    """
+    属性へのアクセスを get_db() のクライアントに委譲するプロキシ
+
+    モジュールの読み込み時に UsersIndex(db) のように渡しておき、実際の接続は最初の利用時まで遅らせる。
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
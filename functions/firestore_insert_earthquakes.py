@@ -4,11 +4,19 @@ from firebase_admin import credentials, firestore
 import json
 import os
 
+from import_pipeline import batch_set_commit, run_import
+from timestamps import TIMESTAMP_FIELDS, normalize_timestamps
+
 def insert_earthquake_to_firestore(
     epicenter: str,
     intensity: str,
     magnitude: float,
 ):
+    """
+    発生した地震をFirestoreに登録し、登録したデータを返す（失敗した場合は None）
+
+    time には発生時刻をFirestoreのタイムスタンプとして記録し、返り値にも同じ時刻を入れる。
+    """
     try:
         print("Firebase初期化状態の確認...")
         if not firebase_admin._apps:
@@ -16,7 +24,8 @@ def insert_earthquake_to_firestore(
             cred = credentials.Certificate('serviceAccountKey.json')
             firebase_admin.initialize_app(cred)
         
-        id = str("EQ" + datetime.now(timezone.utc).strftime("%Y%m%d"))
+        occurred_at = datetime.now(timezone.utc)
+        id = str("EQ" + occurred_at.strftime("%Y%m%d"))
         print(f"生成されたID: {id}")
         # Firestoreクライアントの初期化（既存のアプリケーションを使用）
         db = firestore.client()
@@ -28,13 +37,14 @@ def insert_earthquake_to_firestore(
             'epicenter': epicenter,
             'intensity': intensity,
             'magnitude': magnitude,
-            'time': firestore.SERVER_TIMESTAMP,
+            'time': occurred_at,
         }
         print(f"保存するデータ: {data}")
         earthquake_ref = db.collection('earthquakes').document(id)
         earthquake_ref.set(data)
         print(f"ドキュメント参照: {earthquake_ref}")
         print(f"成功: 地震データがFirestoreに正常にインポートされました")
+        return data
     
     except FileNotFoundError as e:
         print(f"エラー: ファイルが見つかりません - {e}")
@@ -43,12 +53,14 @@ def insert_earthquake_to_firestore(
     except Exception as e:
         print(f"エラー: 予期しないエラーが発生しました - {str(e)}")
 
-def import_earthquakes_to_firestore():
+def import_earthquakes_to_firestore(json_path='mocks/earth_quake.json'):
     """
     ローカル環境でFirestoreにearth_quake.jsonのデータをインポートするスクリプト
     
     注意: このスクリプトを実行する前に、サービスアカウントのキーファイルが必要です。
     Firebase Consoleから取得して、serviceAccountKey.jsonという名前で保存してください。
+    
+    大きなファイルもストリーミングで読み込み、失敗した場合は再実行すると途中から再開する。
     """
     try:
         # Firebase初期化（ローカル環境用）
@@ -65,26 +77,17 @@ def import_earthquakes_to_firestore():
         # Firestoreクライアントの初期化
         db = firestore.client()
         
-        # earth_quake.jsonからデータを読み込む
-        json_path = 'mocks/earth_quake.json'
-        with open(json_path, 'r', encoding='utf-8') as f:
-            earthquakes = json.load(f)
-        
-        # Firestoreのバッチ処理を初期化
-        batch = db.batch()
-        
-        # 追加された地震データの数をカウント
-        added_count = 0
-        
-        # 各地震データをFirestoreに追加
-        for earthquake in earthquakes:
-            # IDフィールドを使用してドキュメントIDを設定
-            earthquake_ref = db.collection('earthquakes').document(earthquake['id'])
-            batch.set(earthquake_ref, earthquake)
-            added_count += 1
-        
-        # バッチコミット実行
-        batch.commit()
+        # earth_quake.jsonをストリーミングで読み込み、チャンク単位で並列にコミットする
+        # 発生時刻の文字列はFirestoreのタイムスタンプに変換して保存する
+        added_count = run_import(
+            json_path,
+            batch_set_commit(
+                db,
+                'earthquakes',
+                'id',
+                transform=lambda item: normalize_timestamps(item, TIMESTAMP_FIELDS['earthquakes'])
+            ),
+        )
         
         print(f"成功: {added_count}件の地震データがFirestoreに正常にインポートされました")
     
@@ -96,4 +99,5 @@ def import_earthquakes_to_firestore():
         print(f"エラー: 予期しないエラーが発生しました - {str(e)}")
 
 if __name__ == "__main__":
-    import_earthquakes_to_firestore() 
\ No newline at end of file
+    import sys
+    import_earthquakes_to_firestore(*sys.argv[1:2]) 
\ No newline at end of file
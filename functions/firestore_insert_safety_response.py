@@ -3,12 +3,17 @@ from firebase_admin import credentials, firestore
 import json
 import os
 
-def import_safety_logs_to_firestore():
+from import_pipeline import run_import
+from safety_logs import MAX_RECORDS_PER_TRANSACTION, record_safety_responses, safety_log_id
+
+def import_safety_logs_to_firestore(json_path='mocks/safety_response_log.json'):
     """
     ローカル環境でFirestoreにsafety_response_log.jsonのデータをインポートするスクリプト
     
     注意: このスクリプトを実行する前に、サービスアカウントのキーファイルが必要です。
     Firebase Consoleから取得して、serviceAccountKey.jsonという名前で保存してください。
+    
+    大きなファイルもストリーミングで読み込み、失敗した場合は再実行すると途中から再開する。
     """
     try:
         # Firebase初期化（ローカル環境用）
@@ -25,26 +30,18 @@ def import_safety_logs_to_firestore():
         # Firestoreクライアントの初期化
         db = firestore.client()
         
-        # safety_response_log.jsonからデータを読み込む
-        json_path = 'mocks/safety_response_log.json'
-        with open(json_path, 'r', encoding='utf-8') as f:
-            safety_logs = json.load(f)
-        
-        # Firestoreのバッチ処理を初期化
-        batch = db.batch()
-        
-        # 追加されたログの数をカウント
-        added_count = 0
-        
-        # 各ログデータをFirestoreに追加
-        for log in safety_logs:
-            # IDフィールドがない場合は自動生成IDを使用
-            log_ref = db.collection('safety_response_logs').document()
-            batch.set(log_ref, log)
-            added_count += 1
-        
-        # バッチコミット実行
-        batch.commit()
+        # safety_response_log.jsonをストリーミングで読み込み、チャンク単位で並列にコミットする
+        # 安否ログと最新ステータス（user_latest_status）はチャンクごとにトランザクションで書き込む
+        # ログIDは内容から決めるため、途中から再開しても重複しない
+        added_count = run_import(
+            json_path,
+            lambda chunk: record_safety_responses(
+                db,
+                chunk,
+                log_ids=[safety_log_id(log) for log in chunk]
+            ),
+            chunk_size=MAX_RECORDS_PER_TRANSACTION,
+        )
         
         print(f"成功: {added_count}件の安全性応答ログがFirestoreに正常にインポートされました")
     
@@ -56,4 +53,5 @@ def import_safety_logs_to_firestore():
         print(f"エラー: 予期しないエラーが発生しました - {str(e)}")
 
 if __name__ == "__main__":
-    import_safety_logs_to_firestore()
\ No newline at end of file
+    import sys
+    import_safety_logs_to_firestore(*sys.argv[1:2])
\ No newline at end of file
@@ -0,0 +1,59 @@
+import firebase_admin
+from firebase_admin import credentials, firestore
+import json
+import os
+
+from import_pipeline import run_import
+from timestamps import TIMESTAMP_FIELDS, normalize_timestamps
+from user_graph import USER_CONNECTIONS_COLLECTION
+
+def import_user_connections_to_firestore(json_path='mocks/user_connections.json'):
+    """
+    ローカル環境でFirestoreにuser_connections.jsonのデータをインポートするスクリプト
+    
+    注意: このスクリプトを実行する前に、サービスアカウントのキーファイルが必要です。
+    Firebase Consoleから取得して、serviceAccountKey.jsonという名前で保存してください。
+    
+    ドキュメントIDは "user1_id_user2_id" とし、再実行しても重複しないようにする。
+    """
+    try:
+        # Firebase初期化（ローカル環境用）
+        service_account_path = 'serviceAccountKey.json'
+        
+        if not os.path.exists(service_account_path):
+            print(f"エラー: {service_account_path} が見つかりません。")
+            print("Firebase Consoleからサービスアカウントのキーをダウンロードして、このディレクトリに保存してください。")
+            return
+        
+        cred = credentials.Certificate(service_account_path)
+        firebase_admin.initialize_app(cred)
+        
+        # Firestoreクライアントの初期化
+        db = firestore.client()
+        collection = db.collection(USER_CONNECTIONS_COLLECTION)
+
+        def commit_chunk(chunk):
+            batch = db.batch()
+            for connection in chunk:
+                document_id = f"{connection['user1_id']}_{connection['user2_id']}"
+                batch.set(
+                    collection.document(document_id),
+                    normalize_timestamps(connection, TIMESTAMP_FIELDS[USER_CONNECTIONS_COLLECTION])
+                )
+            batch.commit()
+        
+        # user_connections.jsonをストリーミングで読み込み、チャンク単位で並列にコミットする
+        added_count = run_import(json_path, commit_chunk)
+        
+        print(f"成功: {added_count}件のつながりがFirestoreに正常にインポートされました")
+    
+    except FileNotFoundError as e:
+        print(f"エラー: ファイルが見つかりません - {e}")
+    except json.JSONDecodeError:
+        print(f"エラー: {json_path} のJSONフォーマットが無効です")
+    except Exception as e:
+        print(f"エラー: 予期しないエラーが発生しました - {str(e)}")
+
+if __name__ == "__main__":
+    import sys
+    import_user_connections_to_firestore(*sys.argv[1:2])
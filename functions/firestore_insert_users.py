@@ -3,12 +3,17 @@ from firebase_admin import credentials, firestore
 import json
 import os
 
-def import_users_to_firestore():
+from geocoding import with_location_fields
+from import_pipeline import batch_set_commit, run_import
+
+def import_users_to_firestore(json_path='mocks/users.json'):
     """
     ローカル環境でFirestoreにusers.jsonのデータをインポートするスクリプト
     
     注意: このスクリプトを実行する前に、サービスアカウントのキーファイルが必要です。
     Firebase Consoleから取得して、serviceAccountKey.jsonという名前で保存してください。
+    
+    大きなファイルもストリーミングで読み込み、失敗した場合は再実行すると途中から再開する。
     """
     try:
         # Firebase初期化（ローカル環境用）
@@ -25,25 +30,12 @@ def import_users_to_firestore():
         # Firestoreクライアントの初期化
         db = firestore.client()
         
-        # users.jsonからデータを読み込む
-        json_path = 'mocks/users.json'
-        with open(json_path, 'r', encoding='utf-8') as f:
-            users = json.load(f)
-        
-        # Firestoreのバッチ処理を初期化
-        batch = db.batch()
-        
-        # 追加されたユーザー数をカウント
-        added_count = 0
-        
-        # 各ユーザーをFirestoreに追加
-        for user in users:
-            user_ref = db.collection('users').document(user['id'])
-            batch.set(user_ref, user)
-            added_count += 1
-        
-        # バッチコミット実行
-        batch.commit()
+        # users.jsonをストリーミングで読み込み、チャンク単位で並列にコミットする
+        # 住所から求めた位置（geohash / lat / lon）を一緒に保存し、震源地の近くのユーザーを範囲クエリで検索できるようにする
+        added_count = run_import(
+            json_path,
+            batch_set_commit(db, 'users', 'id', transform=lambda item: with_location_fields(item, 'address')),
+        )
         
         print(f"成功: {added_count}人のユーザーデータがFirestoreに正常にインポートされました")
     
@@ -55,4 +47,5 @@ def import_users_to_firestore():
         print(f"エラー: 予期しないエラーが発生しました - {str(e)}")
 
 if __name__ == "__main__":
-    import_users_to_firestore()
\ No newline at end of file
+    import sys
+    import_users_to_firestore(*sys.argv[1:2])
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+ベンチマーク用のデータ生成
+
+mocks/ と同じ形式のユーザー・安否ログ・つながりを指定した件数だけ生成する。
+住所は同梱の市区町村の代表点（data/jp_centroids.json）から選ぶため、ジオコーディングで位置が解決できる。
+
+使い方: python generate_bench_data.py [ユーザー数] [安否ログ数] [つながり数] [出力ディレクトリ]
+出力したファイルは firestore_insert_*.py でそのままインポートできる。
+"""
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from geocoding import CENTROIDS_PATH, with_location_fields
+from safety_logs import record_safety_responses, safety_log_id
+from timestamps import JST, TIMESTAMP_FIELDS, normalize_timestamps
+
+SURNAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤']
+GIVEN_NAMES = ['健太', '美咲', '直樹', '優子', '誠', '花子', '大輔', '結', '翔', '陽菜']
+STATUSES = ['SAFE', 'NEED_HELP']
+STATUS_WEIGHTS = [0.8, 0.2]
+
+# 安否ログの時刻を分布させる期間
+LOG_PERIOD = timedelta(days=7)
+
+# Firestoreの1バッチ500書き込み制限
+MAX_WRITES_PER_BATCH = 500
+
+
+def _municipalities():
+    with open(CENTROIDS_PATH, 'r', encoding='utf-8') as f:
+        return list(json.load(f)['municipalities'])
+
+
+def generate_users(count, seed=0):
+    rng = random.Random(seed)
+    municipalities = _municipalities()
+    return [
+        {
+            'id': f"USR{i:08d}",
+            'name': f"{rng.choice(SURNAMES)} {rng.choice(GIVEN_NAMES)}",
+            'address': f"{rng.choice(municipalities)}{rng.randint(1, 9)}-{rng.randint(1, 30)}-{rng.randint(1, 20)}",
+        }
+        for i in range(count)
+    ]
+
+
+def generate_safety_logs(users, count, seed=0, now=None):
+    rng = random.Random(seed + 1)
+    now = now or datetime.now(JST)
+    logs = []
+    for _ in range(count):
+        user = rng.choice(users)
+        timestamp = now - timedelta(seconds=rng.uniform(0, LOG_PERIOD.total_seconds()))
+        logs.append({
+            'user_id': user['id'],
+            'timestamp': timestamp.isoformat(timespec='seconds'),
+            'status': rng.choices(STATUSES, STATUS_WEIGHTS)[0],
+            'location': user['address'],
+        })
+    return logs
+
+
+def generate_connections(users, count, seed=0):
+    rng = random.Random(seed + 2)
+    connections = []
+    while len(connections) < count and len(users) > 1:
+        user1, user2 = rng.sample(users, 2)
+        connections.append({
+            'user1_id': user1['id'],
+            'user2_id': user2['id'],
+            'created_at': datetime(2024, 1, 1, tzinfo=JST).isoformat(),
+        })
+    return connections
+
+
+def generate_dataset(user_count, log_count, connection_count, seed=0):
+    users = generate_users(user_count, seed)
+    return {
+        'users': users,
+        'safety_response_logs': generate_safety_logs(users, log_count, seed),
+        'user_connections': generate_connections(users, connection_count, seed),
+    }
+
+
+def load_dataset(db, dataset, earthquakes=()):
+    """
+    生成したデータを db（FakeFirestore など）に書き込む
+
+    安否ログは record_safety_responses で書き込み、user_latest_status も作成する。
+    インポートスクリプトと同じく、タイムスタンプの文字列はFirestoreのタイムスタンプに変換し、ユーザーには位置を追加する。
+    """
+    writes = [
+        (db.collection('users').document(user['id']), with_location_fields(user, 'address'))
+        for user in dataset['users']
+    ]
+    writes += [
+        (
+            db.collection('user_connections').document(f"{connection['user1_id']}_{connection['user2_id']}"),
+            normalize_timestamps(connection, TIMESTAMP_FIELDS['user_connections']),
+        )
+        for connection in dataset['user_connections']
+    ]
+    writes += [
+        (
+            db.collection('earthquakes').document(earthquake['id']),
+            normalize_timestamps(earthquake, TIMESTAMP_FIELDS['earthquakes']),
+        )
+        for earthquake in earthquakes
+    ]
+    for start in range(0, len(writes), MAX_WRITES_PER_BATCH):
+        batch = db.batch()
+        for document_ref, data in writes[start:start + MAX_WRITES_PER_BATCH]:
+            batch.set(document_ref, data)
+        batch.commit()
+
+    logs = dataset['safety_response_logs']
+    record_safety_responses(db, logs, log_ids=[safety_log_id(log) for log in logs])
+
+
+def write_dataset(dataset, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for name, filename in (
+        ('users', 'users.json'),
+        ('safety_response_logs', 'safety_response_log.json'),
+        ('user_connections', 'user_connections.json'),
+    ):
+        with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+            json.dump(dataset[name], f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    log_count = int(sys.argv[2]) if len(sys.argv) > 2 else user_count * 3
+    connection_count = int(sys.argv[3]) if len(sys.argv) > 3 else user_count * 5
+    output_dir = sys.argv[4] if len(sys.argv) > 4 else 'bench_data'
+
+    write_dataset(generate_dataset(user_count, log_count, connection_count), output_dir)
+    print(f"{output_dir} にユーザー{user_count}人・安否ログ{log_count}件・つながり{connection_count}件を出力しました")
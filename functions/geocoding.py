@@ -0,0 +1,204 @@
+"""
+オフラインの住所ジオコーディング
+
+同梱の都道府県・市区町村・震央地域の代表点（data/jp_centroids.json）を文字単位のトライに格納し、
+住所文字列の最長一致で緯度経度を求める。解決結果はLRUキャッシュに保持する。
+都道府県までしか分からない位置は、代表点から県内の最も遠い有人地までの距離（data/jp_prefecture_extents.json）を
+位置のずれの上限として扱う。
+Firestoreに保存する位置（geohash / lat / lon / location_level）も location_fields で作成する。
+"""
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+
+from geohash import encode
+
+CENTROIDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jp_centroids.json')
+# Centroid-to-farthest-inhabited-point radius per prefecture; remote Tokyo islands
+# (Ogasawara, Okinotorishima, Minamitorishima) are left out of 東京都
+PREFECTURE_EXTENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jp_prefecture_extents.json')
+
+GEOCODE_CACHE_SIZE = 65536
+
+LEVEL_PREFECTURE = 'prefecture'
+LEVEL_MUNICIPALITY = 'municipality'
+LEVEL_REGION = 'region'
+# 住所から位置を推定できない場合に location_level として保存する値
+LEVEL_UNKNOWN = 'unknown'
+
+# 震央地域（"宮城県沖" など）の代表点と実際の震源の距離の上限（km）
+REGION_UNCERTAINTY_KM = 50.0
+
+# name は一致した地名（都道府県名から始まる正規化済みの表記）
+Location = namedtuple('Location', ['lat', 'lon', 'name', 'level', 'prefecture'])
+
+_POSTAL_CODE_PATTERN = re.compile(r'^〒?\d{3}-?\d{4}')
+_PREFECTURE_PATTERN = re.compile(r'^(東京都|北海道|(?:京都|大阪)府|.{2,3}県)')
+
+_trie = None
+_trie_lock = threading.Lock()
+
+
+def normalize_address(address):
+    """
+    全角英数字・記号を半角に揃え、空白と郵便番号を取り除く
+    """
+    text = unicodedata.normalize('NFKC', address)
+    text = ''.join(text.split())
+    text = _POSTAL_CODE_PATTERN.sub('', text)
+    if text.startswith('日本'):
+        text = text[2:]
+    return text
+
+
+def _insert(trie, key, value):
+    node = trie
+    for char in key:
+        node = node[0].setdefault(char, [{}, None])
+    node[1] = value
+
+
+def _build_trie():
+    with open(CENTROIDS_PATH, 'r', encoding='utf-8') as f:
+        centroids = json.load(f)
+
+    trie = [{}, None]
+    for level, section in (
+        (LEVEL_PREFECTURE, 'prefectures'),
+        (LEVEL_MUNICIPALITY, 'municipalities'),
+        (LEVEL_REGION, 'regions'),
+    ):
+        for name, (lat, lon) in centroids[section].items():
+            match = _PREFECTURE_PATTERN.match(name)
+            prefecture = match.group(1) if match else None
+            _insert(trie, name, Location(lat, lon, name, level, prefecture))
+
+    # Also accept municipality names written without the prefecture (e.g. "仙台市青葉区"),
+    # as long as the short form is unambiguous; two-character names like "北区" never are
+    short_names = {}
+    for name in centroids['municipalities']:
+        prefecture = _PREFECTURE_PATTERN.match(name).group(1)
+        short_name = name[len(prefecture):]
+        short_names.setdefault(short_name, []).append(name)
+    for short_name, names in short_names.items():
+        if len(names) == 1 and len(short_name) >= 3:
+            lat, lon = centroids['municipalities'][names[0]]
+            prefecture = _PREFECTURE_PATTERN.match(names[0]).group(1)
+            _insert(trie, short_name, Location(lat, lon, names[0], LEVEL_MUNICIPALITY, prefecture))
+
+    return trie
+
+
+def _get_trie():
+    global _trie
+    if _trie is None:
+        with _trie_lock:
+            if _trie is None:
+                _trie = _build_trie()
+    return _trie
+
+
+def _longest_match(text):
+    node = _get_trie()
+    found = None
+    for char in text:
+        node = node[0].get(char)
+        if node is None:
+            break
+        if node[1] is not None:
+            found = node[1]
+    return found
+
+
+@lru_cache(maxsize=GEOCODE_CACHE_SIZE)
+def geocode(address):
+    """
+    住所を Location に変換する（一致する地名が無い場合は None）
+
+    最も長く一致した地名の代表点を返すため、番地や建物名は精度に影響しない。
+    """
+    if not address:
+        return None
+    return _longest_match(normalize_address(address))
+
+
+def municipality_of(location):
+    """
+    同一市区町村の判定に使う市区町村名を返す（市区町村まで解決できていない場合は None）
+    """
+    if location is None or location.level != LEVEL_MUNICIPALITY:
+        return None
+    return location.name
+
+
+@lru_cache(maxsize=None)
+def _prefecture_radii():
+    with open(PREFECTURE_EXTENTS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)['prefecture_radius_km']
+
+
+def uncertainty_km(location):
+    """
+    代表点と実際の位置の距離の上限（km）を返す
+
+    市区町村は代表点をそのまま使うため0、都道府県までしか分からない場合は代表点から県内の最も遠い有人地までの距離。
+    """
+    return level_uncertainty_km(location.level, location.prefecture)
+
+
+def level_uncertainty_km(level, prefecture=None):
+    """
+    位置の精度（Location.level / 保存した location_level）と都道府県名から uncertainty_km と同じ値を返す
+
+    都道府県までしか分からないのに都道府県名が無い（範囲が分からない）場合は math.inf。
+    """
+    if level == LEVEL_MUNICIPALITY:
+        return 0.0
+    if level == LEVEL_REGION:
+        return REGION_UNCERTAINTY_KM
+    if level == LEVEL_PREFECTURE and prefecture is not None:
+        return float(_prefecture_radii().get(prefecture, math.inf))
+    return math.inf
+
+
+def may_share_municipality(location, other):
+    """
+    2つの位置が同じ市区町村でありうるかを返す
+
+    どちらかが都道府県までしか分からない場合は、同じ都道府県であれば True。震央地域は市区町村として扱わない。
+    """
+    if location is None or other is None or LEVEL_REGION in (location.level, other.level):
+        return False
+    if location.level == other.level == LEVEL_MUNICIPALITY:
+        return location.name == other.name
+    return location.prefecture == other.prefecture
+
+
+def location_fields(address):
+    """
+    住所から {"geohash", "lat", "lon", "location_level"} を返す
+
+    位置を推定できない場合は {"location_level": LEVEL_UNKNOWN} だけを返す
+    （ジオハッシュの範囲クエリには掛からないため、location_level で別に検索する）。
+    """
+    location = geocode(address)
+    if location is None:
+        return {'location_level': LEVEL_UNKNOWN}
+    return {
+        'geohash': encode(location.lat, location.lon),
+        'lat': location.lat,
+        'lon': location.lon,
+        'location_level': location.level,
+    }
+
+
+def with_location_fields(data, address_field):
+    """
+    data[address_field] の位置を追加した辞書を返す
+    """
+    return {**data, **location_fields(data.get(address_field))}
@@ -0,0 +1,110 @@
+"""
+ジオハッシュの符号化と、円を覆うジオハッシュの範囲（Firestoreの範囲クエリ用）
+
+ジオハッシュは前方一致が近さを表すため、geohash フィールドに >= / < の範囲クエリを発行すると
+その範囲のセルにいるドキュメントだけを読み込める。セルは円より広いため、結果は距離で絞り込むこと。
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# 保存するジオハッシュの桁数（約5m四方）
+GEOHASH_PRECISION = 9
+
+# 1つの円を覆うために発行する範囲クエリの上限
+MAX_QUERY_RANGES = 16
+
+KM_PER_DEGREE = 111.32
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value_range, value = (lon_range, lon) if even else (lat_range, lat)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size_degrees(precision):
+    """
+    precision 桁のセルの (緯度方向, 経度方向) の大きさ（度）
+    """
+    bits = precision * 5
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def _next_prefix(prefix):
+    # The smallest prefix sorting after every geohash that starts with prefix
+    for index in range(len(prefix) - 1, -1, -1):
+        position = BASE32.index(prefix[index])
+        if position < len(BASE32) - 1:
+            return prefix[:index] + BASE32[position + 1]
+    return prefix + '~'
+
+
+def _degree_deltas(lat, radius_km):
+    # Half-size of the bounding box of the circle, in degrees
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat_delta, lon_delta
+
+
+def _covering_prefixes(lat, lon, radius_km, precision):
+    lat_delta, lon_delta = _degree_deltas(lat, radius_km)
+    cell_lat, cell_lon = cell_size_degrees(precision)
+
+    def steps(center, delta, cell, low, high):
+        start, end = max(center - delta, low), min(center + delta, high)
+        count = int((end - start) / cell) + 1
+        return [start + cell * i for i in range(count)] + [end]
+
+    return {
+        encode(point_lat, point_lon, precision)
+        for point_lat in steps(lat, lat_delta, cell_lat, -90.0, 90.0)
+        for point_lon in steps(lon, lon_delta, cell_lon, -180.0, 180.0 - 1e-9)
+    }
+
+
+def _merge_ranges(prefixes):
+    ranges = []
+    for prefix in sorted(prefixes):
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1][1] = _next_prefix(prefix)
+        else:
+            ranges.append([prefix, _next_prefix(prefix)])
+    return [tuple(bounds) for bounds in ranges]
+
+
+def query_ranges(lat, lon, radius_km, max_ranges=MAX_QUERY_RANGES):
+    """
+    中心から radius_km 以内を覆う [(開始, 終了)] のジオハッシュの範囲を返す（開始 <= geohash < 終了）
+
+    範囲が max_ranges 個以下に収まる最も細かい桁数を選ぶ。
+    """
+    lat_delta, lon_delta = _degree_deltas(lat, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        # Skip precisions whose cells could never merge into few enough ranges
+        cell_lat, cell_lon = cell_size_degrees(precision)
+        if (2 * lat_delta / cell_lat + 2) * (2 * lon_delta / cell_lon + 2) > max_ranges * len(BASE32):
+            continue
+        ranges = _merge_ranges(_covering_prefixes(lat, lon, radius_km, precision))
+        if len(ranges) <= max_ranges:
+            return ranges
+    return [('', '~')]
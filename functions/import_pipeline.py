@@ -0,0 +1,160 @@
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from json_stream import iter_json_array
+
+# Firestoreの1バッチ500書き込み制限に収まるチャンクサイズ
+DEFAULT_CHUNK_SIZE = 400
+DEFAULT_MAX_WORKERS = 8
+
+# 進捗を表示する最小間隔（秒）
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+class ImportCheckpoint:
+    """
+    コミット済みチャンクの番号をファイルに記録し、失敗後の再実行で途中から再開できるようにする
+
+    入力ファイルまたはチャンクサイズが前回と異なる場合、記録は破棄して最初から取り込む。
+    """
+
+    def __init__(self, path, source, chunk_size):
+        self.path = path
+        self._source = source
+        self._chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.completed_chunks = set()
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('source') == source and saved.get('chunk_size') == chunk_size:
+                self.completed_chunks = set(saved.get('completed_chunks', []))
+
+    def mark_completed(self, chunk_index):
+        with self._lock:
+            self.completed_chunks.add(chunk_index)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'source': self._source,
+                    'chunk_size': self._chunk_size,
+                    'completed_chunks': sorted(self.completed_chunks),
+                }, f)
+            os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _iter_chunks(items, chunk_size):
+    iterator = iter(items)
+    for chunk_index in itertools.count():
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk_index, chunk
+
+
+def run_import(
+    json_path,
+    commit_chunk,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    max_workers=DEFAULT_MAX_WORKERS,
+    checkpoint_path=None,
+):
+    """
+    JSON配列ファイルをストリーミングで読み込み、チャンク単位で並列にコミットする共通インポート処理
+
+    commit_chunk(chunk) は1チャンク分（chunk_size件以下）の書き込みを行う関数。
+    書き込みは同じデータで再実行しても結果が変わらない（ドキュメントIDが決まっている）必要がある。
+    失敗した場合はチェックポイントを残して例外を送出し、再実行時はコミット済みのチャンクを読み飛ばす。
+    取り込んだ件数を返す。
+    """
+    if checkpoint_path is None:
+        checkpoint_path = f"{json_path}.checkpoint"
+    checkpoint = ImportCheckpoint(checkpoint_path, os.path.abspath(json_path), chunk_size)
+    if checkpoint.completed_chunks:
+        print(f"チェックポイントから再開します: {len(checkpoint.completed_chunks)}チャンクはコミット済み")
+
+    started_at = time.monotonic()
+    last_report_at = started_at
+    imported_count = 0
+    skipped_count = 0
+
+    def report_progress(force=False):
+        nonlocal last_report_at
+        now = time.monotonic()
+        if not force and now - last_report_at < PROGRESS_INTERVAL_SECONDS:
+            return
+        last_report_at = now
+        elapsed = max(now - started_at, 1e-9)
+        print(f"進捗: {imported_count}件をインポート ({imported_count / elapsed:.0f}件/秒)")
+
+    with open(json_path, 'r', encoding='utf-8') as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        failure = None
+
+        def collect(block):
+            nonlocal imported_count, failure
+            done, _ = wait(in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_index, size = in_flight.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    if failure is None:
+                        failure = e
+                    print(f"エラー: チャンク{chunk_index}のコミットに失敗しました - {str(e)}")
+                    continue
+                checkpoint.mark_completed(chunk_index)
+                imported_count += size
+            report_progress()
+
+        for chunk_index, chunk in _iter_chunks(iter_json_array(f), chunk_size):
+            if chunk_index in checkpoint.completed_chunks:
+                skipped_count += len(chunk)
+                continue
+
+            # Bound the number of parsed chunks held in memory
+            collect(block=False)
+            while len(in_flight) >= max_workers * 2:
+                collect(block=True)
+            if failure is not None:
+                break
+
+            in_flight[executor.submit(commit_chunk, chunk)] = (chunk_index, len(chunk))
+
+        while in_flight:
+            collect(block=True)
+
+    if failure is not None:
+        print(f"インポートを中断しました。再実行するとチェックポイント（{checkpoint_path}）から再開します")
+        raise failure
+
+    report_progress(force=True)
+    if skipped_count:
+        print(f"{skipped_count}件は前回の実行でコミット済みのためスキップしました")
+    checkpoint.clear()
+    return imported_count + skipped_count
+
+
+def batch_set_commit(db, collection_name, id_field, transform=None):
+    """
+    各ドキュメントを id_field の値をIDとして1つのバッチで書き込む commit_chunk 関数を作成する
+
+    transform を指定した場合は、各ドキュメントを transform(item) の返り値に置き換えて書き込む。
+    """
+    def commit(chunk):
+        batch = db.batch()
+        collection = db.collection(collection_name)
+        for item in chunk:
+            batch.set(collection.document(item[id_field]), transform(item) if transform else item)
+        batch.commit()
+
+    return commit
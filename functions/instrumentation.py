@@ -0,0 +1,336 @@
+"""
+リクエストの計測（ルート別レイテンシのヒストグラム、Firestore読み書き件数、OpenAI呼び出し・トークン数）
+
+init_app(app) で before_request / after_request を登録し、各レスポンスに Server-Timing ヘッダーを付ける。
+集計結果は render_metrics() で Prometheus のテキスト形式に変換して /metrics から返す。
+Firestoreの件数は InstrumentedFirestoreClient でクライアントを包むと数えられる。
+リクエストの外（バックグラウンドのスレッドなど）での操作は route="" として集計する。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Firestore操作のうち、返り値を包んで計測を続けるもの
+_CHAINED_METHODS = {
+    'collection', 'document', 'where', 'order_by', 'limit', 'limit_to_last',
+    'start_at', 'start_after', 'end_at', 'end_before', 'select', 'offset', 'batch', 'transaction',
+    'count',
+}
+_WRITE_METHODS = {'set', 'update', 'delete', 'create', 'add'}
+
+
+class RequestStats:
+    """
+    1リクエスト分の計測値
+    """
+
+    def __init__(self, route):
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.firestore_reads = 0
+        self.firestore_writes = 0
+        self.openai_requests = 0
+        self.openai_prompt_tokens = 0
+        self.openai_completion_tokens = 0
+        # phase name -> seconds
+        self.phases = {}
+        # Worker threads running in a copied request context update the same stats
+        self.lock = threading.Lock()
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS_SECONDS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        # (route, method) -> [bucket counts..., +Inf count], sum
+        self._histograms = {}
+        self._requests = {}
+        # (name, labels tuple) -> value
+        self._counters = {}
+        self._gauges = []
+
+    def observe_request(self, route, method, status, seconds):
+        with self._lock:
+            key = (route, method)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self._buckets) + 1), 0.0]
+            for index, bound in enumerate(self._buckets):
+                if seconds <= bound:
+                    histogram[0][index] += 1
+            histogram[0][-1] += 1
+            histogram[1] += seconds
+            request_key = (route, method, str(status))
+            self._requests[request_key] = self._requests.get(request_key, 0) + 1
+
+    def increment(self, name, labels, amount=1):
+        if not amount:
+            return
+        with self._lock:
+            key = (name, tuple(sorted(labels.items())))
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_gauge(self, name, help_text, callback):
+        """
+        /metrics を返すたびに callback() の値を出力するゲージを登録する
+        """
+        self._gauges.append((name, help_text, callback))
+
+    def render(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+            requests = dict(self._requests)
+            counters = dict(self._counters)
+
+        for (route, method), (counts, total) in sorted(histograms.items()):
+            labels = f'route="{_escape(route)}",method="{method}"'
+            for bound, count in zip(self._buckets, counts):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {counts[-1]}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {counts[-1]}')
+
+        lines += ['# HELP http_requests_total Requests by route and status', '# TYPE http_requests_total counter']
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{{route="{_escape(route)}",method="{method}",status="{status}"}} {count}')
+
+        names = sorted({name for name, _ in counters})
+        for name in names:
+            lines.append(f'# TYPE {name} counter')
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels)
+                    lines.append(f'{name}{{{label_text}}} {value}')
+
+        for name, help_text, callback in self._gauges:
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Metrics gauge {name} failed: {str(e)}")
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def current_stats():
+    """
+    処理中のリクエストの RequestStats（リクエストの外では None）
+    """
+    if not has_app_context():
+        return None
+    return g.get('_request_stats')
+
+
+@contextmanager
+def phase(name):
+    """
+    with phase("firestore"): のように囲んだ処理時間を Server-Timing の name に加算する
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.add_phase(name, time.perf_counter() - started_at)
+
+
+def _record_counts(route, firestore_reads=0, firestore_writes=0, openai_requests=0,
+                   openai_prompt_tokens=0, openai_completion_tokens=0):
+    registry.increment('firestore_document_reads_total', {'route': route}, firestore_reads)
+    registry.increment('firestore_document_writes_total', {'route': route}, firestore_writes)
+    registry.increment('openai_requests_total', {'route': route}, openai_requests)
+    registry.increment('openai_tokens_total', {'route': route, 'type': 'prompt'}, openai_prompt_tokens)
+    registry.increment('openai_tokens_total', {'route': route, 'type': 'completion'}, openai_completion_tokens)
+
+
+def record_firestore(reads=0, writes=0):
+    # Inside a request the counts are kept on the request and flushed once it finishes
+    stats = current_stats()
+    if stats is not None:
+        with stats.lock:
+            stats.firestore_reads += reads
+            stats.firestore_writes += writes
+    else:
+        _record_counts('', firestore_reads=reads, firestore_writes=writes)
+
+
+def record_openai_usage(usage):
+    """
+    OpenAIの1回の呼び出しを記録する（usage は応答の usage。無い場合は None）
+    """
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    stats = current_stats()
+    if stats is not None:
+        with stats.lock:
+            stats.openai_requests += 1
+            stats.openai_prompt_tokens += prompt_tokens
+            stats.openai_completion_tokens += completion_tokens
+    else:
+        _record_counts('', openai_requests=1, openai_prompt_tokens=prompt_tokens,
+                       openai_completion_tokens=completion_tokens)
+
+
+def _unwrap(value):
+    if isinstance(value, _InstrumentedObject):
+        return value._target
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    return value
+
+
+def _counted_stream(iterator):
+    # Reads and time are accumulated locally and recorded once, when the stream ends or is closed
+    stats = current_stats()
+    reads = 0
+    elapsed = 0.0
+    try:
+        while True:
+            started_at = time.perf_counter()
+            try:
+                snapshot = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started_at
+            reads += 1
+            yield snapshot
+    finally:
+        if stats is not None:
+            with stats.lock:
+                stats.phases['firestore'] = stats.phases.get('firestore', 0.0) + elapsed
+                stats.firestore_reads += reads
+        else:
+            _record_counts('', firestore_reads=reads)
+
+
+class _InstrumentedObject:
+    """
+    Firestoreのクライアント・参照・クエリ・バッチを包み、読み書きの件数と時間を記録するプロキシ
+    """
+    __slots__ = ('_target',)
+
+    def __init__(self, target):
+        object.__setattr__(self, '_target', target)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            args = [_unwrap(arg) for arg in args]
+            kwargs = {key: _unwrap(value) for key, value in kwargs.items()}
+            if name in ('stream', 'get_all'):
+                return _counted_stream(iter(attribute(*args, **kwargs)))
+            with phase('firestore'):
+                result = attribute(*args, **kwargs)
+            if name in _CHAINED_METHODS:
+                return _InstrumentedObject(result)
+            if name == 'get':
+                record_firestore(reads=len(result) if isinstance(result, list) else 1)
+            elif name in _WRITE_METHODS:
+                record_firestore(writes=1)
+            return result
+
+        return call
+
+    def __iter__(self):
+        return iter(self._target)
+
+
+class InstrumentedFirestoreClient(_InstrumentedObject):
+    """
+    Firestoreクライアント（LazyFirestoreClient も可）を包み、ドキュメントの読み書き件数を数える
+
+    get_all / stream は取り出したドキュメント数、get は取得した件数、
+    set / update / delete / add（バッチ・トランザクション内を含む）は1件ごとに数える。
+    """
+    __slots__ = ()
+
+
+def _before_request():
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g._request_stats = RequestStats(rule)
+
+
+def _after_request(response):
+    stats = g.get('_request_stats')
+    if stats is None:
+        return response
+
+    elapsed = time.perf_counter() - stats.started_at
+    timings = [f'app;dur={elapsed * 1000:.1f}']
+    with stats.lock:
+        phases = list(stats.phases.items())
+    for name, seconds in phases:
+        description = ''
+        if name == 'firestore':
+            description = f';desc="{stats.firestore_reads} reads, {stats.firestore_writes} writes"'
+        elif name == 'openai':
+            description = f';desc="{stats.openai_requests} calls"'
+        timings.append(f'{name};dur={seconds * 1000:.1f}{description}')
+    response.headers['Server-Timing'] = ', '.join(timings)
+
+    method = request.method
+    status = response.status_code
+
+    def observe():
+        registry.observe_request(stats.route, method, status, time.perf_counter() - stats.started_at)
+        _record_counts(
+            stats.route,
+            firestore_reads=stats.firestore_reads,
+            firestore_writes=stats.firestore_writes,
+            openai_requests=stats.openai_requests,
+            openai_prompt_tokens=stats.openai_prompt_tokens,
+            openai_completion_tokens=stats.openai_completion_tokens,
+        )
+
+    if response.is_streamed:
+        # The body is produced after this hook; record once it has been fully sent
+        response.call_on_close(observe)
+    else:
+        observe()
+    return response
+
+
+def init_app(app):
+    """
+    app に計測用のフックを登録する（app.json を差し替える場合はその後に呼ぶこと）
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    # Time JSON encoding, which is otherwise hidden inside the views
+    dumps = app.json.dumps
+
+    def timed_dumps(obj, **kwargs):
+        with phase('json'):
+            return dumps(obj, **kwargs)
+
+    app.json.dumps = timed_dumps
+
+
+def render_metrics():
+    return registry.render()
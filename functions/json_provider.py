@@ -0,0 +1,63 @@
+"""
+Flaskアプリ（app.json）のJSONプロバイダー
+
+日本語はエスケープせずUTF-8のまま出力する（\\uXXXX にすると名前・住所・メッセージが約3倍の大きさになる）。
+orjson がインストールされていればそれで変換し（jsonify が指定する separators / indent=2 は orjson のオプションに置き換える）、
+無い場合や orjson で表せない引数・変換できない値（64ビットを超える整数など）は標準の json モジュールで変換する。
+"""
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from timestamps import format_timestamp
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Firestoreのタイムスタンプ（datetime）を日本時間のISO形式で出力するJSONプロバイダー
+    """
+
+    ensure_ascii = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return format_timestamp(o)
+        return DefaultJSONProvider.default(o)
+
+    def _orjson_options(self, kwargs):
+        # None when kwargs ask for output orjson cannot produce.
+        # response() (jsonify) always passes compact separators, or indent=2 in debug mode
+        kwargs = dict(kwargs)
+        indent = kwargs.pop('indent', None)
+        separators = kwargs.pop('separators', None)
+        if kwargs or indent not in (None, 2) or separators not in (None, (',', ':')):
+            return None
+
+        # Dates go through default() so they are formatted exactly as with the stdlib encoder
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        options = self._orjson_options(kwargs) if orjson is not None else None
+        if options is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=options).decode('utf-8')
+            except TypeError:
+                # orjson.JSONEncodeError; the stdlib encoder accepts a few more values
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
@@ -0,0 +1,139 @@
+import json
+import re
+
+# Literals that may still be arriving when the buffer ends in the middle of one
+_LITERALS = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+_NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*\Z')
+
+
+def _is_truncated(buffer, error):
+    # True when the decode error only means the element continues past the end of the buffer
+    tail = buffer[error.pos:]
+    if not tail.strip(' \t\r\n') or error.msg.startswith('Unterminated string'):
+        return True
+    if error.msg.startswith('Invalid \\uXXXX escape'):
+        return len(buffer) - error.pos <= 6
+    if any(literal.startswith(tail) for literal in _LITERALS):
+        return True
+    # A number cut inside an object or array, e.g. {"a": 1. or [1e
+    return (
+        error.msg.startswith("Expecting ',' delimiter")
+        and buffer[error.pos - 1].isdigit()
+        and _NUMBER_TAIL.match(tail) is not None
+    )
+
+
+class JSONArrayParser:
+    """
+    JSON配列を少しずつ受け取り、要素が閉じた時点で1件ずつ取り出すインクリメンタルパーサー
+
+    feed() に文字列の断片を渡すと、その時点で完成した要素のリストを返す。
+    要素の区切りが不正な場合や、続きを受け取っても解釈できない要素がある場合はその時点で JSONDecodeError を送出する。
+    skip_preamble=True の場合は最初の '[' より前の文字列（```json などのマーカー）を読み飛ばす。
+    """
+
+    def __init__(self, skip_preamble=False):
+        self._decoder = json.JSONDecoder()
+        self._skip_preamble = skip_preamble
+        self._buffer = ''
+        self._started = False
+        # Whether the next token must be an element (after '[' or ',') or a separator
+        self._expect_value = True
+        self._empty = True
+        self.finished = False
+
+    def feed(self, text):
+        self._buffer += text
+        return self._drain()
+
+    def close(self):
+        """
+        入力の終わりを通知する。配列が閉じていない場合は JSONDecodeError を送出する。
+        """
+        if self.finished:
+            return
+        rest = self._buffer.strip()
+        if not rest:
+            raise json.JSONDecodeError('Unterminated JSON array', self._buffer, len(self._buffer))
+        # Surface the real syntax error of the trailing fragment when there is one
+        self._decoder.raw_decode(rest)
+        raise json.JSONDecodeError('Unterminated JSON array', rest, len(rest))
+
+    def _drain(self):
+        items = []
+        buffer = self._buffer
+        pos = 0
+        length = len(buffer)
+
+        while not self.finished:
+            while pos < length and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos >= length:
+                break
+
+            if not self._started:
+                if buffer[pos] != '[':
+                    if not self._skip_preamble:
+                        raise json.JSONDecodeError('Expecting JSON array', buffer, pos)
+                    bracket = buffer.find('[', pos)
+                    if bracket < 0:
+                        pos = length
+                        break
+                    pos = bracket
+                self._started = True
+                pos += 1
+                continue
+
+            char = buffer[pos]
+            if not self._expect_value:
+                if char == ',':
+                    self._expect_value = True
+                    pos += 1
+                    continue
+                if char == ']':
+                    self.finished = True
+                    pos += 1
+                    break
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            if char == ']' and self._empty:
+                self.finished = True
+                pos += 1
+                break
+
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if _is_truncated(buffer, e):
+                    # The element is still incomplete; wait for more input
+                    break
+                raise
+            if (
+                isinstance(item, (int, float)) and not isinstance(item, bool)
+                and _NUMBER_TAIL.match(buffer, end) is not None
+            ):
+                # A number at the end of the buffer may continue in the next chunk
+                break
+            items.append(item)
+            self._expect_value = False
+            self._empty = False
+            pos = end
+
+        self._buffer = buffer[pos:]
+        return items
+
+
+def iter_json_array(fp, chunk_size=64 * 1024):
+    """
+    ファイルオブジェクトからJSON配列を読み込み、要素を1件ずつ返すジェネレーター
+
+    ファイル全体をメモリに載せずに、chunk_size 文字ずつ読み込んで解析する。
+    """
+    parser = JSONArrayParser()
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        yield from parser.feed(chunk)
+        if parser.finished:
+            return
+    parser.close()
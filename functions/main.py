@@ -1,46 +1,131 @@
-import os
+import atexit
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
 from firebase_functions import https_fn
-from firebase_admin import initialize_app, firestore, credentials
-from flask import Flask, json, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from json.decoder import JSONDecodeError
 from flask_cors import CORS
 from datetime import datetime
 
-from firestore_insert_earthquakes import insert_earthquake_to_firestore
-
-# Try to import pytz, install if not available
-try:
-    import pytz
-except ImportError:
-    import subprocess
-    import sys
-    print("Installing pytz module...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "pytz"])
-    import pytz
 from earthquakes import get_earthquakes_mock
+import compression
+import instrumentation
+from firebase_client import LazyFirestoreClient, get_db
+from json_provider import JSONProvider
+from static_data import users_resource
+from timestamps import JST, parse_timestamp, timestamp_sort_key
+from users_index import UsersIndex
+from write_coalescer import SafetyWriteCoalescer
+from safety_logs import (
+    DEFAULT_PAGE_SIZE,
+    EXCLUDED_USER_ID,
+    MAX_PAGE_SIZE,
+    build_safety_logs_query,
+    get_latest_statuses,
+    get_users_with_latest_status,
+    iter_safety_logs,
+    next_page_cursor,
+    record_safety_responses,
+)
+from safety_feed import SafetyFeed
+from safety_summary import SUMMARY_TTL_SECONDS, CachedSafetySummary
+
+# Firestoreクライアント（Firebaseの初期化は最初のアクセス時に行う）
+# 読み書きしたドキュメント数をリクエストごとに数える
+db = instrumentation.InstrumentedFirestoreClient(LazyFirestoreClient())
+
+# users コレクションのインメモリインデックス（on_snapshotで最新状態を維持）
+users_index = UsersIndex(db)
+
+# user_connections の隣接インデックス（NumPyを読み込むため初回アクセス時に作成する）
+user_graph = None
+
+# 地震発生時の安否確認アラートの配信（通知基盤が無いため既定ではログに出力する）
+alert_pipeline = None
+
+# /safetyCheck/summary の集計（カウンターのシャードとユーザー数だけを読む）
+safety_summary_cache = CachedSafetySummary(db)
+
+# /safetyCheck/stream の購読者が共有する安否ログのリスナー（最初の購読時に起動する）
+safety_feed = SafetyFeed(db)
+
+# /safetyPost の書き込みを数ミリ秒単位でまとめてコミットする
+safety_write_coalescer = SafetyWriteCoalescer(db)
+
+# ストリーミング応答でユーザー名をまとめて付与する件数
+STREAM_CHUNK_SIZE = 100
+# /safetyCheck（JSON）でユーザー名をまとめて付与する件数（1ページを複数のチャンクに分けて並行に読む）
+PAGE_CHUNK_SIZE = 50
+
+# 安否ログの読み込みと並行してユーザーを読み込むワーカー（最初の利用時に作成し、終了時に停止する）
+USER_LOOKUP_WORKERS = 4
+user_lookup_executor = None
+# 読み込みを待っているチャンクの上限（超えたら先頭のチャンクを待って返してから安否ログを読み進める）
+MAX_PENDING_LOOKUPS = USER_LOOKUP_WORKERS * 2
+
+# /safetyPost/batch で一度に受け付ける安否情報の最大件数
+MAX_BATCH_REPORTS = 1000
+
+# まとめ書き込みの完了を待つ最大秒数
+SAFETY_POST_TIMEOUT_SECONDS = 10
+
+# /safetyCheck/stream の1接続の最大秒数（関数のタイムアウト前に閉じ、Last-Event-ID で再接続させる）
+SAFETY_STREAM_MAX_SECONDS = 50
+# 新着が無い間に送るコメント行の間隔（プロキシに接続を切られないようにする）
+SAFETY_STREAM_HEARTBEAT_SECONDS = 15
+# 切断後にブラウザが再接続するまでのミリ秒
+SAFETY_STREAM_RETRY_MILLISECONDS = 3000
+
+_lazy_init_lock = threading.Lock()
+
+
+def get_user_graph():
+    global user_graph
+    with _lazy_init_lock:
+        if user_graph is None:
+            from user_graph import CachedUserGraph
+            user_graph = CachedUserGraph(db)
+    return user_graph
+
+
+def get_user_lookup_executor():
+    global user_lookup_executor
+    with _lazy_init_lock:
+        if user_lookup_executor is None:
+            user_lookup_executor = ThreadPoolExecutor(max_workers=USER_LOOKUP_WORKERS, thread_name_prefix='user-lookup')
+            # Queued lookups are for responses that will never be sent
+            atexit.register(user_lookup_executor.shutdown, wait=False, cancel_futures=True)
+    return user_lookup_executor
+
+
+def get_alert_pipeline():
+    global alert_pipeline
+    with _lazy_init_lock:
+        if alert_pipeline is None:
+            from alert_pipeline import AlertPipeline
+            alert_pipeline = AlertPipeline(db)
+    return alert_pipeline
 
-# Firebase初期化 - Try to use service account if available
-try:
-    service_account_path = 'serviceAccountKey.json'
-    if os.path.exists(service_account_path):
-        print(f"Using service account: {service_account_path}")
-        cred = credentials.Certificate(service_account_path)
-        initialize_app(cred)
-    else:
-        print("Service account file not found, using default initialization")
-        initialize_app()
-except Exception as e:
-    print(f"Firebase initialization error: {str(e)}")
-    # Still try to initialize without credentials as fallback
-    initialize_app()
-
-# Firestoreクライアントの初期化
-db = firestore.client()
 
 # Flaskアプリケーションの作成
 app = Flask(__name__)
+app.json = JSONProvider(app)
 # すべてのルートでCORSを明示的に許可
 CORS(app, resources={r"/*": {"origins": "*"}})
+# ルート別のレイテンシ・Firestore読み書き件数の計測と Server-Timing ヘッダー
+instrumentation.init_app(app)
+# 1KB以上のJSONは Accept-Encoding に応じて br / gzip で圧縮する（ストリーミング応答は除く）
+compression.init_app(app)
+for name, help_text, key in (
+    ('users_index_hits', 'Users index lookups served from memory', 'hits'),
+    ('users_index_misses', 'Users index lookups that read Firestore', 'misses'),
+    ('users_index_indexed_users', 'Users mirrored by the snapshot listener', 'indexed_users'),
+    ('users_index_fallback_entries', 'Users held in the TTL fallback cache', 'fallback_entries'),
+):
+    instrumentation.registry.register_gauge(name, help_text, lambda key=key: users_index.stats()[key])
 
 
 # Flaskルートの定義
@@ -49,6 +134,12 @@ def home():
     return 'Hello from Flask on Firebase Functions!'
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition format
+    return Response(instrumentation.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/hello', methods=['GET'])
 def hello_api():
     name = request.args.get('name', 'World')
@@ -58,9 +149,8 @@ def hello_api():
 @app.route('/users', methods=['GET'])
 def get_users():
     try:
-        with open('mocks/users.json', 'r') as f:
-            user_data = json.load(f)
-            return jsonify(user_data=user_data)  # 再度確認：キーワード引数のみ
+        # Parsed and serialized once; answers If-None-Match with 304
+        return users_resource.response()
     except FileNotFoundError:
         return jsonify(error='User data not found'), 404
     except JSONDecodeError:
@@ -69,55 +159,200 @@ def get_users():
         return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
 
 
+def _attach_user_names(records, users_dict=None):
+    # Match names from the in-process users index instead of re-reading the collection
+    if users_dict is None:
+        users_dict = users_index.get_many(
+            record['user_id'] for record in records if record.get('user_id')
+        )
+
+    # Add user name to each safety record
+    for record in records:
+        user_id = record.get('user_id')
+        if user_id and user_id in users_dict:
+            # Add user name and any other relevant user data
+            record['user_name'] = users_dict[user_id].get('name', 'Unknown')
+            # You can add more user fields if needed
+            # record['user_email'] = users_dict[user_id].get('email')
+    return records
+
+
+def _iter_with_user_names(records, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    安否ログに chunk_size 件ずつユーザー名を付与して返すジェネレーター
+
+    各チャンクで初めて出てきたユーザーだけをワーカーで読み込み、その間に次のチャンクの安否ログを読み進める。
+    インデックスが全ユーザーをメモリ上に保持している間はその場で付与する。
+    読み込み待ちのチャンクが MAX_PENDING_LOOKUPS を超えたら、先頭のチャンクを返すまで読み進めない。
+    途中で閉じられた場合（ストリーミング中のクライアントの切断など）は、まだ始まっていない読み込みを取り消す。
+    """
+    users_dict = {}
+    requested = set()
+    # (chunk, future of the users first seen in it), in record order
+    pending = deque()
+
+    def submit(chunk):
+        user_ids = {record['user_id'] for record in chunk if record.get('user_id')} - requested
+        requested.update(user_ids)
+        if users_index.is_mirrored():
+            # Memory lookups are cheaper than a hop to the worker
+            future = Future()
+            future.set_result(users_index.get_many(user_ids))
+        else:
+            # The copied context keeps the request's Firestore counters visible to the worker
+            future = get_user_lookup_executor().submit(copy_context().run, users_index.get_many, user_ids)
+        pending.append((chunk, future))
+
+    def emit():
+        # Earlier chunks were emitted first, so every user this chunk needs is already in users_dict
+        chunk, future = pending.popleft()
+        users_dict.update(future.result())
+        return _attach_user_names(chunk, users_dict)
+
+    try:
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                submit(chunk)
+                chunk = []
+                # Emit finished chunks without blocking the read of the next one
+                while pending and pending[0][1].done():
+                    yield from emit()
+                # Slow lookups must not let the whole result pile up in memory
+                while len(pending) > MAX_PENDING_LOOKUPS:
+                    yield from emit()
+        if chunk:
+            submit(chunk)
+        while pending:
+            yield from emit()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+@app.route('/users/<user_id>/network-status', methods=['GET'])
+def get_network_status(user_id):
+    from user_graph import MAX_HOPS
+
+    try:
+        depth = int(request.args.get('depth', 1))
+    except ValueError:
+        return jsonify(error='depth must be an integer'), 400
+    if not 1 <= depth <= MAX_HOPS:
+        return jsonify(error=f'depth must be between 1 and {MAX_HOPS}'), 400
+
+    try:
+        graph = get_user_graph().get()
+        if user_id not in graph and not users_index.get_many([user_id]):
+            return jsonify(error=f'User not found: {user_id}'), 404
+
+        hops = graph.k_hop(user_id, depth)
+        latest_statuses = get_latest_statuses(db, list(hops))
+        users_dict = users_index.get_many(hops)
+
+        neighbors = []
+        for neighbor_id, hop in hops.items():
+            latest = latest_statuses.get(neighbor_id)
+            if latest is not None:
+                latest.pop('log_id', None)
+            neighbors.append({
+                'id': neighbor_id,
+                'name': users_dict.get(neighbor_id, {}).get('name'),
+                'hops': hop,
+                'latest_status': latest,
+            })
+        # Closest connections that have not checked in yet come first
+        neighbors.sort(key=lambda x: (x['latest_status'] is not None, x['hops'], x['id']))
+
+        checked_in = sum(1 for neighbor in neighbors if neighbor['latest_status'] is not None)
+        return jsonify(
+            user_id=user_id,
+            depth=depth,
+            neighbors=neighbors,
+            checked_in=checked_in,
+            unconfirmed=len(neighbors) - checked_in
+        )
+
+    except Exception as e:
+        print(f"Error in get_network_status: {str(e)}")
+        return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
+
+
 @app.route('/safetyCheck', methods=['GET'])
 def safety_check():
     try:
-        # Get safety response data from Firestore
-        safety_collection = db.collection('safety_response_logs')
-        safety_docs = safety_collection.stream()
-
-        # Convert to list of dictionaries
-        all_data = []
-        for doc in safety_docs:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            all_data.append(data)
-
-        # Filter out records where user_id is USR01235
-        filtered_data = [
-            record for record in all_data
-            if record.get('user_id') != 'USR01235'
-        ]
-
-        # Get user data from Firestore to match names
-        users_collection = db.collection('users')
-        users_docs = users_collection.stream()
-
-        # Create a dictionary of user_id to user data for quick lookup
-        users_dict = {}
-        for user_doc in users_docs:
-            user_data = user_doc.to_dict()
-            user_id = user_data.get('user_id')
-            if user_id:
-                users_dict[user_id] = user_data
-
-        # Add user name to each safety record
-        for record in filtered_data:
-            user_id = record.get('user_id')
-            if user_id and user_id in users_dict:
-                # Add user name and any other relevant user data
-                record['user_name'] = users_dict[user_id].get('name', 'Unknown')
-                # You can add more user fields if needed
-                # record['user_email'] = users_dict[user_id].get('email')
-
-        # Sort by timestamp in descending order
-        sorted_data = sorted(
-            filtered_data,
-            key=lambda x: x.get('timestamp', ''),
-            reverse=True
-        )
+        response_format = request.args.get('format', 'json')
+        if response_format not in ('json', 'ndjson', 'json-stream'):
+            return jsonify(error='format must be one of json, ndjson, json-stream'), 400
+        streaming = response_format != 'json'
+
+        # Parse paging and filter parameters
+        # Streaming responses are unbounded unless a limit is given explicitly
+        limit = None if streaming else DEFAULT_PAGE_SIZE
+        if 'limit' in request.args:
+            try:
+                limit = int(request.args['limit'])
+            except ValueError:
+                return jsonify(error='limit must be an integer'), 400
+            if limit < 1:
+                return jsonify(error='limit must be a positive integer'), 400
+            if not streaming:
+                limit = min(limit, MAX_PAGE_SIZE)
+
+        cursor = request.args.get('cursor')
+        status = request.args.get('status')
+        since = request.args.get('since')
+
+        # Only reports made after the given earthquake, as an indexed range on timestamp
+        after = None
+        earthquake_id = request.args.get('earthquake_id')
+        if earthquake_id:
+            earthquake_doc = db.collection('earthquakes').document(earthquake_id).get()
+            if not earthquake_doc.exists:
+                return jsonify(error=f'Earthquake not found: {earthquake_id}'), 404
+            after = parse_timestamp(earthquake_doc.to_dict().get('time'))
+            if after is None:
+                return jsonify(error=f'Earthquake has no valid time: {earthquake_id}'), 500
+
+        # Filtering and ordering run inside Firestore, one page at a time
+        # The page size is applied while reading, so demo-account logs skipped on the way are refilled
+        try:
+            query = build_safety_logs_query(
+                db,
+                status=status,
+                since=since,
+                after=after,
+                cursor=cursor,
+                limit=None
+            )
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
 
-        return jsonify(user_data=sorted_data)
+        page_state = {}
+        records = iter_safety_logs(query, page_state, limit)
+
+        if response_format == 'ndjson':
+            def generate_ndjson():
+                for record in _iter_with_user_names(records):
+                    yield app.json.dumps(record) + '\n'
+
+            return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+
+        if response_format == 'json-stream':
+            def generate_json_array():
+                yield '{"user_data":['
+                for index, record in enumerate(_iter_with_user_names(records)):
+                    yield (',' if index else '') + app.json.dumps(record)
+                next_cursor = next_page_cursor(page_state, limit)
+                yield '],"next_cursor":' + app.json.dumps(next_cursor) + '}'
+
+            return Response(stream_with_context(generate_json_array()), mimetype='application/json')
+
+        filtered_data = list(_iter_with_user_names(records, PAGE_CHUNK_SIZE))
+        next_cursor = next_page_cursor(page_state, limit)
+
+        return jsonify(user_data=filtered_data, next_cursor=next_cursor)
 
     except Exception as e:
         import traceback
@@ -127,6 +362,143 @@ def safety_check():
         return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
 
 
+@app.route('/safetyCheck/latest', methods=['GET'])
+def safety_check_latest():
+    try:
+        # One document per user instead of the whole report history
+        latest_statuses = get_latest_statuses(db)
+
+        records = []
+        for user_id, data in latest_statuses.items():
+            if user_id == EXCLUDED_USER_ID:
+                continue
+            data['id'] = data.pop('log_id', user_id)
+            records.append(data)
+
+        _attach_user_names(records)
+
+        sorted_data = sorted(
+            records,
+            key=lambda x: timestamp_sort_key(x.get('timestamp')),
+            reverse=True
+        )
+
+        return jsonify(user_data=sorted_data)
+
+    except Exception as e:
+        print(f"Error in safety_check_latest: {str(e)}")
+        return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
+
+
+@app.route('/safetyCheck/stream', methods=['GET'])
+def stream_safety_reports():
+    # EventSource sends Last-Event-ID on reconnect; the query parameter covers the first connection
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        safety_feed.start()
+    except RuntimeError as e:
+        print(f"Error in stream_safety_reports: {str(e)}")
+        return jsonify(error='Live updates are unavailable; poll /safetyCheck instead'), 503
+    event_id, reset = safety_feed.resolve(last_event_id)
+
+    def generate_events():
+        # "reset" means the client missed events and should reload /safetyCheck
+        yield f"retry: {SAFETY_STREAM_RETRY_MILLISECONDS}\n"
+        yield f"id: {event_id}\nevent: {'reset' if reset else 'ready'}\ndata: {{}}\n\n"
+
+        current_id = event_id
+        deadline = time.monotonic() + SAFETY_STREAM_MAX_SECONDS
+        try:
+            while time.monotonic() < deadline:
+                timeout = min(SAFETY_STREAM_HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0))
+                events, current_id, missed = safety_feed.wait(current_id, timeout)
+                if missed:
+                    yield f"id: {current_id}\nevent: reset\ndata: {{}}\n\n"
+                    continue
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                # Records in the feed are shared between subscribers
+                records = _attach_user_names([dict(record) for _, record in events])
+                for (record_event_id, _), record in zip(events, records):
+                    yield f"id: {record_event_id}\nevent: safety_report\ndata: {app.json.dumps(record)}\n\n"
+        except RuntimeError as e:
+            print(f"Error in stream_safety_reports: {str(e)}")
+            yield f"event: error\ndata: {app.json.dumps({'error': str(e)})}\n\n"
+
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/safetyCheck/summary', methods=['GET'])
+def safety_check_summary():
+    try:
+        response = jsonify(safety_summary_cache.get())
+        response.headers['Cache-Control'] = f'public, max-age={SUMMARY_TTL_SECONDS}'
+        return response
+
+    except Exception as e:
+        print(f"Error in safety_check_summary: {str(e)}")
+        return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
+
+
+@app.route('/risk/<earthquake_id>', methods=['GET'])
+def get_risk_assessment(earthquake_id):
+    # Deferred: the OpenAI SDK is the slowest import in the app
+    from risk_cache import consult_chatgpt_cached
+
+    try:
+        earthquake_doc = db.collection('earthquakes').document(earthquake_id).get()
+        if not earthquake_doc.exists:
+            return jsonify(error=f'Earthquake not found: {earthquake_id}'), 404
+
+        earthquake_info = earthquake_doc.to_dict()
+        earthquake_info['id'] = earthquake_id
+
+        # Only users whose address or latest report changed since the last run are re-evaluated
+        users = get_users_with_latest_status(db)
+        assessments = consult_chatgpt_cached(earthquake_info, users, db=db)
+
+        return jsonify(earthquake_id=earthquake_id, assessments=assessments)
+
+    except Exception as e:
+        print(f"Error in get_risk_assessment: {str(e)}")
+        return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
+
+
+@app.route('/risk/<earthquake_id>/stream', methods=['GET'])
+def stream_risk_assessment(earthquake_id):
+    from chatgpt import consult_chatgpt_stream
+
+    earthquake_doc = db.collection('earthquakes').document(earthquake_id).get()
+    if not earthquake_doc.exists:
+        return jsonify(error=f'Earthquake not found: {earthquake_id}'), 404
+
+    earthquake_info = earthquake_doc.to_dict()
+    earthquake_info['id'] = earthquake_id
+    users = get_users_with_latest_status(db)
+
+    def generate_events():
+        # Each assessment is pushed as soon as its JSON object closes in the model output
+        try:
+            for assessment in consult_chatgpt_stream(earthquake_info, users):
+                yield f"event: assessment\ndata: {app.json.dumps(assessment)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Error in stream_risk_assessment: {str(e)}")
+            yield f"event: error\ndata: {app.json.dumps({'error': str(e)})}\n\n"
+
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/earthquakes', methods=['GET'])
 def get_earthquakes():
     return get_earthquakes_mock()
@@ -134,17 +506,47 @@ def get_earthquakes():
 
 @app.route('/earthquakes/occur', methods=['POST'])
 def occur_earthquake():
-    insert_earthquake_to_firestore(
+    from firestore_insert_earthquakes import insert_earthquake_to_firestore
+
+    # Initialize Firebase the same way as every other route before the helper looks for an app
+    get_db()
+    earthquake_info = insert_earthquake_to_firestore(
         epicenter="東京都千代田区外神田1-1-8",
         intensity="震度7",
         magnitude=7.0
     )
+    if earthquake_info is not None:
+        # Selecting and alerting affected users runs in the background, off the request path
+        get_alert_pipeline().start(earthquake_info)
     return jsonify({
         'success': True,
-        'message': '地震情報が正常に登録されました'
+        'message': '地震情報が正常に登録されました',
+        'earthquake_id': earthquake_info['id'] if earthquake_info else None
     }), 200
 
 
+@app.route('/earthquakes/<earthquake_id>/alerts', methods=['GET'])
+def get_earthquake_alerts(earthquake_id):
+    from alert_pipeline import get_delivery_summary
+
+    try:
+        return jsonify(earthquake_id=earthquake_id, deliveries=get_delivery_summary(db, earthquake_id))
+    except Exception as e:
+        print(f"Error in get_earthquake_alerts: {str(e)}")
+        return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
+
+
+@app.route('/earthquakes/<earthquake_id>/alerts/resume', methods=['POST'])
+def resume_earthquake_alerts(earthquake_id):
+    # Delivers what a background run left pending, inside the request so it is not CPU-throttled
+    try:
+        result = get_alert_pipeline().resume(earthquake_id)
+        return jsonify(earthquake_id=earthquake_id, **result)
+    except Exception as e:
+        print(f"Error in resume_earthquake_alerts: {str(e)}")
+        return jsonify(error=f'An unexpected error occurred: {str(e)}'), 500
+
+
 @app.route('/safetyPost', methods=['POST'])
 def safety_post():
     try:
@@ -167,9 +569,8 @@ def safety_post():
                 'error': '必須フィールドが不足しています (user_id, location, status)'
             }), 400
 
-        # Get current time in JST timezone
-        jst = pytz.timezone('Asia/Tokyo')
-        current_time = datetime.now(jst).isoformat()
+        # Stored as a native Firestore timestamp; responses render it in JST
+        current_time = datetime.now(JST)
 
         safety_data = {
             'user_id': "USR01235",
@@ -178,8 +579,9 @@ def safety_post():
             'location': "東京都千代田区外神田1-1-8"
         }
 
-        # Add data to Firestore
-        db.collection('safety_response_logs').add(safety_data)
+        # Add data to Firestore together with the user's latest status;
+        # concurrent posts are committed together by the coalescer
+        safety_write_coalescer.submit(safety_data).result(timeout=SAFETY_POST_TIMEOUT_SECONDS)
 
         return jsonify({
             'success': True,
@@ -194,6 +596,80 @@ def safety_post():
         }), 500
 
 
+@app.route('/safetyPost/batch', methods=['POST'])
+def safety_post_batch():
+    try:
+        request_data = request.get_json()
+
+        # Accept either a bare array or {"reports": [...]}
+        if isinstance(request_data, dict):
+            request_data = request_data.get('reports')
+
+        if not request_data or not isinstance(request_data, list):
+            return jsonify({
+                'success': False,
+                'error': 'リクエストデータが見つかりません'
+            }), 400
+
+        if len(request_data) > MAX_BATCH_REPORTS:
+            return jsonify({
+                'success': False,
+                'error': f'一度に送信できる安否情報は{MAX_BATCH_REPORTS}件までです'
+            }), 400
+
+        for index, report in enumerate(request_data):
+            if not isinstance(report, dict) or not report.get('user_id') or not report.get('status'):
+                return jsonify({
+                    'success': False,
+                    'error': f'必須フィールドが不足しています (user_id, status): {index}件目'
+                }), 400
+            if not isinstance(report['user_id'], str):
+                return jsonify({
+                    'success': False,
+                    'error': f'user_id は文字列で指定してください: {index}件目'
+                }), 400
+
+        # Reports for unknown users would be counted as answers in /safetyCheck/summary
+        user_ids = {report['user_id'] for report in request_data}
+        unknown_user_ids = user_ids - users_index.get_many(user_ids).keys()
+        if unknown_user_ids:
+            # The index may still hold a miss cached before the user was created
+            users_collection = db.collection('users')
+            snapshots = db.get_all([users_collection.document(user_id) for user_id in unknown_user_ids])
+            unknown_user_ids -= {snapshot.id for snapshot in snapshots if snapshot.exists}
+        unknown_user_ids = sorted(unknown_user_ids)
+        if unknown_user_ids:
+            return jsonify({
+                'success': False,
+                'error': f'登録されていないユーザーです: {", ".join(unknown_user_ids[:10])}'
+            }), 400
+
+        current_time = datetime.now(JST)
+        safety_records = []
+        for report in request_data:
+            safety_records.append({
+                'user_id': report['user_id'],
+                'timestamp': current_time,
+                'status': report['status'],
+                'location': report.get('location', '')
+            })
+
+        # Committed in as few transactions as the write limit allows
+        log_ids = record_safety_responses(db, safety_records)
+
+        return jsonify({
+            'success': True,
+            'message': f'{len(log_ids)}件の安否情報が正常に記録されました',
+            'ids': log_ids
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'予期しないエラーが発生しました: {str(e)}'
+        }), 500
+
+
 # Firebase Functionsのエントリーポイント
 @https_fn.on_request()
 def api(req: https_fn.Request) -> https_fn.Response:
@@ -250,7 +726,7 @@ if __name__ == "__main__":
             # Sort by timestamp
             sorted_data = sorted(
                 filtered_data,
-                key=lambda x: x.get('timestamp', ''),
+                key=lambda x: timestamp_sort_key(x.get('timestamp')),
                 reverse=True
             )
 
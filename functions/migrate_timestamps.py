@@ -0,0 +1,88 @@
+"""
+既存ドキュメントのタイムスタンプを文字列からFirestoreのタイムスタンプに変換する移行スクリプト
+
+コレクションをドキュメントID順にページ単位で読み込み（全件をメモリに載せない）、
+文字列のタイムスタンプを持つドキュメントだけを1ページ1バッチの update で書き換える。
+変換済みのドキュメントには書き込まないため、途中で失敗しても再実行すれば続きから変換される。
+
+使い方: python migrate_timestamps.py [コレクション名...]
+（省略時は timestamps.TIMESTAMP_FIELDS のすべてのコレクション）
+"""
+import sys
+
+from firebase_client import get_db
+from timestamps import TIMESTAMP_FIELDS, normalize_timestamps
+
+# Firestoreの1バッチ500書き込み制限に収まる1ページの件数
+DEFAULT_PAGE_SIZE = 400
+
+
+def migrate_collection(db, collection_name, fields, page_size=DEFAULT_PAGE_SIZE):
+    """
+    collection_name の fields を変換し、(読み込んだ件数, 変換した件数) を返す
+    """
+    scanned_count = 0
+    migrated_count = 0
+    last_snapshot = None
+
+    while True:
+        query = db.collection(collection_name).select(list(fields)).limit(page_size)
+        if last_snapshot is not None:
+            query = query.start_after(last_snapshot)
+        snapshots = list(query.stream())
+        if not snapshots:
+            break
+
+        batch = db.batch()
+        page_migrated_count = 0
+        for snapshot in snapshots:
+            data = snapshot.to_dict() or {}
+            normalized = normalize_timestamps(data, fields)
+            if normalized is data:
+                continue
+            batch.update(snapshot.reference, {
+                field: normalized[field]
+                for field in fields
+                if normalized.get(field) is not data.get(field)
+            })
+            page_migrated_count += 1
+        if page_migrated_count:
+            batch.commit()
+
+        scanned_count += len(snapshots)
+        migrated_count += page_migrated_count
+        last_snapshot = snapshots[-1]
+        print(f"進捗: {collection_name} {scanned_count}件を確認、{migrated_count}件を変換")
+
+        if len(snapshots) < page_size:
+            break
+
+    return scanned_count, migrated_count
+
+
+def migrate_timestamps(db, collection_names=None):
+    """
+    指定したコレクション（省略時はすべて）のタイムスタンプを変換し、{コレクション名: 変換した件数} を返す
+    """
+    results = {}
+    for collection_name in collection_names or TIMESTAMP_FIELDS:
+        _, migrated_count = migrate_collection(db, collection_name, TIMESTAMP_FIELDS[collection_name])
+        results[collection_name] = migrated_count
+    return results
+
+
+if __name__ == "__main__":
+    collection_names = sys.argv[1:]
+    unknown = [name for name in collection_names if name not in TIMESTAMP_FIELDS]
+    if unknown:
+        print(f"エラー: 対応していないコレクションです - {', '.join(unknown)}")
+        print(f"対応しているコレクション: {', '.join(TIMESTAMP_FIELDS)}")
+        sys.exit(1)
+
+    try:
+        for name, count in migrate_timestamps(get_db(), collection_names).items():
+            print(f"成功: {name} の{count}件のタイムスタンプを変換しました")
+    except Exception as e:
+        print(f"エラー: 予期しないエラーが発生しました - {str(e)}")
+        print("再実行すると変換済みのドキュメントを読み飛ばして続きから変換します")
+        sys.exit(1)
@@ -0,0 +1,107 @@
+"""
+ChatGPTに送るプロンプトのコンパクトな符号化とトークン数の見積もり
+
+アカウント情報は日本語をエスケープせずUTF-8のまま、1アカウント1行のJSON配列（列形式）で表し、
+安否情報は最新の1件だけを含める。tiktoken がインストールされていればトークン数を正確に数え、
+無ければ文字種からの概算を使う。
+"""
+import json
+from datetime import datetime
+
+from risk_scoring import user_key
+from timestamps import JST, parse_timestamp
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 1回の問い合わせの入力（システムプロンプトを含む）トークン数の上限
+DEFAULT_PROMPT_TOKEN_BUDGET = 8000
+
+# アカウント情報の列（system_prompt の「入力データ形式」と一致させること）
+USER_COLUMNS = ['id', 'address', 'timestamp', 'status', 'location']
+EARTHQUAKE_FIELDS = ['time', 'epicenter', 'intensity', 'magnitude']
+
+_encodings = {}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _format_time(value):
+    # Firestore timestamps come back in UTC; the prompt uses Japan time
+    if isinstance(value, datetime):
+        return parse_timestamp(value).astimezone(JST).strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def encode_earthquake(earthquake_info):
+    return _dumps({field: _format_time(earthquake_info.get(field)) for field in EARTHQUAKE_FIELDS})
+
+
+def encode_user_row(user):
+    history = user.get('safety_history') or []
+    latest = history[-1] if history else {}
+    return _dumps([
+        user_key(user),
+        user.get('address'),
+        _format_time(latest.get('timestamp')),
+        latest.get('status'),
+        latest.get('location'),
+    ])
+
+
+def encode_user_rows(user_rows):
+    """
+    encode_user_row で符号化した行を、先頭に列名の行を付けて改行区切りで連結する
+    """
+    return '\n'.join([_dumps(USER_COLUMNS)] + list(user_rows))
+
+
+def _get_encoding(model):
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('o200k_base')
+        _encodings[model] = encoding
+    return encoding
+
+
+def count_tokens(text, model='gpt-4o'):
+    """
+    text のトークン数を返す（tiktoken が無い場合は ASCII 4文字で1トークン、それ以外は1文字1トークンの概算）
+    """
+    if tiktoken is not None:
+        return len(_get_encoding(model).encode(text))
+    ascii_chars = sum(1 for char in text if char < '\x80')
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def split_by_token_budget(users, fixed_tokens, budget=DEFAULT_PROMPT_TOKEN_BUDGET, max_users=None, model='gpt-4o'):
+    """
+    各グループのプロンプトが budget トークン以内（かつ max_users 人以内）に収まるようにユーザーを分割する
+
+    fixed_tokens はユーザー行以外（システムプロンプト・指示文・地震情報・列名の行）のトークン数。
+    返り値は (ユーザーのリスト, 符号化済みの行のリスト) のタプルのリスト。
+    1行だけで予算を超えるユーザーは単独のグループにする。
+    """
+    groups = []
+    group_users, group_rows, group_tokens = [], [], fixed_tokens
+    for user in users:
+        row = encode_user_row(user)
+        # +1 for the newline separating rows
+        row_tokens = count_tokens(row, model) + 1
+        full = max_users is not None and len(group_users) >= max_users
+        if group_users and (full or group_tokens + row_tokens > budget):
+            groups.append((group_users, group_rows))
+            group_users, group_rows, group_tokens = [], [], fixed_tokens
+        group_users.append(user)
+        group_rows.append(row)
+        group_tokens += row_tokens
+    if group_users:
+        groups.append((group_users, group_rows))
+    return groups
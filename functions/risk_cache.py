@@ -0,0 +1,169 @@
+"""
+危険度評価結果のインクリメンタルキャッシュ
+
+(地震ID, ユーザーID) ごとに住所と最新の安否情報のハッシュと評価結果を保持し、
+前回から入力が変わったユーザーだけをChatGPTに送る。
+結果はメモリ上のLRUと Firestore の risk_assessments/{earthquake_id}/users/{user_id} に保存する。
+評価結果に含まれなかったユーザーは危険度1として NOT_AT_RISK_TTL の間だけ再利用し、その後は再評価する。
+IDの無いユーザーはキャッシュしない。
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from chatgpt import consult_chatgpt_sharded
+from risk_scoring import user_key
+from timestamps import JST, parse_timestamp
+
+RISK_ASSESSMENTS_COLLECTION = 'risk_assessments'
+ASSESSED_USERS_SUBCOLLECTION = 'users'
+
+LRU_MAX_ENTRIES = 200000
+
+# Firestoreの1バッチ500書き込み制限
+MAX_WRITES_PER_BATCH = 500
+
+# 評価結果に含まれなかった（危険度レベル1以下の）ユーザーとして保存する値
+NOT_AT_RISK_STATUS = 1
+
+# 評価結果に含まれなかったユーザーを危険度1として再利用する期間
+# （モデルが回答から漏らしたユーザーも含まれるため、入力が変わらなくても再評価する）
+NOT_AT_RISK_TTL = timedelta(minutes=10)
+
+
+class AssessmentLRU:
+    def __init__(self, max_entries=LRU_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+_lru = AssessmentLRU()
+
+
+def input_hash(user):
+    """
+    評価結果に影響するユーザー入力（住所と最新の安否情報）のハッシュ
+    """
+    history = user.get('safety_history') or []
+    latest = history[-1] if history else None
+    payload = json.dumps(
+        [user.get('address'), latest],
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _assessed_users(db, earthquake_id):
+    return (
+        db.collection(RISK_ASSESSMENTS_COLLECTION)
+        .document(earthquake_id)
+        .collection(ASSESSED_USERS_SUBCOLLECTION)
+    )
+
+
+def _is_reusable(entry, expected_hash, now):
+    # entry is (input_hash, status, expires_at); expires_at is None for statuses the model returned
+    if entry is None or entry[0] != expected_hash:
+        return False
+    if entry[2] is None:
+        return True
+    expires_at = parse_timestamp(entry[2])
+    return expires_at is not None and expires_at > now
+
+
+def consult_chatgpt_cached(earthquake_info, users, db=None, evaluate=consult_chatgpt_sharded, **kwargs):
+    """
+    キャッシュ済みの評価を再利用し、入力が変わったユーザーだけを evaluate で評価する
+
+    返り値は consult_chatgpt と同じ危険度レベル2以上の [{"id", "status"}]。
+    db を指定した場合は Firestore にも評価結果を保存・参照する。
+    """
+    earthquake_id = earthquake_info['id']
+    now = datetime.now(JST)
+
+    statuses = {}
+    hashes = {}
+    misses = []
+    for user in users:
+        user_id = user.get('id')
+        if not user_id:
+            misses.append(user)
+            continue
+        hashes[user_id] = input_hash(user)
+        cached = _lru.get((earthquake_id, user_id))
+        if _is_reusable(cached, hashes[user_id], now):
+            statuses[user_id] = cached[1]
+        else:
+            misses.append(user)
+
+    cacheable = [user for user in misses if user.get('id')]
+    if cacheable and db is not None:
+        collection = _assessed_users(db, earthquake_id)
+        snapshots = db.get_all([collection.document(user['id']) for user in cacheable])
+        stored = {snapshot.id: snapshot.to_dict() for snapshot in snapshots if snapshot.exists}
+
+        found = set()
+        for user in cacheable:
+            user_id = user['id']
+            data = stored.get(user_id)
+            entry = None if data is None else (data.get('input_hash'), data.get('status'), data.get('expires_at'))
+            if _is_reusable(entry, hashes[user_id], now):
+                statuses[user_id] = entry[1]
+                _lru.put((earthquake_id, user_id), entry)
+                found.add(user_id)
+        misses = [user for user in misses if user.get('id') not in found]
+
+    if misses:
+        print(f"{len(users)}人中{len(misses)}人の入力が変更されたため再評価します")
+        results = {result['id']: result['status'] for result in evaluate(earthquake_info, misses, **kwargs)}
+
+        new_entries = {}
+        for user in misses:
+            key = user_key(user)
+            if key in results:
+                entry = (hashes.get(key), results[key], None)
+            else:
+                # Either level 1 or left out by the model; re-checked once the TTL passes
+                entry = (hashes.get(key), NOT_AT_RISK_STATUS, now + NOT_AT_RISK_TTL)
+            statuses[key] = entry[1]
+            if user.get('id'):
+                new_entries[user['id']] = entry
+                _lru.put((earthquake_id, user['id']), entry)
+
+        if db is not None:
+            collection = _assessed_users(db, earthquake_id)
+            items = list(new_entries.items())
+            for start in range(0, len(items), MAX_WRITES_PER_BATCH):
+                batch = db.batch()
+                for user_id, (hash_value, status, expires_at) in items[start:start + MAX_WRITES_PER_BATCH]:
+                    batch.set(collection.document(user_id), {
+                        'input_hash': hash_value,
+                        'status': status,
+                        'expires_at': expires_at,
+                    })
+                batch.commit()
+
+    return [
+        {'id': key, 'status': status}
+        for key, status in statuses.items()
+        if status >= 2
+    ]
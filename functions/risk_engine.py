@@ -0,0 +1,153 @@
+"""
+全ユーザーの危険度をNumPyで一括評価するリスクエンジン
+
+consult_chatgpt と同じ [{"id", "status"}] 形式で結果を返すため、呼び出し側はそのまま切り替えられる。
+推定震度は距離帯ごとの範囲の上限（安全側）を採用する。
+都道府県・震央地域の代表点しか分からない位置は、実際の位置が最も近い場合の距離で推定する。
+"""
+import numpy as np
+
+from geocoding import geocode, may_share_municipality, uncertainty_km
+from risk_scoring import (
+    DANGER_STATUSES,
+    DISTANCE_BANDS_KM,
+    INTENSITY_3,
+    INTENSITY_SCALE,
+    SAFE_STATUSES,
+    SAME_MUNICIPALITY_DROP,
+    danger_level,
+    magnitude_factor,
+    parse_intensity,
+    parse_time,
+    unconfirmed_level,
+)
+
+# 地震発生後の最新の安否情報の区分
+STATUS_UNCONFIRMED = 0
+STATUS_SAFE = 1
+STATUS_DANGER = 2
+
+EARTH_RADIUS_KM = 6371.0
+
+# 推定震度（INTENSITY_SCALEの添字）から危険度レベルへの変換表
+_UNCONFIRMED_LEVELS = np.array([unconfirmed_level(i) for i in range(len(INTENSITY_SCALE))], dtype=np.int8)
+_DANGER_LEVELS = np.array([danger_level(i) for i in range(len(INTENSITY_SCALE))], dtype=np.int8)
+
+
+def haversine_km(lat, lon, epicenter_lat, epicenter_lon):
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    epicenter_lat = np.radians(epicenter_lat)
+    epicenter_lon = np.radians(epicenter_lon)
+    a = (
+        np.sin((lat - epicenter_lat) / 2) ** 2
+        + np.cos(lat) * np.cos(epicenter_lat) * np.sin((lon - epicenter_lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def estimate_intensities(earthquake_info, lats, lons, same_municipality=None, uncertainties=None):
+    """
+    各ユーザー位置の推定震度（INTENSITY_SCALEの添字）を配列で返す
+
+    uncertainties は各位置の代表点と実際の位置の距離の上限（km）の配列（省略時は0）。
+    """
+    max_intensity = parse_intensity(earthquake_info.get('intensity'))
+    epicenter = geocode(earthquake_info.get('epicenter'))
+    if max_intensity is None or epicenter is None:
+        raise ValueError(f"震源地または震度を解釈できません: {earthquake_info}")
+
+    distances = haversine_km(lats, lons, epicenter.lat, epicenter.lon) - uncertainty_km(epicenter)
+    if uncertainties is not None:
+        distances = distances - uncertainties
+    distances = np.maximum(distances, 0.0)
+    effective_distances = distances / magnitude_factor(earthquake_info.get('magnitude'))
+
+    # Beyond the last band the estimate is capped at 震度3
+    intensities = np.full(distances.shape, min(max_intensity, INTENSITY_3), dtype=np.int8)
+    for limit_km, (min_drop, _) in reversed(DISTANCE_BANDS_KM):
+        intensities[effective_distances <= limit_km] = max(max_intensity - min_drop, 0)
+    if same_municipality is not None:
+        intensities[same_municipality] = max(max_intensity - SAME_MUNICIPALITY_DROP[0], 0)
+    return intensities
+
+
+def compute_levels(earthquake_info, lats, lons, status_codes, same_municipality=None, uncertainties=None):
+    """
+    全ユーザーの危険度レベル（0〜5、0は地震後に安全と報告済み）を int8 の配列で返す
+
+    lats / lons は緯度経度、status_codes は STATUS_* の配列、
+    same_municipality は震源地と同じ市区町村にいる可能性があるかの真偽値配列、
+    uncertainties は代表点と実際の位置の距離の上限（km）の配列（どちらも省略可）。
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    status_codes = np.asarray(status_codes, dtype=np.int8)
+
+    intensities = estimate_intensities(earthquake_info, lats, lons, same_municipality, uncertainties)
+    levels = np.where(
+        status_codes == STATUS_DANGER,
+        _DANGER_LEVELS[intensities],
+        _UNCONFIRMED_LEVELS[intensities],
+    )
+    levels[status_codes == STATUS_SAFE] = 0
+    return levels
+
+
+def assess_population(earthquake_info, user_ids, lats, lons, status_codes, same_municipality=None, uncertainties=None):
+    """
+    危険度レベル2以上のユーザーを consult_chatgpt と同じ [{"id", "status"}] 形式で返す
+    """
+    levels = compute_levels(earthquake_info, lats, lons, status_codes, same_municipality, uncertainties)
+    flagged = np.flatnonzero(levels >= 2)
+    user_ids = np.asarray(user_ids, dtype=object)
+    return [
+        {'id': user_id, 'status': int(level)}
+        for user_id, level in zip(user_ids[flagged].tolist(), levels[flagged].tolist())
+    ]
+
+
+def build_population_arrays(earthquake_info, users):
+    """
+    consult_chatgpt 形式のユーザーリストから assess_population の入力配列を作成する
+
+    住所の位置が推定できないユーザーは除外し、
+    (user_ids, lats, lons, status_codes, same_municipality, uncertainties, 除外したユーザー) を返す。
+    """
+    quake_time = parse_time(earthquake_info.get('time'))
+    epicenter = geocode(earthquake_info.get('epicenter'))
+
+    user_ids, lats, lons, status_codes, same_municipality, uncertainties, unlocated = [], [], [], [], [], [], []
+    for user in users:
+        location = geocode(user.get('address'))
+        if location is None:
+            unlocated.append(user)
+            continue
+
+        status_code = STATUS_UNCONFIRMED
+        history = user.get('safety_history') or []
+        if history:
+            latest = history[-1]
+            reported_time = parse_time(latest.get('timestamp'))
+            if quake_time is not None and reported_time is not None and reported_time > quake_time:
+                if latest.get('status') in SAFE_STATUSES:
+                    status_code = STATUS_SAFE
+                elif latest.get('status') in DANGER_STATUSES:
+                    status_code = STATUS_DANGER
+
+        user_ids.append(user.get('id', user.get('name')))
+        lats.append(location.lat)
+        lons.append(location.lon)
+        status_codes.append(status_code)
+        same_municipality.append(may_share_municipality(location, epicenter))
+        uncertainties.append(uncertainty_km(location))
+
+    return (
+        user_ids,
+        np.array(lats, dtype=np.float64),
+        np.array(lons, dtype=np.float64),
+        np.array(status_codes, dtype=np.int8),
+        np.array(same_municipality, dtype=bool),
+        np.array(uncertainties, dtype=np.float64),
+        unlocated,
+    )
@@ -0,0 +1,208 @@
+"""
+system_prompt の評価基準をローカルで適用する危険度の事前スコアリング
+
+距離帯・マグニチュード・地震後の安否情報から危険度レベル（1〜5）の取りうる範囲を求め、
+範囲が1つのレベルに定まるユーザーはChatGPTに送らずに判定する。
+"""
+import math
+import unicodedata
+
+from geocoding import LEVEL_MUNICIPALITY, geocode, may_share_municipality, uncertainty_km
+from timestamps import parse_timestamp as parse_time
+
+# 気象庁震度階級（0〜7）を順序尺度に変換する
+INTENSITY_SCALE = ['0', '1', '2', '3', '4', '5弱', '5強', '6弱', '6強', '7']
+INTENSITY_3 = INTENSITY_SCALE.index('3')
+INTENSITY_4 = INTENSITY_SCALE.index('4')
+INTENSITY_5_UPPER = INTENSITY_SCALE.index('5強')
+INTENSITY_6_UPPER = INTENSITY_SCALE.index('6強')
+
+# 震源地からの距離帯ごとの (最大震度からの低下段階の最小, 最大)
+# 同一市区町村内は「最大震度に近い値」として0〜1段階の低下とする
+SAME_MUNICIPALITY_DROP = (0, 1)
+DISTANCE_BANDS_KM = [
+    (50, (1, 2)),
+    (100, (2, 3)),
+    (200, (3, 4)),
+]
+
+SAFE_STATUSES = {'安全', 'SAFE'}
+DANGER_STATUSES = {'危険', 'NEED_HELP', 'DANGER'}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def parse_intensity(intensity):
+    """
+    "震度6強" / "震度5-" などの表記を INTENSITY_SCALE の添字に変換する（解釈できない場合は None）
+    """
+    if intensity is None:
+        return None
+    text = unicodedata.normalize('NFKC', str(intensity)).replace('震度', '').strip()
+    text = text.replace('-', '弱').replace('+', '強')
+    if text in INTENSITY_SCALE:
+        return INTENSITY_SCALE.index(text)
+    return None
+
+
+def magnitude_factor(magnitude):
+    # Larger quakes shake farther: stretch the distance bands 2x per magnitude step above 7 (0.5x-2x)
+    try:
+        magnitude = float(magnitude)
+    except (TypeError, ValueError):
+        return 1.0
+    return min(max(2 ** (magnitude - 7.0), 0.5), 2.0)
+
+
+def reach_radius_km(earthquake_info, min_intensity):
+    """
+    推定震度（範囲の上限）が min_intensity 以上になりうる震源地からの最大距離（km）を返す
+
+    どの位置でも届かない場合は None、距離に関わらず届く（または震度を解釈できない）場合は math.inf。
+    同一市区町村のユーザーは震源地と同じ代表点に位置するため、距離0として扱える。
+    """
+    max_intensity = parse_intensity(earthquake_info.get('intensity'))
+    if max_intensity is None or min(max_intensity, INTENSITY_3) >= min_intensity:
+        return math.inf
+    factor = magnitude_factor(earthquake_info.get('magnitude'))
+    radius = 0.0 if max_intensity - SAME_MUNICIPALITY_DROP[0] >= min_intensity else None
+    for limit_km, (min_drop, _) in DISTANCE_BANDS_KM:
+        if max_intensity - min_drop >= min_intensity:
+            radius = limit_km * factor
+    return radius
+
+
+def intensity_drop_range(distance_km, same_municipality, factor):
+    """
+    最大震度から何段階低下するかの範囲を返す（None は「震度3以下」の帯）
+    """
+    if same_municipality:
+        return SAME_MUNICIPALITY_DROP
+    effective_distance = distance_km / factor
+    for limit_km, drop in DISTANCE_BANDS_KM:
+        if effective_distance <= limit_km:
+            return drop
+    return None
+
+
+def unconfirmed_level(intensity):
+    if intensity <= INTENSITY_3:
+        return 1
+    if intensity == INTENSITY_4:
+        return 2
+    if intensity <= INTENSITY_5_UPPER:
+        return 3
+    if intensity <= INTENSITY_6_UPPER:
+        return 4
+    return 5
+
+
+def danger_level(intensity):
+    if intensity <= INTENSITY_4:
+        return 3
+    if intensity <= INTENSITY_5_UPPER:
+        return 4
+    return 5
+
+
+def estimate_intensity_range(earthquake_info, epicenter, address):
+    """
+    住所の推定震度の範囲 (最小, 最大) を返す（位置が推定できない場合は None）
+
+    epicenter は震源地の Location。都道府県・震央地域の代表点は実際の位置からずれうるため、
+    距離をその分だけ広げた範囲（最も近い場合〜最も遠い場合）で推定する。
+    """
+    max_intensity = parse_intensity(earthquake_info.get('intensity'))
+    location = geocode(address)
+    if max_intensity is None or epicenter is None or location is None:
+        return None
+
+    factor = magnitude_factor(earthquake_info.get('magnitude'))
+    distance = haversine_km(location.lat, location.lon, epicenter.lat, epicenter.lon)
+    uncertainty = uncertainty_km(location) + uncertainty_km(epicenter)
+    same_municipality = (
+        location.level == epicenter.level == LEVEL_MUNICIPALITY and location.name == epicenter.name
+    )
+
+    nearest = intensity_drop_range(max(distance - uncertainty, 0.0), may_share_municipality(location, epicenter), factor)
+    farthest = intensity_drop_range(distance + uncertainty, same_municipality, factor)
+    highest = min(max_intensity, INTENSITY_3) if nearest is None else max(max_intensity - nearest[0], 0)
+    lowest = 0 if farthest is None else max(max_intensity - farthest[1], 0)
+    return lowest, highest
+
+
+def score_user(earthquake_info, user, epicenter=None):
+    """
+    ユーザーの危険度レベルの範囲 (最小, 最大) を返す
+
+    地震発生後に「安全」と報告済みの場合は (0, 0)、位置や時刻が判断できない場合は None。
+    """
+    if epicenter is None:
+        epicenter = geocode(earthquake_info.get('epicenter'))
+
+    history = user.get('safety_history') or []
+    latest = history[-1] if history else None
+
+    reported_after_quake = False
+    if latest is not None:
+        quake_time = parse_time(earthquake_info.get('time'))
+        reported_time = parse_time(latest.get('timestamp'))
+        if quake_time is None or reported_time is None:
+            return None
+        reported_after_quake = reported_time > quake_time
+
+    if reported_after_quake and latest.get('status') in SAFE_STATUSES:
+        return 0, 0
+    in_danger = reported_after_quake and latest.get('status') in DANGER_STATUSES
+    to_level = danger_level if in_danger else unconfirmed_level
+
+    # Both the registered address and the last reported location must agree to be conclusive
+    addresses = [user.get('address')]
+    if latest is not None and latest.get('location'):
+        addresses.append(latest['location'])
+
+    lowest, highest = None, None
+    for address in addresses:
+        intensity_range = estimate_intensity_range(earthquake_info, epicenter, address)
+        if intensity_range is None:
+            continue
+        low, high = to_level(intensity_range[0]), to_level(intensity_range[1])
+        lowest = low if lowest is None else min(lowest, low)
+        highest = high if highest is None else max(highest, high)
+
+    if lowest is None:
+        return None
+    return lowest, highest
+
+
+def user_key(user):
+    return user.get('id', user.get('name'))
+
+
+def prescore_users(earthquake_info, users):
+    """
+    ユーザーをローカルで判定できるものとChatGPTに送るものに振り分ける
+
+    (判定済みのレベル2以上の [{"id", "status"}], 判定できなかったユーザーのリスト) を返す。
+    レベル1と地震後に安全と報告済みのユーザーはどちらにも含めない。
+    """
+    epicenter = geocode(earthquake_info.get('epicenter'))
+
+    decided = []
+    ambiguous = []
+    for user in users:
+        level_range = score_user(earthquake_info, user, epicenter=epicenter)
+        if level_range is None or level_range[0] != level_range[1]:
+            ambiguous.append(user)
+            continue
+        level = level_range[0]
+        if level >= 2:
+            decided.append({'id': user_key(user), 'status': level})
+    return decided, ambiguous
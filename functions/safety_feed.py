@@ -0,0 +1,201 @@
+"""
+安否ログの新着・変更のプロセス内配信（/safetyCheck/stream）
+
+safety_response_logs に対する on_snapshot リスナーを1つだけ起動し、追加・変更されたログに
+連番のイベントIDを付けてリングバッファに保持する。購読者（SSEの接続）はバッファを共有し、
+最後に受け取ったイベントIDより後のイベントだけを読み出す。
+イベントIDは "<エポック>-<連番>" で、エポックはリスナーを起動するたびに変わる。
+別のプロセスのID・バッファから溢れたIDで再開しようとした場合は reset を返し、一覧の再取得を促す。
+
+リスナーのクエリは「起動時刻 - FEED_BACKLOG」以降のログで、監視対象が増え続けないよう
+FEED_BACKLOG ごとに新しい下限のリスナーへ切り替える。切り替えではエポックと連番を引き継ぎ、
+新しいリスナーの最初のスナップショットのうち古いリスナーが知らないログだけを配信し、
+古いリスナーが配信済みのログは新しいリスナーから届いても配信しない。
+"""
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import islice
+
+from safety_logs import EXCLUDED_USER_ID, SAFETY_LOGS_COLLECTION
+from timestamps import JST
+
+# 保持するイベント数（これより古いIDからは再開できない）
+FEED_BUFFER_SIZE = 1000
+
+# リスナー起動時に読み込む過去のログの期間（これより古いログの変更は配信しない）
+FEED_BACKLOG = timedelta(hours=1)
+
+# 最初のスナップショットを待つ最大秒数
+FEED_START_TIMEOUT_SECONDS = 10
+
+
+class SafetyFeed:
+    def __init__(self, db, buffer_size=FEED_BUFFER_SIZE, backlog=FEED_BACKLOG):
+        self._db = db
+        self._backlog = backlog
+        self._condition = threading.Condition()
+        # (sequence, record); sequences in the buffer are contiguous
+        self._events = deque(maxlen=buffer_size)
+        self._sequence = 0
+        self._epoch = None
+        self._watch = None
+        self._token = None
+        self._listening_since = 0.0
+        # The active listener's latest result set, compared with the replacement's first snapshot
+        self._snapshots = []
+        # Replacement listener with a later lower bound, until its first snapshot arrives
+        self._next_watch = None
+        self._next_token = None
+        # Logs the old listener delivered after the replacement's first snapshot; skipped once when added again
+        self._delivered_ids = set()
+        self._ready = threading.Event()
+
+    def _listen(self):
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        # Callbacks identify their listener by a token, as they can run before on_snapshot returns
+        query = self._db.collection(SAFETY_LOGS_COLLECTION).where(
+            filter=FieldFilter('timestamp', '>=', datetime.now(JST) - self._backlog)
+        )
+        token = object()
+
+        def on_snapshot(snapshots, changes, read_time):
+            self._on_snapshot(token, snapshots, changes)
+
+        return token, query.on_snapshot(on_snapshot)
+
+    def _start_listener(self):
+        with self._condition:
+            if self._watch is not None and self._watch.is_active:
+                return
+            # A new epoch tells clients holding ids from a dead listener to reload
+            self._epoch = uuid.uuid4().hex[:8]
+            self._events.clear()
+            self._sequence = 0
+            self._snapshots = []
+            self._delivered_ids = set()
+            self._ready.clear()
+            if self._next_watch is not None:
+                self._next_watch.unsubscribe()
+                self._next_watch = self._next_token = None
+
+            try:
+                self._token, self._watch = self._listen()
+            except Exception as e:
+                self._watch = self._token = None
+                raise RuntimeError(f'Safety log listener unavailable: {str(e)}') from e
+            self._listening_since = time.monotonic()
+
+    def _rotate_listener(self):
+        with self._condition:
+            if self._next_watch is not None or not self._ready.is_set():
+                return
+            if time.monotonic() - self._listening_since < self._backlog.total_seconds():
+                return
+            try:
+                self._next_token, self._next_watch = self._listen()
+            except Exception as e:
+                # The current listener keeps running; the next start() tries again
+                print(f"Safety log listener rotation failed: {str(e)}")
+
+    def _append(self, snapshot):
+        data = snapshot.to_dict()
+        if data.get('user_id') == EXCLUDED_USER_ID:
+            return
+        data['id'] = snapshot.id
+        self._sequence += 1
+        self._events.append((self._sequence, data))
+
+    def _on_snapshot(self, token, snapshots, changes):
+        previous = None
+        with self._condition:
+            if token is self._next_token:
+                # Logs written while the replacement was starting are only in its first snapshot
+                known_ids = {snapshot.id for snapshot in self._snapshots}
+                for snapshot in snapshots:
+                    if snapshot.id not in known_ids:
+                        self._append(snapshot)
+                self._delivered_ids = known_ids - {snapshot.id for snapshot in snapshots}
+                previous = self._watch
+                self._token, self._watch = self._next_token, self._next_watch
+                self._next_token = self._next_watch = None
+                self._listening_since = time.monotonic()
+            elif token is not self._token:
+                return
+            else:
+                for change in changes:
+                    if change.type.name == 'REMOVED':
+                        continue
+                    if change.type.name == 'ADDED' and change.document.id in self._delivered_ids:
+                        self._delivered_ids.discard(change.document.id)
+                        continue
+                    self._append(change.document)
+            self._snapshots = snapshots
+            self._condition.notify_all()
+        self._ready.set()
+        if previous is not None:
+            previous.unsubscribe()
+
+    def start(self):
+        """
+        リスナーを起動して最初のスナップショットを待つ（起動できない場合は RuntimeError）
+
+        起動から FEED_BACKLOG が経過したリスナーは、新しい下限のリスナーに切り替える。
+        """
+        self._start_listener()
+        if not self._ready.wait(FEED_START_TIMEOUT_SECONDS):
+            raise RuntimeError('Safety log listener did not deliver its first snapshot')
+        self._rotate_listener()
+
+    def _event_id(self, sequence):
+        return f"{self._epoch}-{sequence}"
+
+    def _parse_event_id(self, event_id):
+        # Returns the sequence if the id can be resumed from this buffer, else None
+        epoch, _, sequence = (event_id or '').partition('-')
+        if epoch != self._epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self._events[0][0] if self._events else self._sequence + 1
+        if sequence > self._sequence or sequence < oldest - 1:
+            return None
+        return sequence
+
+    def resolve(self, last_event_id):
+        """
+        再開位置を決め、(イベントID, reset) を返す
+
+        last_event_id が None の場合は現在の最新位置から配信する。再開できないIDの場合は reset が True。
+        """
+        with self._condition:
+            if last_event_id and self._parse_event_id(last_event_id) is not None:
+                return last_event_id, False
+            return self._event_id(self._sequence), bool(last_event_id)
+
+    def wait(self, event_id, timeout):
+        """
+        event_id より後のイベントを最大 timeout 秒待ち、(イベントのリスト, 次のイベントID, reset) を返す
+
+        イベントは (イベントID, ログ) のタプル。待っている間にバッファから溢れた場合は reset が True になり、
+        次のイベントIDは最新位置になる。リスナーが停止した場合は RuntimeError。
+        """
+        with self._condition:
+            sequence = self._parse_event_id(event_id)
+            if sequence is not None and self._sequence == sequence:
+                self._condition.wait(timeout)
+                sequence = self._parse_event_id(event_id)
+
+            if self._watch is None or not self._watch.is_active:
+                raise RuntimeError('Safety log listener stopped')
+            if sequence is None:
+                return [], self._event_id(self._sequence), True
+
+            oldest = self._events[0][0] if self._events else self._sequence + 1
+            events = [
+                (self._event_id(event_sequence), record)
+                for event_sequence, record in islice(self._events, sequence + 1 - oldest, None)
+            ]
+            return events, self._event_id(self._sequence), False
@@ -0,0 +1,243 @@
+import hashlib
+
+from geocoding import with_location_fields
+from safety_summary import SUMMARY_SHARD_COUNT, add_status_change, summary_writes
+from timestamps import format_timestamp, normalize_timestamps, parse_timestamp, timestamp_sort_key
+
+SAFETY_LOGS_COLLECTION = 'safety_response_logs'
+USER_LATEST_STATUS_COLLECTION = 'user_latest_status'
+USERS_COLLECTION = 'users'
+
+# デモ用アカウントの安否ログはダッシュボードに表示しない
+EXCLUDED_USER_ID = 'USR01235'
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# 1件の安否ログにつき最大2書き込み（ログ本体 + 最新ステータス）と集計カウンターのシャード
+# Firestoreの1トランザクション500書き込み制限に収まる件数
+MAX_RECORDS_PER_TRANSACTION = (500 - SUMMARY_SHARD_COUNT) // 2
+
+
+def _parse_bound(name, value):
+    parsed = parse_timestamp(value)
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 timestamp')
+    return parsed
+
+
+def build_safety_logs_query(db, status=None, since=None, after=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    安否ログを新しい順に取得するFirestoreクエリを組み立てる
+
+    status の絞り込み、since（以降）/ after（より後）の範囲指定と timestamp の降順ソートはFirestore側で実行する。
+    since / after は datetime またはISO形式の文字列。解釈できない場合は ValueError。
+    cursor には前ページ最後のドキュメントIDを指定する。limit が None の場合は件数を制限しない。
+    """
+    # Imported here so that importing this module does not load the Firestore SDK
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = db.collection(SAFETY_LOGS_COLLECTION)
+
+    if status:
+        query = query.where(filter=FieldFilter('status', '==', status))
+    if since:
+        query = query.where(filter=FieldFilter('timestamp', '>=', _parse_bound('since', since)))
+    if after:
+        query = query.where(filter=FieldFilter('timestamp', '>', _parse_bound('after', after)))
+
+    query = query.order_by('timestamp', direction='DESCENDING')
+
+    if cursor:
+        cursor_snapshot = db.collection(SAFETY_LOGS_COLLECTION).document(cursor).get()
+        if not cursor_snapshot.exists:
+            raise ValueError(f'Invalid cursor: {cursor}')
+        query = query.start_after(cursor_snapshot)
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def iter_safety_logs(query, page_state=None, limit=None):
+    """
+    クエリ結果を1件ずつ辞書に変換して返すジェネレーター（デモ用アカウントは除外）
+
+    limit を指定した場合は、除外したログの分を start_after で読み足して limit 件まで返す。
+    読み足しも limit 件ずつ読むため、デモ用アカウントのログが続いても往復の回数は増えすぎない。
+    page_state に辞書を渡すと、最後に返した（またはその前に除外した）ドキュメントIDと、続きがあるか（has_more）を記録する。
+    """
+    if page_state is None:
+        page_state = {}
+    page_state['has_more'] = False
+
+    remaining = limit
+    last_snapshot = None
+    while True:
+        batch = query
+        # Refills read a whole page too; a run of demo logs would otherwise cost one round trip per record
+        requested = None if limit is None else max(remaining, limit)
+        if requested is not None:
+            batch = batch.limit(requested)
+        if last_snapshot is not None:
+            batch = batch.start_after(last_snapshot)
+
+        fetched_count = 0
+        for doc in batch.stream():
+            if remaining == 0:
+                # Read past the page; the cursor stays on the last record returned
+                page_state['has_more'] = True
+                return
+            fetched_count += 1
+            last_snapshot = doc
+            page_state['last_doc_id'] = doc.id
+
+            data = doc.to_dict()
+            if data.get('user_id') == EXCLUDED_USER_ID:
+                continue
+            data['id'] = doc.id
+            if remaining is not None:
+                remaining -= 1
+            yield data
+
+        # A short read means Firestore has nothing left after it
+        if requested is None or fetched_count < requested:
+            return
+        if remaining == 0:
+            page_state['has_more'] = True
+            return
+
+
+def next_page_cursor(page_state, limit):
+    if limit is None or not page_state.get('has_more'):
+        return None
+    return page_state.get('last_doc_id')
+
+
+def safety_log_id(record):
+    """
+    安否ログの内容から決まるドキュメントIDを返す（同じ内容のログを再インポートしても重複しない）
+
+    timestamp は日本時間のISO形式に揃えてから使うため、文字列でも datetime でも同じIDになる。
+    """
+    timestamp = parse_timestamp(record.get('timestamp'))
+    if timestamp is not None:
+        record = dict(record, timestamp=format_timestamp(timestamp))
+    key = '|'.join(str(record.get(field, '')) for field in ('user_id', 'timestamp', 'status', 'location'))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def _record_safety_responses_in_transaction(transaction, db, entries):
+    # Keep only the newest report per user from this chunk
+    newest_by_user = {}
+    for log_ref, data in entries:
+        user_id = data.get('user_id')
+        if not user_id:
+            continue
+        current = newest_by_user.get(user_id)
+        if current is None or (
+            timestamp_sort_key(data.get('timestamp')) >= timestamp_sort_key(current[1].get('timestamp'))
+        ):
+            newest_by_user[user_id] = (log_ref, data)
+
+    # All reads must happen before the first write in a transaction
+    latest_refs = [
+        db.collection(USER_LATEST_STATUS_COLLECTION).document(user_id)
+        for user_id in newest_by_user
+    ]
+    stored_latest = {}
+    if latest_refs:
+        for snapshot in transaction.get_all(latest_refs):
+            if snapshot.exists:
+                stored_latest[snapshot.id] = snapshot.to_dict()
+
+    for log_ref, data in entries:
+        transaction.set(log_ref, data)
+
+    summary_deltas = {}
+    for latest_ref in latest_refs:
+        log_ref, data = newest_by_user[latest_ref.id]
+        stored = stored_latest.get(latest_ref.id)
+        # Already applied by an earlier attempt whose commit went through
+        if stored is not None and stored.get('log_id') == log_ref.id:
+            continue
+        # Older reports (e.g. re-imported history) never overwrite a newer status
+        if stored is not None and timestamp_sort_key(stored.get('timestamp')) > timestamp_sort_key(data.get('timestamp')):
+            continue
+        transaction.set(latest_ref, dict(data, log_id=log_ref.id))
+        if latest_ref.id != EXCLUDED_USER_ID:
+            add_status_change(summary_deltas, latest_ref.id, stored, data)
+
+    # The summary counters move together with the latest statuses
+    for shard_ref, updates in summary_writes(db, summary_deltas):
+        transaction.set(shard_ref, updates, merge=True)
+
+
+def record_safety_responses(db, records, log_ids=None):
+    """
+    安否ログを書き込み、ユーザーごとの最新ステータス（user_latest_status）と集計カウンターを同じトランザクションで更新する
+
+    timestamp が文字列の場合はFirestoreのタイムスタンプ（datetime）に変換し、
+    location から求めた geohash / lat / lon を追加して保存する。
+    log_ids を指定した場合はそのIDでログを保存し、省略時は自動生成IDを使用する。
+    書き込んだログのドキュメントIDのリストを返す。
+    """
+    from firebase_admin import firestore
+
+    record_in_transaction = firestore.transactional(_record_safety_responses_in_transaction)
+
+    logs_collection = db.collection(SAFETY_LOGS_COLLECTION)
+    if log_ids is None:
+        log_refs = [logs_collection.document() for _ in records]
+    else:
+        log_refs = [logs_collection.document(log_id) for log_id in log_ids]
+
+    entries = [
+        (log_ref, with_location_fields(normalize_timestamps(record, ('timestamp',)), 'location'))
+        for log_ref, record in zip(log_refs, records)
+    ]
+    for start in range(0, len(entries), MAX_RECORDS_PER_TRANSACTION):
+        chunk = entries[start:start + MAX_RECORDS_PER_TRANSACTION]
+        record_in_transaction(db.transaction(), db, chunk)
+
+    return [log_ref.id for log_ref in log_refs]
+
+
+def get_latest_statuses(db, user_ids=None):
+    """
+    ユーザーごとの最新の安否情報を {user_id: データ} の辞書で返す
+
+    user_ids を指定した場合はそのユーザー分のドキュメントだけを読み込む。
+    """
+    latest_collection = db.collection(USER_LATEST_STATUS_COLLECTION)
+    if user_ids is None:
+        snapshots = latest_collection.stream()
+    else:
+        snapshots = db.get_all([latest_collection.document(user_id) for user_id in user_ids])
+
+    return {
+        snapshot.id: snapshot.to_dict()
+        for snapshot in snapshots
+        if snapshot.exists
+    }
+
+
+def get_users_with_latest_status(db):
+    """
+    consult_chatgpt に渡す形式のユーザーリストを作成する
+
+    safety_history には最新の安否情報のみを含める（未回答のユーザーは空リスト）。
+    """
+    latest_statuses = get_latest_statuses(db)
+
+    users = []
+    for user_doc in db.collection(USERS_COLLECTION).stream():
+        user_data = user_doc.to_dict()
+        latest = latest_statuses.get(user_doc.id)
+        users.append({
+            'id': user_doc.id,
+            'name': user_data.get('name'),
+            'address': user_data.get('address'),
+            'safety_history': [latest] if latest else [],
+        })
+    return users
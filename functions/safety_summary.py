@@ -0,0 +1,188 @@
+"""
+安否状況の集計（ステータス別・都道府県別・未回答者数）
+
+ユーザーごとの最新ステータスが変わるたびに、record_safety_responses のトランザクション内で
+集計用のカウンター（safety_summary コレクション）を firestore.Increment で増減する。
+1つのドキュメントへの書き込みが集中しないよう、カウンターはユーザーIDで SUMMARY_SHARD_COUNT 個に分割する。
+集計の読み込みはシャードの件数 + ユーザー数の count 集計クエリ1回で済む。
+
+使い方: python safety_summary.py   # 既存の user_latest_status からカウンターを作り直す
+"""
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from geocoding import geocode
+from timestamps import JST
+
+SAFETY_SUMMARY_COLLECTION = 'safety_summary'
+SUMMARY_SHARD_COUNT = 10
+
+# 所在地から都道府県が分からない場合・ステータスが無い場合の集計キー
+UNKNOWN_PREFECTURE = '不明'
+UNKNOWN_STATUS = 'UNKNOWN'
+
+# /safetyCheck/summary の集計結果を使い回す秒数
+SUMMARY_TTL_SECONDS = 10
+
+
+def summary_shard_id(user_id):
+    # A user's increments and decrements always land in the same shard
+    return f"shard-{zlib.crc32(user_id.encode('utf-8')) % SUMMARY_SHARD_COUNT}"
+
+
+def prefecture_of(location):
+    resolved = geocode(location)
+    if resolved is None or not resolved.prefecture:
+        return UNKNOWN_PREFECTURE
+    return resolved.prefecture
+
+
+def _bucket_paths(latest):
+    status = latest.get('status') or UNKNOWN_STATUS
+    return [('answered',), ('statuses', status), ('prefectures', prefecture_of(latest.get('location')), status)]
+
+
+def add_status_change(deltas, user_id, previous, current):
+    """
+    ユーザーの最新ステータスが previous から current に変わったときのカウンターの増減を deltas に加える
+
+    deltas は {シャードID: {フィールドパスのタプル: 増減}}。previous が None の場合は初回の回答。
+    """
+    shard = deltas.setdefault(summary_shard_id(user_id), {})
+    if previous is not None:
+        for path in _bucket_paths(previous):
+            shard[path] = shard.get(path, 0) - 1
+    for path in _bucket_paths(current):
+        shard[path] = shard.get(path, 0) + 1
+
+
+def summary_writes(db, deltas):
+    """
+    deltas を (シャードの参照, set(merge=True) に渡すデータ) のリストに変換する（増減が0のシャードは含めない）
+    """
+    from google.cloud.firestore_v1 import Increment
+
+    collection = db.collection(SAFETY_SUMMARY_COLLECTION)
+    writes = []
+    for shard_id, changes in sorted(deltas.items()):
+        data = {}
+        for path, amount in changes.items():
+            if not amount:
+                continue
+            node = data
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = Increment(amount)
+        if data:
+            writes.append((collection.document(shard_id), data))
+    return writes
+
+
+def _shard_ids():
+    return [f"shard-{index}" for index in range(SUMMARY_SHARD_COUNT)]
+
+
+def _count_users(db):
+    # One aggregation query instead of streaming the users collection
+    # (user documents carry their id as a field, so != also drops the demo account)
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from safety_logs import EXCLUDED_USER_ID, USERS_COLLECTION
+
+    query = db.collection(USERS_COLLECTION).where(filter=FieldFilter('id', '!=', EXCLUDED_USER_ID))
+    result = query.count(alias='users').get()
+    return int(result[0][0].value)
+
+
+def get_safety_summary(db):
+    """
+    カウンターのシャードとユーザー数の集計クエリから安否状況の集計を作成する
+    """
+    collection = db.collection(SAFETY_SUMMARY_COLLECTION)
+    answered = 0
+    statuses = {}
+    prefectures = {}
+    for snapshot in db.get_all([collection.document(shard_id) for shard_id in _shard_ids()]):
+        if not snapshot.exists:
+            continue
+        data = snapshot.to_dict()
+        answered += data.get('answered', 0)
+        for status, count in data.get('statuses', {}).items():
+            statuses[status] = statuses.get(status, 0) + count
+        for prefecture, counts in data.get('prefectures', {}).items():
+            merged = prefectures.setdefault(prefecture, {})
+            for status, count in counts.items():
+                merged[status] = merged.get(status, 0) + count
+
+    total_users = _count_users(db)
+    by_prefecture = {}
+    for prefecture, counts in sorted(prefectures.items()):
+        counts = {status: count for status, count in sorted(counts.items()) if count}
+        if counts:
+            by_prefecture[prefecture] = dict(counts, total=sum(counts.values()))
+
+    return {
+        'total_users': total_users,
+        'answered': answered,
+        'unanswered': max(total_users - answered, 0),
+        'by_status': {status: count for status, count in sorted(statuses.items()) if count},
+        'by_prefecture': by_prefecture,
+        'generated_at': datetime.now(JST),
+    }
+
+
+class CachedSafetySummary:
+    """
+    get_safety_summary の結果を ttl_seconds の間使い回す
+    """
+
+    def __init__(self, db, ttl_seconds=SUMMARY_TTL_SECONDS):
+        self._db = db
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._summary = None
+        self._expires_at = 0.0
+
+    def get(self):
+        with self._lock:
+            if self._summary is None or time.monotonic() >= self._expires_at:
+                self._summary = get_safety_summary(self._db)
+                self._expires_at = time.monotonic() + self._ttl_seconds
+            return self._summary
+
+
+def rebuild_safety_summary(db):
+    """
+    user_latest_status を1回読み込み、カウンターのシャードを作り直す（集計済みの件数を返す）
+
+    カウンターの導入前に記録された安否情報を反映するためのもので、実行中の書き込みとは整合しない。
+    """
+    from safety_logs import EXCLUDED_USER_ID, USER_LATEST_STATUS_COLLECTION
+
+    totals = {shard_id: {} for shard_id in _shard_ids()}
+    counted = 0
+    for snapshot in db.collection(USER_LATEST_STATUS_COLLECTION).stream():
+        if snapshot.id == EXCLUDED_USER_ID:
+            continue
+        shard = totals[summary_shard_id(snapshot.id)]
+        for path in _bucket_paths(snapshot.to_dict()):
+            node = shard
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = node.get(path[-1], 0) + 1
+        counted += 1
+
+    batch = db.batch()
+    collection = db.collection(SAFETY_SUMMARY_COLLECTION)
+    for shard_id, data in totals.items():
+        batch.set(collection.document(shard_id), data)
+    batch.commit()
+    return counted
+
+
+if __name__ == "__main__":
+    from firebase_client import get_db
+
+    count = rebuild_safety_summary(get_db())
+    print(f"成功: {count}人分の最新ステータスから集計カウンターを作り直しました")
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import threading
+
+from flask import current_app, json, request
+
+
+class StaticJSONResource:
+    """
+    モックJSONファイルを一度だけ読み込み、シリアライズ済みのレスポンスボディとETagを保持する
+
+    ファイルの更新（mtime / サイズの変化）を検知した場合のみ再読み込みする。
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+        self._signature = None
+        self._body = None
+        self._etag = None
+
+    def _load(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if signature != self._signature:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                body = current_app.json.dumps({self.key: data}).encode('utf-8')
+                self._body = body
+                self._etag = hashlib.sha256(body).hexdigest()
+                self._signature = signature
+            return self._body, self._etag
+
+    def response(self):
+        """
+        キャッシュ済みのボディでレスポンスを作成する（If-None-Match が一致すれば 304 を返す）
+
+        ファイルが存在しない場合は FileNotFoundError、JSONが不正な場合は JSONDecodeError を送出する。
+        """
+        body, etag = self._load()
+
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+
+users_resource = StaticJSONResource('mocks/users.json', 'user_data')
+earthquakes_resource = StaticJSONResource('mocks/earth_quake.json', 'earthquake_data')
@@ -0,0 +1,137 @@
+"""
+ネットワークに接続せずにChatGPT連携を計測するための、OpenAI互換のスタブサーバー
+
+/v1/chat/completions への問い合わせに対し、プロンプト中の全アカウントを危険度3とするJSON配列を返す（stream=True にも対応）。
+応答時間は「基本遅延 + アカウント数 × 1件あたりの遅延」で、出力トークン数に比例する生成時間を模擬する。
+使い方: python stub_openai_server.py [ポート番号]
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8089
+
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    base_latency = 0.2
+    per_user_latency = 0.01
+    # 最初のN件の問い合わせに 500 を返す（再試行の確認用）
+    fail_first = 0
+    request_count = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        if not self.path.endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        user_prompt = body['messages'][-1]['content']
+        account_section = user_prompt.split('## アカウント情報', 1)[-1]
+        # One JSON array per account after the column header row; the id is the first column
+        rows = [json.loads(line) for line in account_section.strip().splitlines()]
+        user_ids = [row[0] for row in rows[1:]]
+
+        with StubOpenAIHandler._lock:
+            StubOpenAIHandler.request_count += 1
+            request_number = StubOpenAIHandler.request_count
+
+        if request_number <= self.fail_first:
+            self._send_json(500, {'error': {'message': 'stub failure', 'type': 'server_error'}})
+            return
+
+        assessments = [{'id': user_id, 'status': 3} for user_id in user_ids]
+        if body.get('stream'):
+            self._stream_completion(body, request_number, assessments)
+            return
+
+        time.sleep(self.base_latency + self.per_user_latency * len(user_ids))
+
+        content = json.dumps(assessments, ensure_ascii=False)
+        response = {
+            'id': f'chatcmpl-stub-{request_number}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': self._usage(user_prompt, content),
+        }
+        self._send_json(200, response)
+
+    def _stream_completion(self, body, request_number, assessments):
+        # One server-sent event per assessment, spread over the same total latency
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+
+        time.sleep(self.base_latency)
+        pieces = ['['] + [
+            (',' if index else '') + json.dumps(assessment, ensure_ascii=False)
+            for index, assessment in enumerate(assessments)
+        ] + [']']
+        for piece in pieces:
+            chunk = {
+                'id': f'chatcmpl-stub-{request_number}',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            if piece not in ('[', ']'):
+                time.sleep(self.per_user_latency)
+        if (body.get('stream_options') or {}).get('include_usage'):
+            usage_chunk = {
+                'id': f'chatcmpl-stub-{request_number}',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [],
+                'usage': self._usage(body['messages'][-1]['content'], ''.join(pieces)),
+            }
+            self.wfile.write(f"data: {json.dumps(usage_chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _usage(prompt, content):
+        return {
+            'prompt_tokens': len(prompt) // 2,
+            'completion_tokens': len(content) // 2,
+            'total_tokens': (len(prompt) + len(content)) // 2,
+        }
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=DEFAULT_PORT):
+    """
+    スタブサーバーをバックグラウンドスレッドで起動し、(サーバー, base_url) を返す
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubOpenAIHandler)
+    print(f"Stub OpenAI server listening on http://127.0.0.1:{port}/v1")
+    server.serve_forever()
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from alert_pipeline import AlertPipeline, LocalSink, build_alert, get_delivery_summary, select_affected_users
+from fake_firestore import FakeFirestore
+
+EARTHQUAKE = {
+    "id": "EQ202501",
+    "time": "2025-01-01 12:00:00",
+    "epicenter": "東京都千代田区",
+    "intensity": "震度7",
+    "magnitude": 7.0
+}
+
+
+def test_only_nearby_unconfirmed_users_are_alerted():
+    """Test that distant users and users already reported safe get no alert, and unlocated users do"""
+    users = [
+        {"id": "NEAR", "address": "東京都千代田区永田町1-1-1", "safety_history": []},
+        {"id": "FAR", "address": "北海道札幌市中央区", "safety_history": []},
+        {
+            "id": "SAFE",
+            "address": "東京都千代田区",
+            "safety_history": [
+                {"timestamp": "2025-01-01 12:05:00", "status": "安全", "location": "東京都千代田区"}
+            ]
+        },
+        {"id": "UNKNOWN", "address": "所在地不明", "safety_history": []},
+        {
+            "id": "UNKNOWN_SAFE",
+            "address": "所在地不明",
+            "safety_history": [{"timestamp": "2025-01-01 12:05:00", "status": "SAFE", "location": ""}]
+        },
+    ]
+
+    affected = select_affected_users(EARTHQUAKE, users)
+
+    assert [assessment["id"] for assessment in affected] == ["NEAR", "UNKNOWN"]
+    assert affected[1]["status"] == 5
+    alert = build_alert(EARTHQUAKE, affected[0])
+    assert alert["earthquake_id"] == "EQ202501"
+    assert alert["level"] == affected[0]["status"] >= 2
+
+
+def test_deliveries_are_retried_recorded_and_resumed():
+    """Test delivery states after retries, that a rerun does not resend, and that stuck pending tasks are resumed"""
+    db = FakeFirestore()
+    sink = LocalSink(fail_user_ids=["USR2"])
+    pipeline = AlertPipeline(db, sink=sink, max_workers=2, chunk_size=2)
+    assessments = [{"id": f"USR{i}", "status": 4} for i in range(5)]
+
+    alerts = pipeline.enqueue(EARTHQUAKE, assessments)
+    assert get_delivery_summary(db, "EQ202501") == {"pending": 5, "delivered": 0, "failed": 0}
+    assert pipeline.drain("EQ202501", alerts) == {"delivered": 4, "failed": 1}
+    assert get_delivery_summary(db, "EQ202501") == {"pending": 0, "delivered": 4, "failed": 1}
+    failed = db.collection("earthquake_alerts").document("EQ202501").collection("deliveries").document("USR2").get()
+    assert failed.get("attempts") == 3 and "USR2" in failed.get("error")
+
+    # Running the pipeline again only re-enqueues the user that was not reached
+    sink = LocalSink()
+    pipeline = AlertPipeline(db, sink=sink)
+    alerts = pipeline.enqueue(EARTHQUAKE, assessments + [{"id": "USR5", "status": 3}])
+    assert [alert["user_id"] for alert in alerts] == ["USR2", "USR5"]
+
+    # The background run stopped before draining them
+    assert pipeline.resume("EQ202501") == {"delivered": 0, "failed": 0}
+    assert pipeline.resume("EQ202501", min_age=timedelta(0)) == {"delivered": 2, "failed": 0}
+    assert sorted(alert["user_id"] for alert in sink.sent) == ["USR2", "USR5"]
+    assert get_delivery_summary(db, "EQ202501") == {"pending": 0, "delivered": 6, "failed": 0}
+
+
+if __name__ == "__main__":
+    test_only_nearby_unconfirmed_users_are_alerted()
+    test_deliveries_are_retried_recorded_and_resumed()
+    print("All alert_pipeline tests passed")
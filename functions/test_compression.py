@@ -0,0 +1,103 @@
+import gzip
+from datetime import datetime, timezone
+
+from flask import Flask, Response, jsonify, request
+
+import compression
+import json_provider
+from json_provider import JSONProvider
+
+
+def _app():
+    app = Flask(__name__)
+    app.json = JSONProvider(app)
+    compression.init_app(app)
+
+    @app.route('/small')
+    def small():
+        return jsonify(message='安否情報が正常に記録されました')
+
+    @app.route('/large')
+    def large():
+        response = jsonify(user_data=[{'id': f'USR{i}', 'name': '相曽 結', 'status': 'SAFE'} for i in range(100)])
+        response.set_etag('v1')
+        return response.make_conditional(request)
+
+    @app.route('/stream')
+    def stream():
+        return Response((f'{{"id":{i}}}\n' for i in range(1000)), mimetype='application/x-ndjson')
+
+    return app
+
+
+def test_json_provider_keeps_utf8_and_jst():
+    """Test that Japanese is not escaped and timestamps are rendered in JST"""
+    app = _app()
+    with app.app_context():
+        body = app.json.dumps({'name': '相曽 結', 'timestamp': datetime(2025, 3, 11, 5, 46, tzinfo=timezone.utc)})
+        assert body == '{"name":"相曽 結","timestamp":"2025-03-11T14:46:00+09:00"}'
+        # Values the fast encoder rejects still serialize
+        assert app.json.loads(app.json.dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+
+
+class CountingOrjson:
+    def __init__(self, module):
+        self._module = module
+        self.dumps_calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def dumps(self, *args, **kwargs):
+        self.dumps_calls += 1
+        return self._module.dumps(*args, **kwargs)
+
+
+def test_jsonify_uses_orjson():
+    """Test that jsonify's compact and debug layouts are encoded by orjson, with the stdlib's output"""
+    if json_provider.orjson is None:
+        return
+    counting = CountingOrjson(json_provider.orjson)
+    json_provider.orjson = counting
+    try:
+        app = _app()
+        client = app.test_client()
+        response = client.get('/small')
+        assert counting.dumps_calls == 1
+        assert response.get_data(as_text=True) == '{"message":"安否情報が正常に記録されました"}\n'
+
+        app.json.compact = False
+        with app.app_context():
+            body = app.json.response(user={'id': 'USR1', 'timestamp': datetime(2025, 3, 11, 5, 46, tzinfo=timezone.utc)})
+        assert counting.dumps_calls == 2
+        json_provider.orjson = None
+        with app.app_context():
+            assert body.get_data() == app.json.response(
+                user={'id': 'USR1', 'timestamp': datetime(2025, 3, 11, 5, 46, tzinfo=timezone.utc)}
+            ).get_data()
+    finally:
+        json_provider.orjson = counting._module
+
+
+def test_large_bodies_are_compressed_when_accepted():
+    """Test that only large, non-streamed bodies are gzipped and that the weak ETag still validates"""
+    client = _app().test_client()
+
+    response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert '相曽 結' in gzip.decompress(response.data).decode('utf-8')
+    assert response.headers['ETag'] == 'W/"v1"'
+    revalidated = client.get('/large', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+    assert 'Content-Encoding' not in client.get('/large').headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/stream', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+if __name__ == "__main__":
+    test_json_provider_keeps_utf8_and_jst()
+    test_jsonify_uses_orjson()
+    test_large_bodies_are_compressed_when_accepted()
+    print("All compression tests passed")
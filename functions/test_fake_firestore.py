@@ -0,0 +1,106 @@
+import fake_firestore
+from fake_firestore import FakeFirestore
+from safety_logs import (
+    build_safety_logs_query,
+    get_latest_statuses,
+    iter_safety_logs,
+    next_page_cursor,
+    record_safety_responses,
+)
+
+
+def test_query_filters_orders_and_pages():
+    """Test that where/order_by/limit/start_after behave like Firestore"""
+    db = FakeFirestore()
+    for i, status in enumerate(["SAFE", "NEED_HELP", "SAFE", "SAFE"]):
+        db.collection("safety_response_logs").document(f"LOG{i}").set({
+            "user_id": f"USR{i}",
+            "timestamp": f"2025-03-11T15:0{i}:00+09:00",
+            "status": status,
+            "location": "東京都千代田区"
+        })
+
+    first_page = list(iter_safety_logs(build_safety_logs_query(db, status="SAFE", limit=2)))
+    assert [record["id"] for record in first_page] == ["LOG3", "LOG2"]
+
+    second_page = list(iter_safety_logs(build_safety_logs_query(db, status="SAFE", cursor="LOG2", limit=2)))
+    assert [record["id"] for record in second_page] == ["LOG0"]
+
+
+def test_pages_are_refilled_past_demo_account_logs():
+    """Test that skipped demo-account logs are replaced so a page still holds limit records"""
+    db = FakeFirestore()
+    for i in range(10):
+        # Every other log belongs to the demo account, as /safetyPost writes it
+        db.collection("safety_response_logs").document(f"LOG{i}").set({
+            "user_id": "USR01235" if i % 2 else f"USR{i}",
+            "timestamp": f"2025-03-11T15:0{i}:00+09:00",
+            "status": "SAFE",
+            "location": "東京都千代田区"
+        })
+
+    page_state = {}
+    first_page = list(iter_safety_logs(build_safety_logs_query(db, limit=None), page_state, limit=3))
+    assert [record["id"] for record in first_page] == ["LOG8", "LOG6", "LOG4"]
+    cursor = next_page_cursor(page_state, 3)
+
+    page_state = {}
+    second_page = list(iter_safety_logs(build_safety_logs_query(db, cursor=cursor, limit=None), page_state, limit=3))
+    assert [record["id"] for record in second_page] == ["LOG2", "LOG0"]
+    assert next_page_cursor(page_state, 3) is None
+
+
+def test_refills_read_whole_pages_through_demo_account_runs():
+    """Test that a long run of demo-account logs costs a few queries and the cursor stays on the page"""
+    db = FakeFirestore()
+    user_ids = ["USR1", "USR2"] + ["USR01235"] * 200 + ["USR3", "USR4", "USR5"]
+    for i, user_id in enumerate(user_ids):
+        db.collection("safety_response_logs").document(f"LOG{i:03d}").set({
+            "user_id": user_id,
+            "timestamp": "2025-03-11T15:00:00+09:00",
+            "status": "SAFE",
+            "location": "東京都千代田区"
+        })
+
+    streams = []
+    stream = fake_firestore.Query.stream
+
+    def counting_stream(self, transaction=None):
+        streams.append(self._limit)
+        return stream(self, transaction)
+
+    fake_firestore.Query.stream = counting_stream
+    try:
+        page_state = {}
+        # Equal timestamps come back in document id order
+        first_page = list(iter_safety_logs(build_safety_logs_query(db, limit=None), page_state, limit=4))
+    finally:
+        fake_firestore.Query.stream = stream
+
+    assert [record["id"] for record in first_page] == ["LOG000", "LOG001", "LOG202", "LOG203"]
+    # Refills of the page size: 204 documents in 51 queries, instead of twice as many 2-document reads
+    assert streams == [4] * 51
+    assert next_page_cursor(page_state, 4) == "LOG203"
+
+
+def test_transaction_keeps_newest_latest_status():
+    """Test that record_safety_responses runs through the fake transaction"""
+    db = FakeFirestore()
+    record_safety_responses(db, [
+        {"user_id": "USR1", "timestamp": "2025-03-11T15:10:00+09:00", "status": "SAFE", "location": "A"},
+        {"user_id": "USR1", "timestamp": "2025-03-11T15:00:00+09:00", "status": "NEED_HELP", "location": "B"},
+    ])
+    record_safety_responses(db, [
+        {"user_id": "USR1", "timestamp": "2025-03-11T14:00:00+09:00", "status": "NEED_HELP", "location": "C"},
+    ])
+
+    assert get_latest_statuses(db)["USR1"]["location"] == "A"
+    assert len(db.collection("safety_response_logs").get()) == 3
+
+
+if __name__ == "__main__":
+    test_query_filters_orders_and_pages()
+    test_pages_are_refilled_past_demo_account_logs()
+    test_refills_read_whole_pages_through_demo_account_runs()
+    test_transaction_keeps_newest_latest_status()
+    print("All fake_firestore tests passed")
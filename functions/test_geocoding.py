@@ -0,0 +1,37 @@
+from geocoding import geocode, normalize_address
+
+
+def test_normalize_address():
+    """Test that full-width digits, spaces and postal codes are normalized"""
+    assert normalize_address("〒164-0001 東京都中野区中野１丁目１番１号") == "東京都中野区中野1丁目1番1号"
+
+
+def test_geocode_municipality():
+    """Test that the longest matching municipality is resolved"""
+    location = geocode("大阪府大阪市北区梅田3-4-5 サンライズマンション1201")
+
+    assert location.name == "大阪府大阪市北区"
+    assert location.level == "municipality"
+    assert location.prefecture == "大阪府"
+
+
+def test_geocode_without_prefecture():
+    """Test that unambiguous municipality names resolve without a prefecture"""
+    assert geocode("仙台市青葉区中央").name == "宮城県仙台市青葉区"
+    assert geocode("北区赤羽") is None
+
+
+def test_geocode_falls_back_to_prefecture():
+    """Test that unknown municipalities fall back to the prefecture centroid"""
+    location = geocode("長野県松本市")
+
+    assert location.name == "長野県"
+    assert location.level == "prefecture"
+
+
+if __name__ == "__main__":
+    test_normalize_address()
+    test_geocode_municipality()
+    test_geocode_without_prefecture()
+    test_geocode_falls_back_to_prefecture()
+    print("All geocoding tests passed")
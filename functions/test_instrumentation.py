@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from types import SimpleNamespace
+
+from flask import Flask, jsonify
+
+import firebase_client
+import instrumentation
+from fake_firestore import FakeFirestore
+from instrumentation import InstrumentedFirestoreClient
+
+
+def _app(db):
+    app = Flask(__name__)
+    instrumentation.init_app(app)
+
+    @app.route('/instrumented/<int:workers>')
+    def instrumented(workers):
+        def work():
+            list(db.collection('users').stream())
+            db.collection('logs').document().set({'status': 'SAFE'})
+            instrumentation.record_openai_usage(SimpleNamespace(prompt_tokens=10, completion_tokens=2))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(copy_context().run, work) for _ in range(workers * 50)]:
+                future.result()
+        return jsonify(ok=True)
+
+    return app
+
+
+def test_counts_from_worker_threads_reach_the_request():
+    """Test that Server-Timing and /metrics include every read, write and OpenAI call made by workers"""
+    db = FakeFirestore()
+    for i in range(3):
+        db.collection('users').document(f'USR{i}').set({'name': f'User {i}'})
+    client = _app(InstrumentedFirestoreClient(db)).test_client()
+
+    response = client.get('/instrumented/8')
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'firestore;dur=' in timing and 'desc="1200 reads, 400 writes"' in timing
+    assert 'json;dur=' in timing
+
+    metrics = instrumentation.render_metrics()
+    route = 'route="/instrumented/<int:workers>"'
+    assert f'firestore_document_reads_total{{{route}}} 1200' in metrics
+    assert f'firestore_document_writes_total{{{route}}} 400' in metrics
+    assert f'openai_requests_total{{{route}}} 400' in metrics
+    assert f'openai_tokens_total{{{route},type="prompt"}} 4000' in metrics
+    assert f'http_requests_total{{{route},method="GET",status="200"}} 1' in metrics
+    assert f'http_request_duration_seconds_count{{{route},method="GET"}} 1' in metrics
+
+
+def test_metrics_route():
+    """Test that the app serves the registry in the Prometheus text format"""
+    import main
+
+    firebase_client.use_client(FakeFirestore())
+    client = main.app.test_client()
+    client.get('/earthquakes')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE http_request_duration_seconds histogram' in response.get_data(as_text=True)
+    assert 'http_requests_total{route="/earthquakes",method="GET",status="200"}' in response.get_data(as_text=True)
+
+
+if __name__ == "__main__":
+    test_counts_from_worker_threads_reach_the_request()
+    test_metrics_route()
+    print("All instrumentation tests passed")
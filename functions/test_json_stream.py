@@ -0,0 +1,78 @@
+import io
+import json
+
+from json_stream import JSONArrayParser, iter_json_array
+
+
+def test_iter_json_array():
+    """Test that array elements are parsed across small read chunks"""
+    records = [
+        {"id": "USR01236", "name": "相曽 結", "score": 1.5},
+        {"id": "USR01237", "name": "モチ", "tags": ["a", "b"]},
+    ]
+    fp = io.StringIO(json.dumps(records, ensure_ascii=False, indent=2))
+
+    assert list(iter_json_array(fp, chunk_size=3)) == records
+
+
+def test_parser_waits_for_split_numbers():
+    """Test that a number split between chunks is not emitted early"""
+    parser = JSONArrayParser()
+
+    assert parser.feed('[12') == []
+    assert parser.feed('3, 4') == [123]
+    assert parser.feed(']') == [4]
+    assert parser.finished
+
+
+def test_parser_waits_for_split_elements():
+    """Test that strings, literals and fractions split between chunks are not rejected early"""
+    parser = JSONArrayParser()
+
+    assert parser.feed('[{"name": "相曽') == []
+    assert parser.feed(' 結", "ok": tr') == []
+    assert parser.feed('ue}, 1.') == [{"name": "相曽 結", "ok": True}]
+    assert parser.feed('5]') == [1.5]
+    assert parser.finished
+
+
+def test_parser_rejects_bad_separators():
+    """Test that missing or extra commas and malformed elements fail as soon as they are seen"""
+    for text in ['[1 2]', '[,,1]', '[1,]', '[1,,2]', '[{"id" "USR01236"}']:
+        parser = JSONArrayParser()
+        try:
+            parser.feed(text)
+        except json.JSONDecodeError:
+            continue
+        raise AssertionError(f"{text} was accepted")
+
+
+def test_parser_skips_preamble():
+    """Test that code fence markers before the array are ignored"""
+    parser = JSONArrayParser(skip_preamble=True)
+    items = []
+    for char in '```json\n[{"id": "USR01236", "status": 4}]\n```':
+        items.extend(parser.feed(char))
+
+    assert items == [{"id": "USR01236", "status": 4}]
+
+
+def test_unterminated_array():
+    """Test that a truncated file raises JSONDecodeError"""
+    fp = io.StringIO('[{"id": "USR01236"}, {"id": ')
+
+    try:
+        list(iter_json_array(fp))
+    except json.JSONDecodeError:
+        return
+    raise AssertionError("JSONDecodeError was not raised")
+
+
+if __name__ == "__main__":
+    test_iter_json_array()
+    test_parser_waits_for_split_numbers()
+    test_parser_waits_for_split_elements()
+    test_parser_rejects_bad_separators()
+    test_parser_skips_preamble()
+    test_unterminated_array()
+    print("All json_stream tests passed")
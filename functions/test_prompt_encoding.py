@@ -0,0 +1,65 @@
+import json
+
+from chatgpt import build_request_messages, system_prompt
+from prompt_encoding import count_tokens, encode_user_row, split_by_token_budget
+
+EARTHQUAKE = {
+    "id": "EQ201102",
+    "time": "2011-03-11 14:46:23",
+    "epicenter": "宮城県牡鹿郡沖",
+    "intensity": "震度7",
+    "magnitude": 9.0
+}
+
+
+def test_user_row_is_raw_utf8_with_latest_entry_only():
+    """Test that rows keep Japanese unescaped and drop older history entries"""
+    user = {
+        "id": "USR90123",
+        "name": "山口 友也",
+        "address": "宮城県仙台市青葉区",
+        "safety_history": [
+            {"timestamp": "2011-03-10 09:00:00", "status": "安全", "location": "東京都千代田区"},
+            {"timestamp": "2011-03-11 15:00:00", "status": "危険", "location": "宮城県仙台市青葉区"}
+        ]
+    }
+
+    row = encode_user_row(user)
+
+    assert "\\u" not in row
+    assert json.loads(row) == ["USR90123", "宮城県仙台市青葉区", "2011-03-11 15:00:00", "危険", "宮城県仙台市青葉区"]
+
+
+def test_split_respects_token_budget():
+    """Test that every group stays within the budget and no user is lost"""
+    users = [{"id": f"USR{i:05d}", "address": f"所在地不明{i}", "safety_history": []} for i in range(100)]
+    budget = 300
+
+    groups = split_by_token_budget(users, fixed_tokens=100, budget=budget)
+
+    assert len(groups) > 1
+    assert [user["id"] for group_users, _ in groups for user in group_users] == [user["id"] for user in users]
+    for _, rows in groups:
+        assert 100 + sum(count_tokens(row) + 1 for row in rows) <= budget
+
+
+def test_requests_share_a_stable_prefix():
+    """Test that split requests differ only after the account header"""
+    users = [{"id": f"USR{i:05d}", "address": f"所在地不明{i}", "safety_history": []} for i in range(400)]
+
+    requests = build_request_messages(EARTHQUAKE, users, token_budget=count_tokens(system_prompt) + 1500)
+
+    assert len(requests) > 1
+    prefixes = {
+        messages[1]["content"].split('["id","address"', 1)[0]
+        for messages in requests
+    }
+    assert len(prefixes) == 1
+    assert all(messages[0]["content"] == system_prompt for messages in requests)
+
+
+if __name__ == "__main__":
+    test_user_row_is_raw_utf8_with_latest_entry_only()
+    test_split_respects_token_budget()
+    test_requests_share_a_stable_prefix()
+    print("All prompt_encoding tests passed")
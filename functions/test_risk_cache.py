@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import risk_cache
+from fake_firestore import FakeFirestore
+from risk_cache import AssessmentLRU, consult_chatgpt_cached
+from timestamps import JST
+
+EARTHQUAKE = {"id": "EQ201102", "epicenter": "宮城県牡鹿郡沖", "intensity": "震度7", "magnitude": 9.0}
+
+
+def test_only_returned_assessments_are_kept_until_inputs_change():
+    """Test that users the model left out are re-checked after the TTL and users without an id are never cached"""
+    db = FakeFirestore()
+    risk_cache._lru = AssessmentLRU()
+    evaluated = []
+
+    def evaluate(earthquake_info, users):
+        evaluated.append(sorted(user.get("id") or user["name"] for user in users))
+        return [{"id": "USR1", "status": 4}]
+
+    users = [
+        {"id": "USR1", "address": "宮城県仙台市青葉区", "safety_history": []},
+        {"id": "USR2", "address": "福岡県福岡市博多区", "safety_history": []},
+        {"name": "名前/だけ", "address": "東京都千代田区", "safety_history": []},
+    ]
+    assert consult_chatgpt_cached(EARTHQUAKE, users, db=db, evaluate=evaluate) == [{"id": "USR1", "status": 4}]
+    assert consult_chatgpt_cached(EARTHQUAKE, users, db=db, evaluate=evaluate) == [{"id": "USR1", "status": 4}]
+    assert evaluated == [["USR1", "USR2", "名前/だけ"], ["名前/だけ"]]
+
+    # Once the omitted user's entry expires (here in Firestore, with a cold LRU) it is evaluated again
+    stored = db.collection("risk_assessments").document("EQ201102").collection("users")
+    assert sorted(snapshot.id for snapshot in stored.stream()) == ["USR1", "USR2"]
+    assert stored.document("USR1").get().to_dict()["expires_at"] is None
+    stored.document("USR2").update({"expires_at": datetime.now(JST) - timedelta(seconds=1)})
+    risk_cache._lru = AssessmentLRU()
+    consult_chatgpt_cached(EARTHQUAKE, users, db=db, evaluate=evaluate)
+    assert evaluated[-1] == ["USR2", "名前/だけ"]
+
+
+if __name__ == "__main__":
+    test_only_returned_assessments_are_kept_until_inputs_change()
+    print("All risk_cache tests passed")
@@ -0,0 +1,64 @@
+import json
+
+from risk_engine import assess_population, build_population_arrays
+from risk_scoring import prescore_users, score_user
+
+
+def test_engine_agrees_with_local_prescoring():
+    """Test that the vectorized engine matches every locally decided level"""
+    with open('mocks/earth_quake.json', 'r', encoding='utf-8') as f:
+        earthquakes = json.load(f)
+    with open('mocks/users.json', 'r', encoding='utf-8') as f:
+        users = [
+            {"id": user["id"], "address": user["address"], "safety_history": []}
+            for user in json.load(f)
+        ]
+
+    for earthquake in earthquakes:
+        arrays = build_population_arrays(earthquake, users)
+        user_ids, lats, lons, status_codes, same_municipality, uncertainties, unlocated = arrays
+        assessed = {
+            result["id"]: result["status"]
+            for result in assess_population(
+                earthquake, user_ids, lats, lons, status_codes, same_municipality, uncertainties
+            )
+        }
+        decided, _ = prescore_users(earthquake, users)
+
+        assert not unlocated
+        for result in decided:
+            assert assessed[result["id"]] == result["status"], (earthquake["id"], result)
+
+
+def test_prefecture_only_positions_are_bounded_by_the_prefecture():
+    """Test that prefecture-only users and epicenters are not treated as anywhere in Japan"""
+    earthquake = {
+        "id": "EQ201604",
+        "time": "2016-04-16 01:25:05",
+        "epicenter": "熊本県熊本地方",
+        "intensity": "震度7",
+        "magnitude": 7.3
+    }
+    users = [
+        {"id": address, "address": address, "safety_history": []}
+        for address in ("北海道", "沖縄県", "熊本県")
+    ]
+
+    for epicenter in ("熊本県熊本地方", "熊本県"):
+        quake = dict(earthquake, epicenter=epicenter)
+        statuses = {
+            result["id"]: result["status"]
+            for result in assess_population(quake, *build_population_arrays(quake, users)[:-1])
+        }
+        assert "北海道" not in statuses
+        assert score_user(quake, users[0]) == (1, 1)
+        # Okinawa's outer islands stretch toward Kyushu, but never to the epicenter
+        assert statuses["沖縄県"] < 4
+        assert score_user(quake, users[1])[1] < 4
+        assert statuses["熊本県"] >= 4
+
+
+if __name__ == "__main__":
+    test_engine_agrees_with_local_prescoring()
+    test_prefecture_only_positions_are_bounded_by_the_prefecture()
+    print("All risk_engine tests passed")
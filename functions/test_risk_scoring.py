@@ -0,0 +1,65 @@
+from risk_scoring import parse_intensity, prescore_users, score_user
+
+EARTHQUAKE = {
+    "id": "EQ201102",
+    "time": "2011-03-11 14:46:23",
+    "epicenter": "宮城県牡鹿郡沖",
+    "intensity": "震度7",
+    "magnitude": 9.0
+}
+
+
+def test_parse_intensity():
+    """Test that JMA intensity notations map onto the ordinal scale"""
+    assert parse_intensity("震度7") == 9
+    assert parse_intensity("震度６強") == 8
+    assert parse_intensity("震度5-") == 5
+    assert parse_intensity("不明") is None
+
+
+def test_safe_after_quake_is_excluded():
+    """Test that users reported safe after the quake are never sent"""
+    user = {
+        "id": "USR90123",
+        "address": "宮城県仙台市青葉区",
+        "safety_history": [
+            {"timestamp": "2011-03-11T15:00:00+09:00", "status": "SAFE", "location": "宮城県仙台市青葉区"}
+        ]
+    }
+
+    assert score_user(EARTHQUAKE, user) == (0, 0)
+    assert prescore_users(EARTHQUAKE, [user]) == ([], [])
+
+
+def test_far_away_user_is_level_one():
+    """Test that users beyond 200km without a report are decided as level 1"""
+    user = {"id": "USR34567", "address": "福岡県福岡市博多区", "safety_history": []}
+
+    assert score_user(EARTHQUAKE, user) == (1, 1)
+    assert prescore_users(EARTHQUAKE, [user]) == ([], [])
+
+
+def test_prefecture_only_address_is_not_decided_from_the_centroid():
+    """Test that a user located only to the prefecture is sent to the model instead of scored at the centroid"""
+    earthquake = {"time": "2025-03-11T14:46:00+09:00", "epicenter": "北海道函館市", "intensity": "震度6強", "magnitude": 6.5}
+    # 北斗市 is next to 函館市 but only resolves to the Hokkaido centroid in Sapporo
+    user = {"id": "USR11111", "address": "北海道北斗市", "safety_history": []}
+
+    assert score_user(earthquake, user) == (1, 4)
+    assert prescore_users(earthquake, [user]) == ([], [user])
+
+
+def test_unknown_address_is_ambiguous():
+    """Test that users whose address cannot be located are sent to the model"""
+    user = {"id": "USR00000", "address": "住所不明", "safety_history": []}
+
+    assert prescore_users(EARTHQUAKE, [user]) == ([], [user])
+
+
+if __name__ == "__main__":
+    test_parse_intensity()
+    test_safe_after_quake_is_excluded()
+    test_far_away_user_is_level_one()
+    test_prefecture_only_address_is_not_decided_from_the_centroid()
+    test_unknown_address_is_ambiguous()
+    print("All risk_scoring tests passed")
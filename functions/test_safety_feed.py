@@ -0,0 +1,114 @@
+import time
+from datetime import datetime, timedelta
+
+import firebase_client
+from fake_firestore import FakeFirestore
+from safety_feed import SafetyFeed
+from safety_logs import record_safety_responses
+from timestamps import JST
+
+
+def _report(user_id, status):
+    return {"user_id": user_id, "timestamp": datetime.now(JST), "status": status, "location": "東京都千代田区"}
+
+
+def test_subscribers_resume_after_last_event_id():
+    """Test that new reports fan out once and a client resumes from its last event id"""
+    db = FakeFirestore()
+    record_safety_responses(db, [_report("USR1", "SAFE")], log_ids=["OLD"])
+
+    feed = SafetyFeed(db, buffer_size=3)
+    feed.start()
+    # The backlog from the initial snapshot is already behind a new subscriber
+    head, reset = feed.resolve(None)
+    assert not reset
+
+    record_safety_responses(db, [_report("USR2", "NEED_HELP"), _report("USR01235", "SAFE")], log_ids=["A", "DEMO"])
+    events, next_id, missed = feed.wait(head, timeout=2)
+    assert [record["id"] for _, record in events] == ["A"]
+    assert not missed
+
+    record_safety_responses(db, [_report("USR3", "SAFE")], log_ids=["B"])
+    events, last_id, _ = feed.wait(next_id, timeout=2)
+    assert [record["id"] for _, record in events] == ["B"]
+
+    # Ids from another listener, or ones that fell out of the buffer, ask the client to reload
+    assert feed.resolve("unknown-1") == (feed.resolve(None)[0], True)
+    record_safety_responses(db, [_report(f"USR{i}", "SAFE") for i in range(4, 8)])
+    assert feed.wait(last_id, timeout=2)[2]
+
+
+def test_listener_moves_its_lower_bound_without_resetting_clients():
+    """Test that an old listener is replaced by one with a later bound and no event is repeated or lost"""
+    db = FakeFirestore()
+    feed = SafetyFeed(db, backlog=timedelta(milliseconds=200))
+    feed.start()
+    head, _ = feed.resolve(None)
+    record_safety_responses(db, [_report("USR1", "SAFE")], log_ids=["A"])
+    events, event_id, _ = feed.wait(head, timeout=2)
+    assert [record["id"] for _, record in events] == ["A"]
+
+    first_watch = feed._watch
+    time.sleep(0.3)
+    feed.start()
+    record_safety_responses(db, [_report("USR2", "SAFE")], log_ids=["B"])
+    deadline = time.monotonic() + 2
+    while feed._next_watch is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert feed._next_watch is None and len(db._watches) == 1
+    assert feed._watch is not first_watch and not first_watch.is_active
+
+    record_safety_responses(db, [_report("USR3", "SAFE")], log_ids=["C"])
+    received = []
+    while len(received) < 2:
+        events, event_id, missed = feed.wait(event_id, timeout=2)
+        assert not missed and events
+        received += [record["id"] for _, record in events]
+    assert received == ["B", "C"]
+
+
+class UnavailableFirestore:
+    def collection(self, name):
+        raise ConnectionError("Firestore is unreachable")
+
+
+def test_stream_reports_listener_failures():
+    """Test that the stream answers 503 without a listener and sends an error event when it stops"""
+    import main
+
+    feed = main.safety_feed
+    try:
+        main.safety_feed = SafetyFeed(UnavailableFirestore())
+        response = main.app.test_client().get("/safetyCheck/stream")
+        assert response.status_code == 503
+
+        db = FakeFirestore()
+        firebase_client.use_client(db)
+        main.safety_feed = SafetyFeed(db)
+        response = main.app.test_client().get("/safetyCheck/stream", buffered=False)
+        assert response.status_code == 200
+        main.safety_feed._watch.unsubscribe()
+        # The stopped listener is only noticed once the wait for new events ends
+        heartbeat = main.SAFETY_STREAM_HEARTBEAT_SECONDS
+        main.SAFETY_STREAM_HEARTBEAT_SECONDS = 0.1
+        try:
+            body = b"".join(response.response).decode("utf-8")
+        finally:
+            main.SAFETY_STREAM_HEARTBEAT_SECONDS = heartbeat
+        assert "event: ready" in body
+        assert "event: error" in body and "Safety log listener stopped" in body
+        try:
+            main.safety_feed.wait(main.safety_feed.resolve(None)[0], timeout=0)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("wait() did not report the stopped listener")
+    finally:
+        main.safety_feed = feed
+
+
+if __name__ == "__main__":
+    test_subscribers_resume_after_last_event_id()
+    test_listener_moves_its_lower_bound_without_resetting_clients()
+    test_stream_reports_listener_failures()
+    print("All safety_feed tests passed")
@@ -0,0 +1,44 @@
+from fake_firestore import FakeFirestore
+from safety_logs import record_safety_responses
+from safety_summary import SAFETY_SUMMARY_COLLECTION, get_safety_summary, rebuild_safety_summary
+
+
+def _summary_counts(db):
+    summary = get_safety_summary(db)
+    summary.pop("generated_at")
+    return summary
+
+
+def test_counters_follow_latest_status_changes():
+    """Test that changing a user's latest status moves them between buckets and matches a rebuild"""
+    db = FakeFirestore()
+    for user_id in ["USR1", "USR2", "USR3", "USR01235"]:
+        db.collection("users").document(user_id).set({"id": user_id, "name": user_id})
+
+    record_safety_responses(db, [
+        {"user_id": "USR1", "timestamp": "2025-03-11T15:00:00+09:00", "status": "NEED_HELP", "location": "宮城県仙台市青葉区"},
+        {"user_id": "USR2", "timestamp": "2025-03-11T15:00:00+09:00", "status": "SAFE", "location": "東京都千代田区"},
+        {"user_id": "USR01235", "timestamp": "2025-03-11T15:00:00+09:00", "status": "SAFE", "location": "東京都千代田区"},
+    ])
+    record_safety_responses(db, [
+        {"user_id": "USR1", "timestamp": "2025-03-11T16:00:00+09:00", "status": "SAFE", "location": "東京都新宿区"},
+        # Older than the stored status, so nothing changes
+        {"user_id": "USR2", "timestamp": "2025-03-11T14:00:00+09:00", "status": "NEED_HELP", "location": "所在地不明"},
+    ])
+
+    summary = _summary_counts(db)
+    assert summary["total_users"] == 3
+    assert summary["answered"] == 2
+    assert summary["unanswered"] == 1
+    assert summary["by_status"] == {"SAFE": 2}
+    assert summary["by_prefecture"] == {"東京都": {"SAFE": 2, "total": 2}}
+
+    for snapshot in db.collection(SAFETY_SUMMARY_COLLECTION).stream():
+        snapshot.reference.delete()
+    assert rebuild_safety_summary(db) == 2
+    assert _summary_counts(db) == summary
+
+
+if __name__ == "__main__":
+    test_counters_follow_latest_status_changes()
+    print("All safety_summary tests passed")
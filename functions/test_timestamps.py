@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+from fake_firestore import FakeFirestore
+from migrate_timestamps import migrate_collection
+from safety_logs import build_safety_logs_query, iter_safety_logs, record_safety_responses
+from timestamps import format_timestamp, normalize_timestamps, parse_timestamp
+
+
+def test_strings_and_datetimes_normalize_to_jst():
+    """Test that both string formats parse as Japan time and datetimes render as JST ISO"""
+    assert parse_timestamp("2011-03-11 14:46:23") == parse_timestamp("2011-03-11T14:46:23+09:00")
+    assert parse_timestamp("not a time") is None
+    assert format_timestamp(datetime(2011, 3, 11, 5, 46, 23, tzinfo=timezone.utc)) == "2011-03-11T14:46:23+09:00"
+
+    record = {"timestamp": "2025-03-11T15:00:00+09:00", "status": "SAFE"}
+    assert isinstance(normalize_timestamps(record, ("timestamp",))["timestamp"], datetime)
+    assert normalize_timestamps({"status": "SAFE"}, ("timestamp",)) == {"status": "SAFE"}
+
+
+def test_migration_enables_range_queries_after_earthquake():
+    """Test that migrated string timestamps can be filtered to reports after a quake"""
+    db = FakeFirestore()
+    for i, timestamp in enumerate(["2025-03-11 14:00:00", "2025-03-11T15:00:00+09:00", "2025-03-11T16:00:00+09:00"]):
+        db.collection("safety_response_logs").document(f"LOG{i}").set({
+            "user_id": f"USR{i}", "timestamp": timestamp, "status": "SAFE", "location": "東京都千代田区"
+        })
+
+    assert migrate_collection(db, "safety_response_logs", ("timestamp",), page_size=2) == (3, 3)
+    # Already migrated documents are left alone on a rerun
+    assert migrate_collection(db, "safety_response_logs", ("timestamp",)) == (3, 0)
+
+    record_safety_responses(db, [
+        {"user_id": "USR9", "timestamp": "2025-03-11T15:30:00+09:00", "status": "NEED_HELP", "location": "A"}
+    ])
+    query = build_safety_logs_query(db, after="2025-03-11 15:00:00")
+    assert [record["user_id"] for record in iter_safety_logs(query)] == ["USR2", "USR9"]
+
+
+if __name__ == "__main__":
+    test_strings_and_datetimes_normalize_to_jst()
+    test_migration_enables_range_queries_after_earthquake()
+    print("All timestamps tests passed")
@@ -0,0 +1,69 @@
+import time
+
+from fake_firestore import FakeFirestore
+from user_graph import USER_CONNECTIONS_PATH, CachedUserGraph, UserGraph, iter_edges_from_json
+
+
+def test_neighbors_are_undirected_and_deduplicated():
+    """Test that connections work in both directions and repeats collapse"""
+    graph = UserGraph.from_edges([
+        ("A", "B"),
+        ("B", "A"),
+        ("A", "C"),
+        ("C", "C"),
+    ])
+
+    assert sorted(graph.neighbors("A")) == ["B", "C"]
+    assert graph.neighbors("B") == ["A"]
+    assert graph.neighbors("unknown") == []
+    assert graph.edge_count == 2
+
+
+def test_k_hop_reports_shortest_distance():
+    """Test that BFS levels give the minimum hop count"""
+    graph = UserGraph.from_edges([
+        ("A", "B"),
+        ("B", "C"),
+        ("C", "D"),
+        ("A", "C"),
+        ("D", "E"),
+    ])
+
+    assert graph.k_hop("A", 1) == {"B": 1, "C": 1}
+    assert graph.k_hop("A", 2) == {"B": 1, "C": 1, "D": 2}
+    assert graph.k_hop("A", 5) == {"B": 1, "C": 1, "D": 2, "E": 3}
+
+
+def test_mock_connections_load():
+    """Test that the bundled connections file builds a graph"""
+    graph = UserGraph.from_edges(iter_edges_from_json())
+
+    assert graph.edge_count == 25
+    assert "USR01236" in graph.neighbors("USR01235")
+
+
+def test_cached_graph_is_refreshed_in_the_background():
+    """Test that the mock file is only used when asked for and that an expired graph is served while it rebuilds"""
+    db = FakeFirestore()
+    assert len(CachedUserGraph(db).get()) == 0
+    assert CachedUserGraph(db, fallback_path=USER_CONNECTIONS_PATH).get().edge_count == 25
+
+    db.collection("user_connections").document("A_B").set({"user1_id": "A", "user2_id": "B"})
+    cached = CachedUserGraph(db, ttl_seconds=0)
+    first = cached.get()
+    assert first.neighbors("A") == ["B"]
+
+    db.collection("user_connections").document("A_C").set({"user1_id": "A", "user2_id": "C"})
+    assert cached.get() is first
+    deadline = time.monotonic() + 5
+    while cached.get() is first and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(cached.get().neighbors("A")) == ["B", "C"]
+
+
+if __name__ == "__main__":
+    test_neighbors_are_undirected_and_deduplicated()
+    test_k_hop_reports_shortest_distance()
+    test_mock_connections_load()
+    test_cached_graph_is_refreshed_in_the_background()
+    print("All user_graph tests passed")
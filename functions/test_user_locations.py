@@ -0,0 +1,89 @@
+import random
+
+from fake_firestore import FakeFirestore
+from geocoding import with_location_fields
+from geohash import encode, query_ranges
+from risk_scoring import haversine_km
+from safety_logs import record_safety_responses
+from user_locations import backfill_user_locations, find_users_near_earthquake, iter_users_within
+
+
+def test_query_ranges_cover_the_circle():
+    """Test that every point within the radius falls in one of the geohash ranges"""
+    lat, lon, radius_km = 35.6812, 139.7671, 120
+    ranges = query_ranges(lat, lon, radius_km)
+    assert len(ranges) <= 16
+
+    rng = random.Random(0)
+    for _ in range(2000):
+        point = (lat + rng.uniform(-1.2, 1.2), lon + rng.uniform(-1.5, 1.5))
+        if haversine_km(lat, lon, *point) <= radius_km:
+            geohash = encode(*point)
+            assert any(start <= geohash < end for start, end in ranges)
+
+
+def test_near_earthquake_includes_far_danger_reports():
+    """Test that candidates are users within reach plus far users who reported danger after the quake"""
+    db = FakeFirestore()
+    users = {
+        "USR1": "東京都千代田区",
+        "USR2": "神奈川県横浜市",
+        "USR3": "北海道札幌市",
+        "USR4": "福岡県福岡市",
+    }
+    for user_id, address in users.items():
+        db.collection("users").document(user_id).set(
+            with_location_fields({"id": user_id, "name": user_id, "address": address}, "address")
+        )
+    record_safety_responses(db, [
+        {"user_id": "USR3", "timestamp": "2025-03-11T15:00:00+09:00", "status": "NEED_HELP", "location": "北海道札幌市"},
+        {"user_id": "USR4", "timestamp": "2025-03-11T15:00:00+09:00", "status": "SAFE", "location": "福岡県福岡市"},
+    ])
+
+    near = {user_id for user_id, _, _ in iter_users_within(db, 35.6812, 139.7671, 50)}
+    assert near == {"USR1", "USR2"}
+
+    earthquake = {"epicenter": "東京都千代田区", "magnitude": "6.0", "intensity": "5強", "time": "2025-03-11T14:46:00+09:00"}
+    candidates = {user["id"]: user for user in find_users_near_earthquake(db, earthquake, 4)}
+    assert set(candidates) == {"USR1", "USR2", "USR3"}
+    assert candidates["USR3"]["safety_history"][0]["status"] == "NEED_HELP"
+
+    # A quake with no usable epicenter asks the caller to scan every user
+    assert find_users_near_earthquake(db, dict(earthquake, epicenter="所在地不明"), 4) is None
+
+
+def test_coarse_users_are_candidates_within_their_extent():
+    """Test that coarse users are kept when their prefecture can reach the epicenter and unlocated users always"""
+    db = FakeFirestore()
+    users = {
+        "CITY": "神奈川県横浜市",
+        "FAR_CITY": "福岡県福岡市",
+        "PREFECTURE": "北海道",
+        "NEAR_PREFECTURE": "埼玉県",
+        "UNKNOWN": "所在地不明",
+    }
+    for user_id, address in users.items():
+        db.collection("users").document(user_id).set(
+            with_location_fields({"id": user_id, "name": user_id, "address": address}, "address")
+        )
+    # Stored before location_level existed; the backfill adds it
+    db.collection("users").document("LEGACY").set({"id": "LEGACY", "name": "LEGACY", "address": "北海道"})
+    assert backfill_user_locations(db) == 1
+    assert db.collection("users").document("LEGACY").get().get("location_level") == "prefecture"
+    assert db.collection("users").document("UNKNOWN").get().get("location_level") == "unknown"
+    assert backfill_user_locations(db) == 0
+
+    earthquake = {"epicenter": "東京都千代田区", "magnitude": "6.0", "intensity": "5強", "time": "2025-03-11T14:46:00+09:00"}
+    candidates = {user["id"] for user in find_users_near_earthquake(db, earthquake, 4)}
+    assert candidates == {"CITY", "NEAR_PREFECTURE", "UNKNOWN"}
+
+    # An epicenter known only by its prefecture widens the search by the prefecture's extent
+    candidates = {user["id"] for user in find_users_near_earthquake(db, dict(earthquake, epicenter="東京都"), 4)}
+    assert candidates == {"CITY", "NEAR_PREFECTURE", "UNKNOWN"}
+
+
+if __name__ == "__main__":
+    test_query_ranges_cover_the_circle()
+    test_near_earthquake_includes_far_danger_reports()
+    test_coarse_users_are_candidates_within_their_extent()
+    print("All user_locations tests passed")
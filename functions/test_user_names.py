@@ -0,0 +1,131 @@
+import threading
+
+import instrumentation
+from instrumentation import RequestStats
+
+
+class RecordingIndex:
+    """Stand-in for UsersIndex that records each lookup and counts it as Firestore reads"""
+
+    def __init__(self, users, mirrored=False, start=None, release=None):
+        self.users = users
+        self.mirrored = mirrored
+        self.calls = []
+        self.threads = set()
+        # The first lookup waits for start, later ones for release
+        self._start = start
+        self._release = release
+        self._lock = threading.Lock()
+
+    def is_mirrored(self):
+        return self.mirrored
+
+    def get_many(self, user_ids):
+        with self._lock:
+            first_call = not self.calls
+            self.calls.append(set(user_ids))
+            self.threads.add(threading.current_thread().name)
+        gate = self._start if first_call else self._release
+        if gate is not None:
+            gate.wait(5)
+        instrumentation.record_firestore(reads=len(user_ids))
+        return {user_id: self.users[user_id] for user_id in user_ids if user_id in self.users}
+
+
+def _records(user_ids):
+    return [{"id": f"LOG{i}", "user_id": user_id, "status": "SAFE"} for i, user_id in enumerate(user_ids)]
+
+
+def _with_index(index, run):
+    import main
+
+    users_index = main.users_index
+    main.users_index = index
+    try:
+        with main.app.test_request_context("/safetyCheck"):
+            stats = instrumentation.g._request_stats = RequestStats("/safetyCheck")
+            return run(main), stats
+    finally:
+        main.users_index = users_index
+
+
+def test_names_keep_record_order_and_each_user_is_read_once():
+    """Test that chunks come back in order, repeated users are not re-read and worker reads count toward the request"""
+    user_ids = ["U1", "U2", "U1", "U3", "U2", "U4", "U1", "MISSING"]
+    users = {user_id: {"name": f"Name {user_id}"} for user_id in ["U1", "U2", "U3", "U4"]}
+
+    for mirrored in (False, True):
+        index = RecordingIndex(users, mirrored=mirrored)
+        records, stats = _with_index(index, lambda main: list(main._iter_with_user_names(_records(user_ids), 2)))
+
+        assert [record["id"] for record in records] == [f"LOG{i}" for i in range(len(user_ids))]
+        assert [record.get("user_name") for record in records] == [
+            "Name U1", "Name U2", "Name U1", "Name U3", "Name U2", "Name U4", "Name U1", None
+        ]
+        assert index.calls == [{"U1", "U2"}, {"U3"}, {"U4"}, {"MISSING"}]
+        assert stats.firestore_reads == 5
+        # The mirrored index is read inline, the Firestore-backed one on the lookup workers
+        assert all(name.startswith("user-lookup") for name in index.threads) != mirrored
+
+
+def test_closing_the_stream_cancels_queued_lookups():
+    """Test that lookups not yet started are dropped when the client goes away"""
+    import main
+
+    all_read = threading.Event()
+    release = threading.Event()
+    index = RecordingIndex({}, start=all_read, release=release)
+    chunk_count = main.MAX_PENDING_LOOKUPS
+
+    def read_logs():
+        yield from _records([f"U{i}" for i in range(chunk_count)])
+        all_read.set()
+
+    def run(main):
+        # Every chunk is submitted before the first one finishes; the others then fill the workers and queue
+        records = main._iter_with_user_names(read_logs(), 1)
+        next(records)
+        records.close()
+
+    try:
+        _with_index(index, run)
+    finally:
+        release.set()
+
+    main.get_user_lookup_executor().submit(lambda: None).result(timeout=5)
+    assert len(index.calls) <= main.USER_LOOKUP_WORKERS + 1 < chunk_count
+
+
+def test_slow_lookups_bound_the_chunks_read_ahead():
+    """Test that reading stops once too many chunks wait for their users"""
+    start = threading.Event()
+    index = RecordingIndex({}, start=start)
+    read_count = 0
+
+    def read_logs():
+        nonlocal read_count
+        for record in _records([f"U{i}" for i in range(30)]):
+            read_count += 1
+            yield record
+
+    def run(main):
+        records = main._iter_with_user_names(read_logs(), 1)
+        timer = threading.Timer(0.2, start.set)
+        timer.start()
+        try:
+            next(records)
+        finally:
+            timer.cancel()
+            records.close()
+        return main.MAX_PENDING_LOOKUPS
+
+    max_pending, _ = _with_index(index, run)
+    # The first chunk is emitted while the one past the limit is still waiting to be read
+    assert read_count == max_pending + 1
+
+
+if __name__ == "__main__":
+    test_names_keep_record_order_and_each_user_is_read_once()
+    test_closing_the_stream_cancels_queued_lookups()
+    test_slow_lookups_bound_the_chunks_read_ahead()
+    print("All user name tests passed")
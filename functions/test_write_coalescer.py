@@ -0,0 +1,123 @@
+from datetime import datetime
+
+import firebase_client
+from fake_firestore import FakeFirestore, Transaction
+from safety_summary import get_safety_summary
+from timestamps import JST
+from write_coalescer import SafetyWriteCoalescer
+
+
+class CountingFirestore(FakeFirestore):
+    def __init__(self):
+        super().__init__()
+        self.transaction_count = 0
+
+    def transaction(self, **kwargs):
+        self.transaction_count += 1
+        return super().transaction(**kwargs)
+
+
+class CommitThenFailTransaction(Transaction):
+    def _commit(self):
+        # The writes land, but the caller sees an error (like a deadline passing after the commit)
+        super()._commit()
+        raise TimeoutError("Deadline exceeded")
+
+
+class FlakyCommitFirestore(FakeFirestore):
+    def __init__(self, failures=1):
+        super().__init__()
+        self.failures = failures
+
+    def transaction(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            return CommitThenFailTransaction(self)
+        return super().transaction(**kwargs)
+
+
+def _report(user_id, status="SAFE"):
+    return {"user_id": user_id, "timestamp": datetime.now(JST), "status": status, "location": "東京都千代田区"}
+
+
+def test_reports_are_grouped_and_bad_ones_fail_alone():
+    """Test that concurrent reports share one commit and a bad report only fails its own future"""
+    db = CountingFirestore()
+    coalescer = SafetyWriteCoalescer(db, max_delay=0.2)
+
+    futures = [coalescer.submit(_report(f"USR{i}")) for i in range(3)]
+    log_ids = [future.result(timeout=5) for future in futures]
+    assert len(set(log_ids)) == 3
+    assert db.transaction_count == 1
+
+    # An unhashable user_id breaks the shared transaction; the group is retried one by one
+    good, bad, other = [coalescer.submit(_report(user_id)) for user_id in ["USR7", ["USR8"], "USR9"]]
+    assert good.result(timeout=5) and other.result(timeout=5)
+    try:
+        bad.result(timeout=5)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("The bad report did not fail")
+    assert len(db.collection("safety_response_logs").get()) == 5
+
+
+def test_retried_reports_are_not_stored_twice():
+    """Test that a group whose commit landed but raised is retried under the same log ids"""
+    db = FlakyCommitFirestore()
+    for i in range(3):
+        db.collection("users").document(f"USR{i}").set({"id": f"USR{i}", "name": f"User {i}"})
+    coalescer = SafetyWriteCoalescer(db, max_delay=0.2)
+
+    futures = [coalescer.submit(_report(f"USR{i}", "NEED_HELP")) for i in range(3)]
+    log_ids = [future.result(timeout=5) for future in futures]
+
+    assert sorted(snapshot.id for snapshot in db.collection("safety_response_logs").stream()) == sorted(log_ids)
+    summary = get_safety_summary(db)
+    assert summary["answered"] == 3 and summary["by_status"] == {"NEED_HELP": 3}
+
+
+def test_safety_post_routes():
+    """Test that coalesced writes count toward /safetyPost and that batch reports are validated"""
+    import main
+
+    db = FakeFirestore()
+    for i in range(main.MAX_BATCH_REPORTS):
+        db.collection("users").document(f"USR{i}").set({"id": f"USR{i}", "name": f"User {i}"})
+    firebase_client.use_client(db)
+    client = main.app.test_client()
+
+    response = client.post("/safetyPost", json={"status": "SAFE"})
+    assert response.status_code == 200
+    # The log and the latest status, written by the coalescer's thread
+    assert '2 writes' in response.headers["Server-Timing"]
+
+    reports = [{"user_id": f"USR{i}", "status": "SAFE"} for i in range(main.MAX_BATCH_REPORTS)]
+    response = client.post("/safetyPost/batch", json={"reports": reports})
+    assert response.status_code == 200
+    assert len(response.json["ids"]) == main.MAX_BATCH_REPORTS
+
+    response = client.post("/safetyPost/batch", json=reports + [{"user_id": "USR1", "status": "SAFE"}])
+    assert response.status_code == 400
+    assert client.post("/safetyPost/batch", json=[{"user_id": "USR1"}]).status_code == 400
+
+    # Unknown users are rejected before anything is written
+    response = client.post("/safetyPost/batch", json=[
+        {"user_id": "USR1", "status": "SAFE"},
+        {"user_id": "NOBODY", "status": "SAFE"},
+    ])
+    assert response.status_code == 400
+    assert "NOBODY" in response.json["error"]
+    assert len(db.collection("safety_response_logs").get()) == main.MAX_BATCH_REPORTS + 1
+
+    # A user created after the index cached the miss is still accepted
+    db.collection("users").document("NOBODY").set({"id": "NOBODY", "name": "New user"})
+    response = client.post("/safetyPost/batch", json=[{"user_id": "NOBODY", "status": "SAFE"}])
+    assert response.status_code == 200
+
+
+if __name__ == "__main__":
+    test_reports_are_grouped_and_bad_ones_fail_alone()
+    test_retried_reports_are_not_stored_twice()
+    test_safety_post_routes()
+    print("All write_coalescer tests passed")
@@ -0,0 +1,74 @@
+"""
+タイムスタンプの正規化
+
+Firestoreには文字列ではなくネイティブのタイムスタンプ（タイムゾーン付き datetime）で保存し、
+範囲の絞り込みと並べ替えをインデックスで実行できるようにする。
+文字列はISO形式・"YYYY-MM-DD HH:MM:SS" を受け付け、タイムゾーンの無い値は日本時間として扱う。
+APIの応答では日本時間のISO形式の文字列に戻す。
+"""
+from datetime import datetime, timedelta, timezone
+
+# 日本時間（夏時間が無いため固定オフセットで十分）
+JST = timezone(timedelta(hours=9))
+
+# コレクション名 -> タイムスタンプを保存するフィールド
+TIMESTAMP_FIELDS = {
+    'safety_response_logs': ('timestamp',),
+    'user_latest_status': ('timestamp',),
+    'earthquakes': ('time',),
+    'user_connections': ('created_at',),
+}
+
+# 解釈できないタイムスタンプを並べ替えで最も古いものとして扱うための値
+_OLDEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def parse_timestamp(value):
+    """
+    文字列または datetime をタイムゾーン付き datetime に変換する（解釈できない場合は None）
+    """
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    else:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=JST)
+    return parsed
+
+
+def format_timestamp(value):
+    """
+    datetime を日本時間のISO形式の文字列にする（datetime 以外はそのまま返す）
+    """
+    if not isinstance(value, datetime):
+        return value
+    return parse_timestamp(value).astimezone(JST).isoformat()
+
+
+def timestamp_sort_key(value):
+    # Strings written before the migration and native timestamps sort together
+    parsed = parse_timestamp(value)
+    return parsed if parsed is not None else _OLDEST
+
+
+def normalize_timestamps(data, fields):
+    """
+    data の fields にある文字列のタイムスタンプを datetime に変換した辞書を返す
+
+    解釈できない文字列はそのまま残す。変換が不要な場合は data をそのまま返す。
+    """
+    converted = {}
+    for field in fields:
+        value = data.get(field)
+        if isinstance(value, str):
+            parsed = parse_timestamp(value)
+            if parsed is not None:
+                converted[field] = parsed
+    if not converted:
+        return data
+    return {**data, **converted}
@@ -0,0 +1,209 @@
+"""
+ユーザー間のつながり（user_connections）の隣接インデックス
+
+ユーザーIDを連番の整数に置き換え、CSR形式（offsets / neighbors の2本の int32 配列）で保持する。
+ユーザー u の隣接ユーザーは neighbors[offsets[u]:offsets[u + 1]] にあり、
+数百万件のつながりでも1件あたり8バイト程度で済む。
+"""
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from json_stream import iter_json_array
+
+USER_CONNECTIONS_COLLECTION = 'user_connections'
+USER_CONNECTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mocks', 'user_connections.json')
+
+MAX_HOPS = 3
+GRAPH_TTL_SECONDS = 600
+
+
+def _sorted_unique(values):
+    # Same result as np.unique, which is much slower than a plain sort on large int arrays
+    values = np.sort(values)
+    if len(values) > 1:
+        unique = np.ones(len(values), dtype=bool)
+        unique[1:] = values[1:] != values[:-1]
+        values = values[unique]
+    return values
+
+
+class UserGraph:
+    """
+    無向グラフとして扱うユーザー間のつながり
+    """
+
+    def __init__(self, user_ids, offsets, neighbors, index=None):
+        self._user_ids = user_ids
+        self._index = index if index is not None else {user_id: i for i, user_id in enumerate(user_ids)}
+        self._offsets = offsets
+        self._neighbors = neighbors
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        (user1_id, user2_id) のイテラブルからグラフを作成する（重複したつながりと自己ループは除く）
+        """
+        index = {}
+        # array('i') keeps the raw edge list at 4 bytes per id while streaming
+        sources = array('i')
+        targets = array('i')
+        for user1_id, user2_id in edges:
+            if user1_id == user2_id:
+                continue
+            source = index.get(user1_id)
+            if source is None:
+                source = index[user1_id] = len(index)
+            target = index.get(user2_id)
+            if target is None:
+                target = index[user2_id] = len(index)
+            sources.append(source)
+            targets.append(target)
+
+        user_count = len(index)
+        sources = np.frombuffer(sources, dtype=np.int32).astype(np.int64)
+        targets = np.frombuffer(targets, dtype=np.int32).astype(np.int64)
+        # Both directions packed into one sortable key (source << 32 | target);
+        # after sorting, duplicate connections are adjacent and dropped with a mask
+        keys = _sorted_unique(np.concatenate([(sources << 32) | targets, (targets << 32) | sources]))
+        del sources, targets
+
+        offsets = np.zeros(user_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys >> 32, minlength=user_count), out=offsets[1:])
+        neighbors = (keys & 0xFFFFFFFF).astype(np.int32)
+        return cls(list(index), offsets, neighbors, index=index)
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._index
+
+    @property
+    def edge_count(self):
+        return len(self._neighbors) // 2
+
+    def neighbors(self, user_id):
+        """
+        user_id と直接つながっているユーザーIDのリスト（グラフに無いユーザーは空リスト）
+        """
+        index = self._index.get(user_id)
+        if index is None:
+            return []
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return [self._user_ids[neighbor] for neighbor in self._neighbors[start:end].tolist()]
+
+    def k_hop(self, user_id, k):
+        """
+        user_id から k ホップ以内のユーザーを {user_id: ホップ数} の辞書で返す（user_id 自身は含まない）
+
+        幅優先探索の各段をまとめて配列演算で展開する。
+        """
+        index = self._index.get(user_id)
+        if index is None or k < 1:
+            return {}
+
+        visited = np.zeros(len(self._user_ids), dtype=bool)
+        visited[index] = True
+        frontier = np.array([index], dtype=np.int64)
+        distances = {}
+        for hop in range(1, k + 1):
+            starts = self._offsets[frontier]
+            counts = self._offsets[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+            # Positions of every neighbor of every frontier node, without a Python loop
+            positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            reached = self._neighbors[positions]
+            reached = _sorted_unique(reached[~visited[reached]])
+            if len(reached) == 0:
+                break
+            visited[reached] = True
+            for neighbor in reached.tolist():
+                distances[self._user_ids[neighbor]] = hop
+            frontier = reached
+        return distances
+
+
+def iter_edges_from_json(json_path=USER_CONNECTIONS_PATH):
+    """
+    user_connections.json 形式のファイルからつながりをストリーミングで読み込む
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        for connection in iter_json_array(f):
+            yield connection['user1_id'], connection['user2_id']
+
+
+def iter_edges_from_firestore(db, collection=USER_CONNECTIONS_COLLECTION):
+    """
+    user_connections コレクションからつながりを読み込む（IDのフィールドだけを取得する）
+    """
+    query = db.collection(collection).select(['user1_id', 'user2_id'])
+    for snapshot in query.stream():
+        yield snapshot.get('user1_id'), snapshot.get('user2_id')
+
+
+class CachedUserGraph:
+    """
+    Firestore から読み込んだ UserGraph を ttl_seconds の間使い回す
+
+    期限が切れた後は古いグラフを返しつつバックグラウンドで再構築する（待たされるのは初回の読み込みだけ）。
+    コレクションが空の場合は空のグラフになる。fallback_path を指定した場合のみ、そのファイル
+    （開発用の mocks/user_connections.json など）から作成する。
+    """
+
+    def __init__(self, db, collection=USER_CONNECTIONS_COLLECTION, ttl_seconds=GRAPH_TTL_SECONDS, fallback_path=None):
+        self._db = db
+        self._collection = collection
+        self._ttl_seconds = ttl_seconds
+        self._fallback_path = fallback_path
+        self._lock = threading.Lock()
+        # Serializes the first load only; refreshes never block readers
+        self._load_lock = threading.Lock()
+        self._graph = None
+        self._expires_at = 0.0
+        self._refreshing = False
+
+    def _build(self):
+        graph = UserGraph.from_edges(iter_edges_from_firestore(self._db, self._collection))
+        if len(graph) == 0 and self._fallback_path is not None:
+            print(f"{self._collection} is empty; loading connections from {self._fallback_path}")
+            graph = UserGraph.from_edges(iter_edges_from_json(self._fallback_path))
+        print(f"User graph loaded: {len(graph)} users, {graph.edge_count} connections")
+        return graph
+
+    def _store(self, graph):
+        with self._lock:
+            self._graph = graph
+            self._expires_at = time.monotonic() + self._ttl_seconds
+            self._refreshing = False
+
+    def _refresh(self):
+        try:
+            self._store(self._build())
+        except Exception as e:
+            # Keep serving the old graph; the next get() tries again
+            print(f"User graph refresh failed: {str(e)}")
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        with self._lock:
+            graph = self._graph
+            refresh = graph is not None and not self._refreshing and time.monotonic() >= self._expires_at
+            if refresh:
+                self._refreshing = True
+
+        if graph is None:
+            with self._load_lock:
+                if self._graph is None:
+                    self._store(self._build())
+                return self._graph
+
+        if refresh:
+            threading.Thread(target=self._refresh, name='user-graph-refresh', daemon=True).start()
+        return graph
@@ -0,0 +1,174 @@
+"""
+ユーザー・安否情報の位置（ジオハッシュ・緯度経度）の保存と、震源地の近くのユーザーの検索
+
+users と安否ログには住所・所在地から求めた geohash / lat / lon / location_level を保存し、
+震源地からの距離で絞り込むときはジオハッシュの範囲クエリで候補のユーザーだけを読み込む。
+都道府県・震央地域までしか分からないユーザーは代表点が範囲の外でも範囲内にいる可能性があるため、
+location_level のクエリで別に読み込み、都道府県・震央地域の広がりの分だけ近い側で判定する。
+位置を推定できないユーザーは判断できないため常に候補に含める。
+
+使い方: python user_locations.py   # 位置の無い既存ユーザーに geohash / lat / lon / location_level を追加する
+"""
+import math
+
+from geocoding import (
+    LEVEL_MUNICIPALITY,
+    LEVEL_PREFECTURE,
+    LEVEL_REGION,
+    LEVEL_UNKNOWN,
+    geocode,
+    level_uncertainty_km,
+    location_fields,
+    uncertainty_km,
+)
+from geohash import query_ranges
+from risk_scoring import DANGER_STATUSES, haversine_km, parse_time, reach_radius_km
+from safety_logs import USER_LATEST_STATUS_COLLECTION, USERS_COLLECTION, get_latest_statuses
+
+# Firestoreの1バッチ500書き込み制限に収まる1ページの件数
+BACKFILL_PAGE_SIZE = 400
+
+# ジオハッシュの範囲クエリでは漏れうるため、location_level のクエリで別に読み込む location_level
+COARSE_LEVELS = [LEVEL_PREFECTURE, LEVEL_REGION, LEVEL_UNKNOWN]
+
+
+def iter_users_within(db, lat, lon, radius_km):
+    """
+    (lat, lon) から radius_km 以内のユーザーを (ドキュメントID, データ, 距離km) で返すジェネレーター
+
+    ジオハッシュの範囲ごとに1クエリを発行し、セルの端で円の外に出るユーザーは距離で除外する。
+    代表点が実際の位置からずれうるユーザー（震央地域など）は、その分だけ近い側で判定する。
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    collection = db.collection(USERS_COLLECTION)
+    for start, end in query_ranges(lat, lon, radius_km):
+        query = (
+            collection
+            .where(filter=FieldFilter('geohash', '>=', start))
+            .where(filter=FieldFilter('geohash', '<', end))
+        )
+        for snapshot in query.stream():
+            data = snapshot.to_dict()
+            distance = haversine_km(lat, lon, data['lat'], data['lon'])
+            if distance - stored_uncertainty_km(data) <= radius_km:
+                yield snapshot.id, data, distance
+
+
+def stored_uncertainty_km(data):
+    """
+    保存したユーザーの代表点と実際の位置の距離の上限（km）を返す（geocoding.uncertainty_km と同じ値）
+    """
+    # Documents written before location_level was stored hold municipality positions
+    level = data.get('location_level', LEVEL_MUNICIPALITY)
+    location = geocode(data.get('address')) if level == LEVEL_PREFECTURE else None
+    return level_uncertainty_km(level, location.prefecture if location is not None else None)
+
+
+def iter_coarse_users(db):
+    """
+    位置が都道府県・震央地域までしか分からない、または推定できないユーザーを (ドキュメントID, データ) で返す
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = db.collection(USERS_COLLECTION).where(filter=FieldFilter('location_level', 'in', COARSE_LEVELS))
+    for snapshot in query.stream():
+        yield snapshot.id, snapshot.to_dict()
+
+
+def find_users_near_earthquake(db, earthquake_info, min_intensity):
+    """
+    推定震度が min_intensity 以上になりうる範囲のユーザーと、地震後に「危険」を報告したユーザーを
+    consult_chatgpt と同じ形式のリストで返す
+
+    「危険」の報告は距離に関わらず危険度を上げるため、範囲の外でも含める。位置が粗いユーザー（COARSE_LEVELS）は
+    都道府県・震央地域の広がりの分だけ近い側で判定し、位置が無いユーザーは範囲の内外を判断できないため含める。
+    震源地の代表点がずれうる分は範囲を広げる。
+    範囲で絞り込めない場合（震源地・震度を解釈できない、全域が対象になる）は None を返す。
+    """
+    epicenter = geocode(earthquake_info.get('epicenter'))
+    radius_km = reach_radius_km(earthquake_info, min_intensity)
+    if epicenter is None or radius_km == math.inf or uncertainty_km(epicenter) == math.inf:
+        return None
+
+    users = {}
+    if radius_km is not None:
+        search_radius_km = radius_km + uncertainty_km(epicenter)
+        for user_id, data, _ in iter_users_within(db, epicenter.lat, epicenter.lon, search_radius_km):
+            users[user_id] = data
+        for user_id, data in iter_coarse_users(db):
+            if 'lat' in data and (
+                haversine_km(epicenter.lat, epicenter.lon, data['lat'], data['lon']) - stored_uncertainty_km(data)
+                > search_radius_km
+            ):
+                continue
+            users[user_id] = data
+    latest_statuses = get_latest_statuses(db, list(users)) if users else {}
+
+    quake_time = parse_time(earthquake_info.get('time'))
+    if quake_time is not None:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        reported = (
+            db.collection(USER_LATEST_STATUS_COLLECTION)
+            .where(filter=FieldFilter('status', 'in', sorted(DANGER_STATUSES)))
+            .where(filter=FieldFilter('timestamp', '>', quake_time))
+        )
+        for snapshot in reported.stream():
+            latest_statuses[snapshot.id] = snapshot.to_dict()
+        missing = [user_id for user_id in latest_statuses if user_id not in users]
+        if missing:
+            collection = db.collection(USERS_COLLECTION)
+            for snapshot in db.get_all([collection.document(user_id) for user_id in missing]):
+                if snapshot.exists:
+                    users[snapshot.id] = snapshot.to_dict()
+
+    return [
+        {
+            'id': user_id,
+            'name': data.get('name'),
+            'address': data.get('address'),
+            'safety_history': [latest_statuses[user_id]] if user_id in latest_statuses else [],
+        }
+        for user_id, data in users.items()
+    ]
+
+
+def backfill_user_locations(db, page_size=BACKFILL_PAGE_SIZE):
+    """
+    位置（location_level を含む）が住所と合わないユーザーを更新し、更新した人数を返す（最新のユーザーは書き換えない）
+    """
+    collection = db.collection(USERS_COLLECTION)
+    updated_count = 0
+    last_snapshot = None
+    while True:
+        query = collection.select(['address', 'geohash', 'location_level']).limit(page_size)
+        if last_snapshot is not None:
+            query = query.start_after(last_snapshot)
+        snapshots = list(query.stream())
+        if not snapshots:
+            break
+
+        batch = db.batch()
+        page_updated_count = 0
+        for snapshot in snapshots:
+            data = snapshot.to_dict() or {}
+            fields = location_fields(data.get('address'))
+            if any(data.get(key) != value for key, value in fields.items()):
+                batch.update(snapshot.reference, fields)
+                page_updated_count += 1
+        if page_updated_count:
+            batch.commit()
+
+        updated_count += page_updated_count
+        last_snapshot = snapshots[-1]
+        if len(snapshots) < page_size:
+            break
+    return updated_count
+
+
+if __name__ == "__main__":
+    from firebase_client import get_db
+
+    count = backfill_user_locations(get_db())
+    print(f"成功: {count}人のユーザーに位置（geohash / lat / lon / location_level）を追加しました")
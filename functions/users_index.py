@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+USERS_COLLECTION = 'users'
+
+
+class UsersIndex:
+    """
+    users コレクションのプロセス内インデックス
+
+    on_snapshot リスナーが動いている間は全ユーザーをメモリ上に保持し、変更をリアルタイムに反映する。
+    リスナーが使えない場合は、TTL と件数上限つきのキャッシュに必要なユーザーだけを get_all で読み込む。
+    """
+
+    def __init__(self, db, collection=USERS_COLLECTION, ttl_seconds=300, max_size=10000):
+        self._db = db
+        self._collection = collection
+        self._ttl_seconds = ttl_seconds
+        self._max_size = max_size
+
+        self._lock = threading.Lock()
+        # Full mirror of the collection, maintained by the listener
+        self._users = {}
+        self._listener_ready = False
+        self._watch = None
+        self._listener_started = False
+        # user_id -> (expires_at, user_data or None), used while the listener is unavailable
+        self._fallback = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _start_listener(self):
+        # Started lazily so that importing main.py does not open a stream
+        with self._lock:
+            if self._listener_started:
+                return
+            self._listener_started = True
+        try:
+            self._watch = self._db.collection(self._collection).on_snapshot(self._on_snapshot)
+        except Exception as e:
+            print(f"Users listener unavailable, using TTL cache: {str(e)}")
+            self._watch = None
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        with self._lock:
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    self._users.pop(change.document.id, None)
+                else:
+                    self._users[change.document.id] = change.document.to_dict()
+            self._listener_ready = True
+
+    def _listener_active(self):
+        if self._watch is None or not self._listener_ready:
+            return False
+        if not self._watch.is_active:
+            # The stream died; drop the stale mirror and fall back to the TTL cache
+            with self._lock:
+                self._watch = None
+                self._listener_ready = False
+                self._users = {}
+            return False
+        return True
+
+    def is_mirrored(self):
+        """
+        リスナーが全ユーザーをメモリ上に保持している（get_many が Firestore を読まない）場合に True
+        """
+        self._start_listener()
+        return self._listener_active()
+
+    def get_many(self, user_ids):
+        """
+        指定したユーザーIDのユーザーデータを {user_id: データ} の辞書で返す（存在しないIDは含まない）
+        """
+        self._start_listener()
+        user_ids = set(user_ids)
+
+        if self._listener_active():
+            with self._lock:
+                self.hits += len(user_ids)
+                return {
+                    user_id: self._users[user_id]
+                    for user_id in user_ids
+                    if user_id in self._users
+                }
+
+        return self._get_many_from_fallback(user_ids)
+
+    def _get_many_from_fallback(self, user_ids):
+        now = time.monotonic()
+        result = {}
+        missing = []
+
+        with self._lock:
+            for user_id in user_ids:
+                cached = self._fallback.get(user_id)
+                if cached is not None and cached[0] > now:
+                    self._fallback.move_to_end(user_id)
+                    self.hits += 1
+                    if cached[1] is not None:
+                        result[user_id] = cached[1]
+                else:
+                    self.misses += 1
+                    missing.append(user_id)
+
+        if not missing:
+            return result
+
+        collection = self._db.collection(self._collection)
+        snapshots = self._db.get_all([collection.document(user_id) for user_id in missing])
+        fetched = {
+            snapshot.id: snapshot.to_dict()
+            for snapshot in snapshots
+            if snapshot.exists
+        }
+
+        expires_at = now + self._ttl_seconds
+        with self._lock:
+            for user_id in missing:
+                # Unknown ids are cached too, so they do not cost a read on every poll
+                self._fallback[user_id] = (expires_at, fetched.get(user_id))
+                self._fallback.move_to_end(user_id)
+            while len(self._fallback) > self._max_size:
+                self._fallback.popitem(last=False)
+
+        result.update(fetched)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'listener_active': self._watch is not None and self._listener_ready,
+                'indexed_users': len(self._users),
+                'fallback_entries': len(self._fallback),
+            }
@@ -0,0 +1,84 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextvars import copy_context
+
+from safety_logs import MAX_RECORDS_PER_TRANSACTION, SAFETY_LOGS_COLLECTION, record_safety_responses
+
+
+class SafetyWriteCoalescer:
+    """
+    単一の安否報告の書き込みをまとめて1回のコミットで保存する
+
+    submit された報告は、max_batch_size 件に達するか max_delay 秒が経過するまで待ち合わせ、
+    record_safety_responses でまとめて書き込む。submit は書き込んだログIDを返す Future を返す。
+    まとめた書き込みが失敗した場合は1件ずつ書き込み直し、失敗した報告の Future だけを例外にする。
+    ログIDは submit 時に決めて書き込み直しでも同じIDを使うため、失敗したコミットが実際には反映されていても
+    ログが二重に保存されることはない。
+    """
+
+    def __init__(self, db, max_batch_size=MAX_RECORDS_PER_TRANSACTION, max_delay=0.005):
+        self._db = db
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='safety-write-coalescer', daemon=True)
+                self._thread.start()
+
+    def submit(self, record):
+        future = Future()
+        # Generated locally; every attempt writes the report under this id
+        log_id = self._db.collection(SAFETY_LOGS_COLLECTION).document().id
+        # The submitting request's context, so the commit is counted under its route
+        self._queue.put((record, log_id, future, copy_context()))
+        self._ensure_worker()
+        return future
+
+    def _collect_batch(self):
+        pending = [self._queue.get()]
+        deadline = time.monotonic() + self._max_delay
+        while len(pending) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _commit(self, pending):
+        # Runs in the first submitter's context; the other submitters are waiting on the same route
+        records = [record for record, _, _, _ in pending]
+        log_ids = [log_id for _, log_id, _, _ in pending]
+        pending[0][3].run(record_safety_responses, self._db, records, log_ids=log_ids)
+        for _, log_id, future, _ in pending:
+            future.set_result(log_id)
+
+    def _run(self):
+        while True:
+            pending = self._collect_batch()
+            try:
+                self._commit(pending)
+                continue
+            except Exception as e:
+                print(f"Error committing {len(pending)} coalesced safety reports: {str(e)}")
+                if len(pending) == 1:
+                    pending[0][2].set_exception(e)
+                    continue
+
+            # Retry one by one so that only the request with the bad report gets the error.
+            # The group may have been written even though the commit raised (e.g. a deadline);
+            # the same log ids make the retries overwrite it instead of adding copies
+            for item in pending:
+                try:
+                    self._commit([item])
+                except Exception as e:
+                    item[2].set_exception(e)